@@ -0,0 +1,43 @@
+"""
+Test structures for the benchmarks: the relaxed Au clusters of the
+example run, centred in a cubic box and slightly perturbed.
+"""
+
+from pathlib import Path
+
+import numpy as np
+from pymatgen.core import Lattice, Molecule
+
+example = Path(__file__).resolve().parents[1] / 'example_AuCluster'
+
+constraint = {
+    "composition": {"Au": 1.0},
+    "min_atom_pair_distance": 2,
+    "max_atom_pair_distance": 4,
+    "min_num_atoms": 1,
+    "max_num_atoms": 30,
+}
+
+lammps_pars = {
+    "pair_style": "pair_style eam",
+    "pair_coeff": f"pair_coeff * * {example / 'Au.eam'}",
+}
+
+
+def load_structures(box=40.0, noise=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    lattice = Lattice.cubic(box)
+    structures = []
+    for fpath in sorted((example / 'structures').glob('*.xyz')):
+        mol = Molecule.from_file(fpath)
+        pos = mol.cart_coords - mol.center_of_mass + 0.5 * box
+        pos += rng.normal(0.0, noise, pos.shape)
+        structures.append(
+            {
+                "lattice": lattice,
+                "parameters": (pos / box).flatten(),
+                "species": [site.specie.symbol for site in mol],
+                "constraint": constraint,
+            }
+        )
+    return structures
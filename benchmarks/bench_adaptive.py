@@ -0,0 +1,85 @@
+"""
+Wasted evaluations, i.e. candidates that fail or relax back into the
+minimum they were made from, best energy and evaluations needed to reach
+it of MCTS with the mutation
+operators at fixed settings against adaptive ones, starting from a too
+small, a default and a too large displacement length.
+
+    python benchmarks/bench_adaptive.py [natoms] [niterations] [nseeds]
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+from _structures import constraint, lammps_pars
+
+from CASTING import logger, optimizers
+from CASTING.clusterfun import createRandomData
+from CASTING.lammpsEvaluate import LammpsEvaluator
+from CASTING.operators import MutationOperators, names
+
+lattice = {}
+for k in 'abc':
+    lattice.update({f'min_{k}': 24.0, f'max_{k}': 24.0, f'pad_{k}': 0.0})
+for k in ('alpha', 'beta', 'gamma'):
+    lattice.update({f'min_{k}': 90.0, f'max_{k}': 90.0})
+probs = {f'prob_{name}': 0.0 for name in names}
+probs.update(prob_displace=0.5, prob_slicing=0.2, prob_crossover=0.3)
+
+
+def run(natoms, niterations, seed, operators):
+    random.seed(seed)
+    np.random.seed(seed)
+    C = {**constraint, "min_num_atoms": natoms, "max_num_atoms": natoms + 1}
+    root = createRandomData(lattice, C)
+    evaluator = LammpsEvaluator({**lammps_pars, 'batch': {}})
+    tree = optimizers.MCTS(
+        root,
+        operators.perturb,
+        evaluator.evaluate,
+        niterations=niterations,
+        a=0,
+        evaluate_batch=evaluator.evaluate_batch,
+        perturbate_batch=operators.perturb_many,
+        operators=operators,
+    )
+    n = sum(operators.evaluated.values())
+    wasted = n - sum(operators.accepted.values())
+    wasted += sum(operators.repeated.values())
+    score = tree.score[: len(tree)]
+    reached = np.argmax(score <= score.min() + 1e-3)
+    return wasted / n, reached, score.min()
+
+
+if __name__ == '__main__':
+    natoms = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    niterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    nseeds = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    logger.setLevel(logging.WARNING)
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+
+    print(f"{natoms} atoms, {niterations} iterations, {nseeds} seeds")
+    for step in (0.005, 0.05, 0.3):
+        for adaptive in (False, True):
+            rows = []
+            for seed in range(nseeds):
+                operators = MutationOperators(
+                    lattice,
+                    max_mutation=step,
+                    adaptive=adaptive,
+                    report_every=10**9,
+                    **probs,
+                )
+                rows.append(run(natoms, niterations, seed, operators))
+            wasted, reached, best = np.mean(rows, axis=0)
+            label = f"step {step}{', adaptive' if adaptive else ''}"
+            print(
+                f"  {label:>20}: {100 * wasted:5.1f}% wasted, best "
+                f"{best:.5f} eV/atom, within 1 meV/atom of it after "
+                f"{reached:.0f} evaluations"
+            )
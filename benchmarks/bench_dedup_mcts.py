@@ -0,0 +1,72 @@
+"""
+Evaluations, wall time and best energy of MCTS with and without merging
+expansions that relax into a known minimum, and the duplicate rate.
+
+    python benchmarks/bench_dedup_mcts.py [niterations]
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from _structures import constraint, lammps_pars
+
+from CASTING import logger, optimizers
+from CASTING.clusterfun import createRandomData
+from CASTING.lammpsEvaluate import LammpsEvaluator
+from CASTING.minima import MinimaIndex
+from CASTING.perturb import perturbate
+
+lattice = {}
+for k in 'abc':
+    lattice.update({f'min_{k}': 20.0, f'max_{k}': 20.0, f'pad_{k}': 0.0})
+for k in ('alpha', 'beta', 'gamma'):
+    lattice.update({f'min_{k}': 90.0, f'max_{k}': 90.0})
+search_constraint = {**constraint, "min_num_atoms": 8, "max_num_atoms": 14}
+
+
+def run(niterations, minima=None):
+    random.seed(12)
+    np.random.seed(12)
+    root = createRandomData(lattice, search_constraint)
+    evaluator = LammpsEvaluator({**lammps_pars, 'batch': {}})
+    t = time.perf_counter()
+    tree = optimizers.MCTS(
+        root,
+        perturbate(max_mutation=0.05).perturb,
+        evaluator.evaluate,
+        niterations=niterations,
+        a=0,
+        evaluate_batch=evaluator.evaluate_batch,
+        minima=minima,
+    )
+    return tree, time.perf_counter() - t
+
+
+def report(label, tree, wall, minima=None):
+    n = len(tree)
+    line = (
+        f"{label:>10}: {n:6d} evaluations {wall:7.1f} s, "
+        f"best {tree.score[:n].min():.5f} eV/atom"
+    )
+    if minima is not None:
+        line += (
+            f", {100 * minima.duplicate_rate:.0f}% of {minima.nexpansions} "
+            f"expansions merged, {minima.nsaved} evaluations saved"
+        )
+    print(line)
+
+
+if __name__ == '__main__':
+    niterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    logger.setLevel(logging.WARNING)
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+
+    report('all', *run(niterations))
+    minima = MinimaIndex(report_every=10**9)
+    report('dedup', *run(niterations, minima), minima)
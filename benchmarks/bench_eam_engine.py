@@ -0,0 +1,57 @@
+"""
+Energies and time per structure of the NumPy EAM evaluator, with the FIRE
+and L-BFGS minimizers, against the LAMMPS evaluator on perturbed example
+clusters.
+
+    python benchmarks/bench_eam_engine.py [noise]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from _structures import example, lammps_pars, load_structures
+
+from CASTING import logger
+from CASTING.aseEamEvaluate import AseEamEvaluator
+from CASTING.lammpsEvaluate import LammpsEvaluator
+
+
+def bench(evaluator, structures):
+    t = time.perf_counter()
+    energies = np.array([evaluator.evaluate(s)[1] for s in structures])
+    return (time.perf_counter() - t) / len(structures), energies
+
+
+if __name__ == '__main__':
+    noise = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+    logger.setLevel(logging.WARNING)
+    structures = [
+        s
+        for seed in range(3)
+        for s in load_structures(noise=noise, seed=seed)
+    ]
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+
+    t = time.perf_counter()
+    AseEamEvaluator({'potential': example / 'Au.eam'})
+    print(f"potential parsed in {1e3 * (time.perf_counter() - t):.1f} ms")
+
+    dt0, e0 = bench(LammpsEvaluator(lammps_pars), structures)
+    ok = e0 < 1e300
+    print(f"{len(structures)} structures, noise {noise} Angstrom")
+    print(f"  {'LAMMPS':>12}: {1e3 * dt0:8.2f} ms/structure")
+    for minimizer in ('fire', 'lbfgs'):
+        pars = {'potential': example / 'Au.eam', 'minimizer': minimizer}
+        dt, e = bench(AseEamEvaluator(pars), structures)
+        diff = e[ok] - e0[ok]
+        print(
+            f"  {minimizer:>12}: {1e3 * dt:8.2f} ms/structure, "
+            f"|E - E_LAMMPS| median {np.median(np.abs(diff)):.1e} eV/atom, "
+            f"in a lower/higher minimum: "
+            f"{np.sum(diff < -1e-3)}/{np.sum(diff > 1e-3)}"
+        )
@@ -0,0 +1,55 @@
+"""
+Evaluations per second of LammpsEvaluator.evaluate_batch, one structure
+per simulation against batches minimized together in one simulation, on
+perturbed example clusters, and how many structures end up in a different
+minimum.
+
+    python benchmarks/bench_lammps_batch.py [size ...]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from _structures import lammps_pars, load_structures
+
+from CASTING import logger
+from CASTING.lammpsEvaluate import LammpsEvaluator
+
+
+def bench(pars, structures):
+    evaluator = LammpsEvaluator(pars)
+    t = time.perf_counter()
+    energies = np.array([r[1] for r in evaluator.evaluate_batch(structures)])
+    return len(structures) / (time.perf_counter() - t), energies
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [4, 16, 64]
+    logger.setLevel(logging.WARNING)
+    structures = [
+        s
+        for seed in range(5)
+        for s in load_structures(noise=0.1, seed=seed)
+    ]
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+
+    rate0, e0 = bench(lammps_pars, structures)
+    ok = e0 < 1e300
+    print(f"{len(structures)} structures")
+    print(f"  {'one by one':>16}: {rate0:7.1f} /s")
+    for size in sizes:
+        pars = {**lammps_pars, 'batch': {'size': size}}
+        rate, e = bench(pars, structures)
+        diff = e[ok] - e0[ok]
+        print(
+            f"  {f'batches of {size}':>16}: {rate:7.1f} /s, "
+            f"failed {np.sum(e >= 1e300)} (one by one {np.sum(~ok)}), "
+            f"in a lower/higher minimum: "
+            f"{np.sum(diff < -1e-3)}/{np.sum(diff > 1e-3)}, "
+            f"|E - E_single| median {np.median(np.abs(diff)):.1e} eV/atom"
+        )
@@ -0,0 +1,38 @@
+"""
+Per-evaluation latency of LammpsEvaluator with atoms passed through data
+files or the library interface, and with a cold or warm setup.
+
+    python benchmarks/bench_lammps_evaluator.py
+"""
+
+import os
+import tempfile
+import time
+
+from _structures import lammps_pars, load_structures
+
+from CASTING.lammpsEvaluate import LammpsEvaluator
+
+
+def bench(pars, structures, repeat=3):
+    evaluator = LammpsEvaluator(pars)
+    evaluator.evaluate(structures[0])  # warm-up
+    t = time.perf_counter()
+    for _ in range(repeat):
+        for structData in structures:
+            evaluator.evaluate(structData)
+    return (time.perf_counter() - t) / (repeat * len(structures))
+
+
+if __name__ == '__main__':
+    structures = load_structures()
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+    for transfer, setup in [
+        ('file', 'cold'),
+        ('memory', 'cold'),
+        ('memory', 'warm'),
+    ]:
+        pars = {**lammps_pars, 'data_transfer': transfer, 'setup': setup}
+        dt = bench(pars, structures)
+        print(f"{transfer:>8} {setup}: {1e3 * dt:8.2f} ms/evaluation")
@@ -0,0 +1,79 @@
+"""
+Best energy reached by MCTS with displacements only against the mutation
+operators, on clusters of a fixed number of atoms (so that adding and
+deleting atoms do not apply), and the statistics of each operator.
+
+    python benchmarks/bench_operators.py [natoms] [niterations] [nseeds]
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from _structures import constraint, lammps_pars
+
+from CASTING import logger, optimizers
+from CASTING.clusterfun import createRandomData
+from CASTING.lammpsEvaluate import LammpsEvaluator
+from CASTING.operators import MutationOperators, names
+from CASTING.perturb import perturbate
+
+lattice = {}
+for k in 'abc':
+    lattice.update({f'min_{k}': 24.0, f'max_{k}': 24.0, f'pad_{k}': 0.0})
+for k in ('alpha', 'beta', 'gamma'):
+    lattice.update({f'min_{k}': 90.0, f'max_{k}': 90.0})
+probs = {f'prob_{name}': 0.0 for name in names}
+probs.update(prob_displace=0.5, prob_slicing=0.2, prob_crossover=0.3)
+
+
+def run(natoms, niterations, seed, operators=None):
+    random.seed(seed)
+    np.random.seed(seed)
+    C = {**constraint, "min_num_atoms": natoms, "max_num_atoms": natoms + 1}
+    root = createRandomData(lattice, C)
+    perturber = operators or perturbate(max_mutation=0.05)
+    evaluator = LammpsEvaluator({**lammps_pars, 'batch': {}})
+    t = time.perf_counter()
+    tree = optimizers.MCTS(
+        root,
+        perturber.perturb,
+        evaluator.evaluate,
+        niterations=niterations,
+        a=0,
+        evaluate_batch=evaluator.evaluate_batch,
+        perturbate_batch=perturber.perturb_many,
+        operators=operators,
+    )
+    return tree.score[: len(tree)].min(), len(tree), time.perf_counter() - t
+
+
+if __name__ == '__main__':
+    natoms = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    niterations = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    nseeds = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    logger.setLevel(logging.WARNING)
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+
+    print(f"{natoms} atoms, {niterations} iterations")
+    for seed in range(nseeds):
+        e0, n0, t0 = run(natoms, niterations, seed)
+        operators = MutationOperators(lattice, report_every=10**9, **probs)
+        e1, n1, t1 = run(natoms, niterations, seed, operators)
+        print(
+            f"  seed {seed}: displacement {e0:.5f} eV/atom ({n0} in "
+            f"{t0:.1f} s), operators {e1:.5f} eV/atom ({n1} in {t1:.1f} s)"
+        )
+        for name in names:
+            n = operators.evaluated[name]
+            if n:
+                print(
+                    f"    {name:>10}: {n:4d} evaluated, "
+                    f"{100 * operators.accepted[name] / n:5.1f}% accepted, "
+                    f"{100 * operators.improved[name] / n:5.1f}% improved"
+                )
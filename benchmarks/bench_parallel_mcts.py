@@ -0,0 +1,112 @@
+"""
+Throughput and best energy against wall time of the serial MCTS, MCTS with
+batches evaluated in a process pool, and the tree parallel ParallelMCTS.
+
+    python benchmarks/bench_parallel_mcts.py [num_workers] [niterations]
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from _structures import constraint, lammps_pars
+
+from CASTING import logger, optimizers
+from CASTING.clusterfun import createRandomData
+from CASTING.lammpsEvaluate import LammpsEvaluator
+from CASTING.parallel import PoolEvaluator
+from CASTING.perturb import perturbate
+
+lattice = {}
+for k in 'abc':
+    lattice.update({f'min_{k}': 20.0, f'max_{k}': 20.0, f'pad_{k}': 0.0})
+for k in ('alpha', 'beta', 'gamma'):
+    lattice.update({f'min_{k}': 90.0, f'max_{k}': 90.0})
+search_constraint = {**constraint, "min_num_atoms": 8, "max_num_atoms": 14}
+
+
+class Recorder(object):
+    """Records (time, score) of every result of an evaluator."""
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.t0 = time.perf_counter()
+        self.lock = threading.Lock()
+        self.trace = []
+
+    def record(self, result):
+        with self.lock:
+            self.trace.append((time.perf_counter() - self.t0, result[1]))
+        return result
+
+    def evaluate(self, structData):
+        return self.record(self.evaluator.evaluate(structData))
+
+    def evaluate_batch(self, structDatas):
+        return [
+            self.record(r) for r in self.evaluator.evaluate_batch(structDatas)
+        ]
+
+    def submit(self, structData):
+        future = self.evaluator.submit(structData)
+        future.add_done_callback(lambda f: self.record(f.result()))
+        return future
+
+
+def run(name, evaluator, niterations, **kwargs):
+    random.seed(12)
+    np.random.seed(12)
+    root = createRandomData(lattice, search_constraint)
+    recorder = Recorder(evaluator)
+    if hasattr(evaluator, 'evaluate_batch'):
+        kwargs['evaluate_batch'] = recorder.evaluate_batch
+    if name == 'ParallelMCTS':
+        kwargs['submit'] = recorder.submit
+    optimizer = getattr(optimizers, name)
+    optimizer(
+        root,
+        perturbate(max_mutation=0.05).perturb,
+        recorder.evaluate,
+        niterations=niterations,
+        a=0,
+        **kwargs,
+    )
+    return np.array(recorder.trace)
+
+
+def report(label, trace):
+    times, scores = trace[:, 0], np.minimum.accumulate(trace[:, 1])
+    wall = times[-1]
+    checkpoints = ' '.join(
+        f"{scores[times <= f * wall][-1]:.5f}" for f in (0.25, 0.5, 1.0)
+    )
+    print(
+        f"{label:>28}: {len(trace):6d} evaluations {wall:7.1f} s "
+        f"{len(trace) / wall:7.2f} /s   best at 25/50/100%: {checkpoints}"
+    )
+
+
+if __name__ == '__main__':
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    niterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    logger.setLevel(logging.WARNING)
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+
+    report('serial MCTS', run('MCTS', LammpsEvaluator(lammps_pars), niterations))
+
+    args = ('CASTING.lammpsEvaluate', 'LammpsEvaluator', lammps_pars)
+    pool = PoolEvaluator(*args, num_workers)
+    trace = run('MCTS', pool, niterations)
+    report(f'MCTS, pool of {num_workers}', trace)
+
+    trace = run(
+        'ParallelMCTS', pool, niterations, nparallel=num_workers // 11 + 2
+    )
+    report(f'ParallelMCTS, pool of {num_workers}', trace)
+    pool.close()
@@ -0,0 +1,38 @@
+"""
+Time to draw the playout candidates of a node with one perturbate.perturb
+call per candidate against one perturb_batch call, on the example
+clusters.
+
+    python benchmarks/bench_perturb_batch.py [n ...]
+"""
+
+import sys
+import timeit
+
+from _structures import load_structures
+
+from CASTING.perturb import perturbate, perturbed_structures
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 30, 300]
+    pt = perturbate(max_mutation=0.05, seed=0)
+    structures = load_structures()
+    natoms = [len(s['species']) for s in structures]
+    print(f"{len(structures)} structures of {min(natoms)}-{max(natoms)} atoms")
+    for n in sizes:
+
+        def single():
+            for s in structures:
+                [pt.perturb(s, depth=3, a=3, maxdepth=12) for _ in range(n)]
+
+        def batch():
+            for s in structures:
+                X = pt.perturb_batch(s, n, depth=3, a=3, maxdepth=12)
+                perturbed_structures(s, X)
+
+        t1 = min(timeit.repeat(single, number=1, repeat=5)) / len(structures)
+        t2 = min(timeit.repeat(batch, number=1, repeat=5)) / len(structures)
+        print(
+            f"  n={n:4d}: perturb {1e3 * t1:7.3f} ms, perturb_batch "
+            f"{1e3 * t2:7.3f} ms per node ({t1 / t2:.1f}x)"
+        )
@@ -0,0 +1,69 @@
+"""
+Cost of recording results in the ResultsStore against one XYZ file and
+one dumpfile.dat line per structure, and time to get the lowest energy
+structures out of a large store.
+
+    python benchmarks/bench_results_store.py [nrecords]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+from hashlib import sha256 as hashfunc
+
+import numpy as np
+from _structures import load_structures
+from pymatgen.io.xyz import XYZ
+
+from CASTING import logger
+from CASTING.clusterfun import parm2struc
+from CASTING.results import ResultsStore
+
+
+def old_output(structData, energy):
+    minstruct = parm2struc(structData)
+    ID = hashfunc(str(minstruct.as_dict()).encode()).hexdigest()[:6]
+    XYZ(minstruct).write_file(f'structures/{ID}.xyz')
+    open('dumpfile.dat', 'a').write(f"{time.time()} {ID} {energy}\n")
+
+
+if __name__ == '__main__':
+    nrecords = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logger.setLevel(logging.WARNING)
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+    rng = np.random.default_rng(0)
+    structures = []
+    for seed in range(20):
+        structures += load_structures(noise=0.1, seed=seed)
+    energies = rng.uniform(-3.2, -2.5, len(structures))
+
+    t = time.perf_counter()
+    for s, e in zip(structures, energies):
+        old_output(s, e)
+    dt0 = (time.perf_counter() - t) / len(structures)
+
+    store = ResultsStore('results.db')
+    t = time.perf_counter()
+    for s, e in zip(structures, energies):
+        store.add(s, e)
+    store.flush()
+    dt1 = (time.perf_counter() - t) / len(structures)
+    print(f"per structure: XYZ + dumpfile {1e3 * dt0:.3f} ms, "
+          f"store {1e3 * dt1:.3f} ms")
+
+    for i in range(nrecords // len(structures)):
+        for s, e in zip(structures, rng.uniform(-3.2, -2.5, len(structures))):
+            store.add(s, e)
+    store.flush()
+    t = time.perf_counter()
+    top = list(store.lowest(100))
+    dt = time.perf_counter() - t
+    print(f"lowest 100 of {len(store)} records: {1e3 * dt:.1f} ms")
+    t = time.perf_counter()
+    dup = store.duplicates(top[0][3])
+    dt = time.perf_counter() - t
+    print(f"duplicates of one structure ({len(dup)}): {1e3 * dt:.2f} ms")
+    print(f"store size {os.path.getsize('results.db') / 2**20:.1f} MiB")
@@ -0,0 +1,119 @@
+"""
+Time of one MCTS selection step against tree size, for the incremental
+subtree-best selection and the original lineage rescan.
+
+    python benchmarks/bench_selection.py
+"""
+
+import random
+import sys
+import time
+from math import log
+
+import numpy as np
+
+from pymatgen.core import Lattice
+
+from CASTING.tree import MCTSTree
+
+sys.setrecursionlimit(100000)
+
+
+def rescan_selection(
+    visits, childlist, parent, depthlist, playoutdata, Scorelist, maxdepth
+):
+    """Selection as it was before subtree-best bookkeeping."""
+
+    def get_linegae(node, childlist):
+        total_list = []
+        try:
+            total_list += childlist[node]
+        except KeyError:
+            return total_list
+        for child in childlist[node]:
+            total_list += get_linegae(child, childlist)
+        return total_list
+
+    selectionScores = []
+    nodes = list(parent.keys())
+    for n in nodes:
+        par = parent[n]
+        if par is None or depthlist[n] > maxdepth:
+            selectionScores.append(-1e300)
+        else:
+            lineage = get_linegae(n, childlist)
+            allindexes = []
+            for l in [n] + lineage:
+                allindexes += playoutdata[l]
+            bestreward = min([Scorelist[i] for i in lineage + allindexes])
+            selectionScores.append(
+                -bestreward + np.sqrt(log(visits[par]) / visits[n])
+            )
+    c = sorted(zip(selectionScores, nodes), key=lambda x: -x[0])
+    return c[0][1]
+
+
+def grow_tree(nnodes, nplayouts=10, maxdepth=12, seed=0):
+    """Random tree grown the way MCTS grows it."""
+    rng = random.Random(seed)
+    data = {
+        "lattice": Lattice.cubic(20.0),
+        "parameters": np.zeros(3),
+        "species": ["Au"],
+        "constraint": {},
+    }
+    tree = MCTSTree()
+
+    def add_node(par):
+        node = tree.add_node(data, rng.random(), parent=par)
+        for _ in range(nplayouts):
+            tree.add_playout(node, data, rng.random())
+        tree.backpropagate(node)
+        return node
+
+    nodes = [add_node(None)]
+    while len(nodes) < nnodes:
+        par = rng.choice(nodes)
+        if tree.depth[par] >= maxdepth:
+            continue
+        tree.visits[par] += 1
+        nodes.append(add_node(par))
+    return tree
+
+
+def as_dicts(tree):
+    """Tree in the dict/list form the rescan works on."""
+    nodes = [int(n) for n in tree.get_nodes()]
+    parent = {
+        n: (None if tree.parent[n] < 0 else int(tree.parent[n])) for n in nodes
+    }
+    childlist = {n: [int(c) for c in tree.children(n)] for n in nodes}
+    return (
+        {n: int(tree.visits[n]) for n in nodes},
+        childlist,
+        parent,
+        {n: int(tree.depth[n]) for n in nodes},
+        {n: [int(i) for i in tree.playouts(n)] for n in nodes},
+        tree.score[: len(tree)].tolist(),
+    )
+
+
+if __name__ == '__main__':
+    maxdepth = 12
+    for nnodes in [100, 1000, 3000, 6000]:
+        tree = grow_tree(nnodes, maxdepth=maxdepth)
+
+        t = time.perf_counter()
+        new = tree.select(maxdepth)
+        t_new = time.perf_counter() - t
+
+        dicts = as_dicts(tree)
+        t = time.perf_counter()
+        old = rescan_selection(*dicts, maxdepth)
+        t_old = time.perf_counter() - t
+
+        assert new == old, (new, old)
+        print(
+            f"{nnodes:6d} nodes: incremental {1e3 * t_new:9.3f} ms, "
+            f"rescan {1e3 * t_old:9.3f} ms"
+        )
@@ -0,0 +1,55 @@
+"""
+Time per structure and energies found with and without the staged
+evaluation of LammpsEvaluator, on perturbed example clusters. The
+coarse and tight minimization may end in a different minimum than one
+tight minimization, so a few structures also score better.
+
+    python benchmarks/bench_staged_evaluation.py [window]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from _structures import lammps_pars, load_structures
+
+from CASTING import logger
+from CASTING.lammpsEvaluate import LammpsEvaluator
+
+
+def bench(pars, structures):
+    evaluator = LammpsEvaluator(pars)
+    t = time.perf_counter()
+    energies = np.array([evaluator.evaluate(s)[1] for s in structures])
+    dt = (time.perf_counter() - t) / len(structures)
+    return dt, energies, evaluator.stages
+
+
+if __name__ == '__main__':
+    window = float(sys.argv[1]) if len(sys.argv) > 1 else 0.25
+    logger.setLevel(logging.WARNING)
+    structures = [
+        s
+        for seed in range(5)
+        for s in load_structures(noise=0.3, seed=seed)
+    ]
+    np.random.default_rng(0).shuffle(structures)
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+
+    dt0, e0, _ = bench(lammps_pars, structures)
+    staged = {**lammps_pars, 'staged': {'window': window}}
+    dt1, e1, stages = bench(staged, structures)
+
+    ok = e0 < 1e300
+    print(f"{len(structures)} structures, window {window} eV/atom")
+    print(f"  full:   {1e3 * dt0:8.2f} ms/structure, best {e0.min():.6f}")
+    print(f"  staged: {1e3 * dt1:8.2f} ms/structure, best {e1.min():.6f}")
+    print(f"  stages: {stages}")
+    print(
+        f"  scored worse than when fully minimized: "
+        f"{np.sum(e1[ok] > e0[ok] + 1e-3)} of {ok.sum()}"
+    )
@@ -0,0 +1,69 @@
+"""
+Time and peak Python memory of exporting the lowest energy structures of
+a large results store with StructureWriter, against the previous approach
+of loading every record, sorting them all and writing the files one by
+one, reopening the objective file for each.
+
+    python benchmarks/bench_structure_writer.py [nrecords] [num_to_write]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from _structures import load_structures
+from pymatgen.io.vasp import Poscar
+
+from CASTING import logger
+from CASTING.clusterfun import parm2struc
+from CASTING.results import ResultsStore
+from CASTING.writer import StructureWriter
+
+
+def old_write(resultsfile, num_to_write, outpath, objfile):
+    store = ResultsStore(resultsfile)
+    structurelist = [
+        [energy, structData] for _, _, energy, structData in store.lowest()
+    ]
+    structurelist.sort(key=lambda x: x[0])
+    os.makedirs(outpath, exist_ok=True)
+    for i, (energy, structData) in enumerate(structurelist[:num_to_write]):
+        with open(objfile, "a") as outfile:
+            outfile.write("{} {}\n".format(i, energy))
+        Poscar(parm2struc(structData)).write_file(f"{outpath}/{i}.POSCAR")
+    store.close()
+
+
+def measure(f, *args):
+    tracemalloc.start()
+    t = time.perf_counter()
+    f(*args)
+    dt = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dt, peak
+
+
+if __name__ == '__main__':
+    nrecords = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    num_to_write = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    logger.setLevel(logging.WARNING)
+    os.chdir(tempfile.mkdtemp())
+    rng = np.random.default_rng(0)
+    structures = load_structures(noise=0.1)
+    store = ResultsStore('results.db', buffer=10000)
+    for i in range(nrecords // len(structures) + 1):
+        for s, e in zip(structures, rng.uniform(-3.2, -2.5, len(structures))):
+            store.add(s, e)
+    store.close()
+
+    dt0, mem0 = measure(old_write, 'results.db', num_to_write, 'old', 'old.dat')
+    writer = StructureWriter('results.db', outpath='new', objfile='new.dat')
+    dt1, mem1 = measure(writer.write, num_to_write)
+    print(f"lowest {num_to_write} of {nrecords} records")
+    print(f"  load all and sort: {dt0:6.2f} s, peak {mem0 / 2**20:7.1f} MiB")
+    print(f"  StructureWriter:   {dt1:6.2f} s, peak {mem1 / 2**20:7.1f} MiB")
@@ -0,0 +1,62 @@
+"""
+Ranking quality of the surrogate pre-screen: trained online on the
+relaxed energies of perturbed example clusters, it predicts the energies
+of held out ones, and the fraction of the best third found by keeping the
+third with the lowest prediction is compared to a random pick.
+
+    python benchmarks/bench_surrogate.py [noise]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from _structures import lammps_pars, load_structures
+from scipy.stats import spearmanr
+
+from CASTING import logger
+from CASTING.lammpsEvaluate import LammpsEvaluator
+from CASTING.surrogate import SurrogatePrescreen
+
+if __name__ == '__main__':
+    noise = float(sys.argv[1]) if len(sys.argv) > 1 else 0.3
+    logger.setLevel(logging.WARNING)
+    structures = [
+        s
+        for seed in range(10)
+        for s in load_structures(noise=noise, seed=seed)
+    ]
+    np.random.default_rng(0).shuffle(structures)
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('structures')
+
+    evaluator = LammpsEvaluator(lammps_pars)
+    results = [evaluator.evaluate(s) for s in structures]
+    ok = [i for i, r in enumerate(results) if r[1] < 1e300]
+    ntrain = len(ok) // 2
+    train, test = ok[:ntrain], ok[ntrain:]
+
+    surrogate = SurrogatePrescreen(min_samples=1, refit_every=1)
+    surrogate.update(
+        [structures[i] for i in train], [results[i] for i in train]
+    )
+    t = time.perf_counter()
+    X = np.array([surrogate.features(structures[i]) for i in test])
+    dt = (time.perf_counter() - t) / len(test)
+    prediction = X @ surrogate.weights
+    energy = np.array([results[i][1] for i in test])
+
+    n = len(test) // 3
+    best = set(np.argsort(energy)[:n])
+    picked = set(np.argsort(prediction)[:n])
+    print(f"{len(train)} training, {len(test)} test structures, noise {noise}")
+    print(f"  features: {1e3 * dt:.3f} ms/structure")
+    print(f"  Spearman rank correlation: {spearmanr(prediction, energy)[0]:.3f}")
+    print(f"  MAE: {np.mean(np.abs(prediction - energy)):.4f} eV/atom")
+    print(
+        f"  best third kept by the lowest predicted third: "
+        f"{len(best & picked)}/{n} (random pick: {n / 3:.1f})"
+    )
@@ -0,0 +1,71 @@
+"""
+Memory held by the search tree per 10k nodes (each with 10 playouts of a
+13-atom cluster), for the former dicts/lists and for MCTSTree.
+
+    python benchmarks/bench_tree_memory.py
+"""
+
+import tracemalloc
+
+import numpy as np
+from pymatgen.core import Lattice
+
+from CASTING.tree import MCTSTree
+
+nnodes, nplayouts, natoms = 10000, 10, 13
+constraint = {"composition": {"Au": 1.0}}
+
+
+def structure(lattice):
+    return {
+        "lattice": lattice,
+        "parameters": np.random.random(3 * natoms),
+        "species": ["Au"] * natoms,
+        "constraint": constraint,
+    }
+
+
+def build_dicts():
+    lattice = Lattice.cubic(20.0)
+    visits, childlist, parent = {}, {}, {}
+    depthlist, playoutdata = {}, {}
+    Scorelist, parameterlist = [], []
+    for n in range(nnodes):
+        idx = len(Scorelist)
+        visits[idx] = 1
+        childlist[idx] = []
+        parent[idx] = None if n == 0 else 0
+        depthlist[idx] = 1
+        playoutdata[idx] = []
+        Scorelist.append(-1.0)
+        parameterlist.append(structure(lattice))
+        for _ in range(nplayouts):
+            # relaxed structures came back with their own lattice
+            Scorelist.append(-1.0)
+            parameterlist.append(structure(Lattice(lattice.matrix)))
+            playoutdata[idx].append(len(Scorelist) - 1)
+    return visits, childlist, parent, depthlist, playoutdata, Scorelist, parameterlist
+
+
+def build_tree():
+    lattice = Lattice.cubic(20.0)
+    tree = MCTSTree()
+    for n in range(nnodes):
+        node = tree.add_node(structure(lattice), -1.0, None if n == 0 else 0)
+        for _ in range(nplayouts):
+            tree.add_playout(node, structure(Lattice(lattice.matrix)), -1.0)
+    return tree
+
+
+def measure(build):
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return current
+
+
+if __name__ == '__main__':
+    for name, build in [('dicts/lists', build_dicts), ('MCTSTree', build_tree)]:
+        print(f"{name:>12}: {measure(build) / 2**20:8.1f} MiB per 10k nodes")
@@ -61,9 +61,7 @@ MCTS(
     perturb,
     evaluator,
     niterations=2000,
-    headexpand=10,
     nexpand=3,
-    nsimulate=3,
     nplayouts=10,
     exploreconstant=1,
     maxdepth=12,
@@ -3,12 +3,12 @@ from CASTING.writer import StructureWriter
 num_to_write = 10  # number of stuctures to extract
 
 writer = StructureWriter(
-    "dumpfile.dat",
+    "results.db",
     outpath="structures",
     objfile="energy.dat",
     file_format="poscar",
-)  # "poscar" or "cif"
+)  # "poscar", "cif" or "xyz"
 
 writer.write(
-    num_to_write, sort=True
-)  # sort to arrange in increasing order of energy
+    num_to_write, unique=True
+)  # skip duplicates of a lower energy structure
@@ -1,4 +1,5 @@
 import json
+import sys
 
 import typer
 
@@ -22,9 +23,33 @@ def run(conf: dict):
         raise SystemExit
 
 
-def main(inputsfile: str):
-    run(load_inputs(inputsfile))
+def main(
+    inputsfile: str,
+    resume: bool = typer.Option(
+        False, help="Continue the search from its checkpoint file."
+    ),
+):
+    conf = load_inputs(inputsfile)
+    conf['resume'] = resume
+    run(conf)
+
+
+def worker(
+    spool: str,
+    name: str = typer.Option(None, help="Worker name, defaults to host-pid."),
+    idle_timeout: float = typer.Option(
+        None, help="Exit after this many seconds without a task."
+    ),
+):
+    """Evaluate the structures queued in a spool directory."""
+    from .distributed import Worker
+
+    Worker(spool, name=name, idle_timeout=idle_timeout).run()
 
 
 if __name__ == '__main__':
-    typer.run(main)
+    if sys.argv[1:2] == ['worker']:
+        del sys.argv[1]
+        typer.run(worker)
+    else:
+        typer.run(main)
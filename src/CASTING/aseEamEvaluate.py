@@ -1,75 +1,78 @@
-from ase import Atoms
-from ase.calculators.eam import EAM
-from ase.optimize import BFGS
-from mendeleev import element
-from pymatgen.core import Lattice, Structure
-from pymatgen.core.periodic_table import Element
-from pymatgen.io.ase import AseAtomsAdaptor
+import math
 
-from CASTING.clusterfun import check_constrains, parm2struc, struc2param
+import numpy as np
 
+from CASTING.clusterfun import check_constrains, get_coords
+from CASTING.eam import EAMPotential, NeighborList, minimizers
 
-def structure_to_cell(structure):
-    lattice = structure.lattice.matrix.tolist()
-    positions = [list(site.coords) for site in structure.sites]
-    numbers = [Element(site.specie.symbol).Z for site in structure.sites]
-    return (lattice, positions, numbers)
-
-
-def cell_to_structure(cell):
-    (lattice, positions, numbers) = cell
-    return Structure(
-        Lattice(lattice),
-        [element(int(num)).symbol for num in numbers],
-        positions,
-    )
-
-
-def structure_to_Ase(structure):
-    (lattice, positions, numbers) = structure_to_cell(structure)
-
-    return Atoms(numbers, positions=positions, cell=lattice, pbc=[0, 0, 0])
+from . import logger
 
 
 class AseEamEvaluator:
-    def __init__(
-        self,
-        constrains,
-        par_file,
-    ):
-        self.constrains = constrains
-        self.par_file = par_file
+    """
+    Performs energy evaluations with the NumPy EAM engine, for machines
+    without LAMMPS. Same conventions as LammpsEvaluator: the box is not
+    periodic, atoms leaving it are lost and the energy is per atom.
+    """
+
+    def __init__(self, pars):
+        """
+        :pars: 'potential' is the EAM potential file (required), 'form'
+            either 'eam' (funcfl) or 'alloy' (setfl), guessed from the file
+            extension by default. 'minimizer' is 'lbfgs' (default) or
+            'fire', 'fmax' the force tolerance (eV/Angstrom, default
+            1e-3) and 'max_steps' the step limit (default 10000).
+        """
+        self.pars = pars
+        self.potential = EAMPotential(pars['potential'], pars.get('form'))
+        name = pars.get('minimizer', 'lbfgs')
+        if name not in minimizers:
+            raise ValueError(f"Unknown minimizer '{name}'.")
+        self.minimizer = minimizers[name]
+        self.fmax = pars.get('fmax', 1e-3)
+        self.max_steps = pars.get('max_steps', 10000)
 
     def evaluate(self, structData):
-        if not check_constrains(structData, self.constrains, verbose=False):
+        if not check_constrains(structData):
             return structData, 1e300
 
-        struct = parm2struc(structData, self.constrains)
+        M = structData['lattice'].matrix
+        x0 = (get_coords(structData['parameters']) % 1.0) @ M
+        types = self.potential.types(structData['species'])
+        neighbors = NeighborList(self.potential.cutoff)
 
-        calc = EAM(
-            potential=self.par_file,
-            elements=["Au"],
-            Z=[79],
-            lattice=["fcc"],
-            mass=[196.966570],
-            a=[11.999000],
-            form="eam",
-        )
+        def fun(x):
+            x = x.reshape(-1, 3)
+            energy, forces = self.potential.energy_forces(
+                x, types, neighbors.pairs(x)
+            )
+            return energy, -forces.flatten()
 
-        atoms = structure_to_Ase(struct)
-        atoms.calc = calc
-        mininimizer = BFGS(atoms, maxstep=0.2, logfile=None)
-        mininimizer.run(fmax=0.001, steps=200)
-        atoms.set_constraint()
+        # ------------guard for bad structures---------
 
-        minstruct = AseAtomsAdaptor.get_structure(atoms)
+        energy, _ = fun(x0.flatten())
+        if not math.isfinite(energy):
+            return structData, 1e300
+        # ---------------------------------------------
 
-        minData, mineng = struc2param(
-            minstruct,
-            atoms.get_potential_energy(),
-            self.constrains,
-            CheckFrConstrains=True,
-            writefile="dumpfile.dat",
+        x, energy, _ = self.minimizer(
+            fun, x0.flatten(), fmax=self.fmax, max_steps=self.max_steps
         )
+        frac = x.reshape(-1, 3) @ np.linalg.inv(M)
+        energy /= len(frac)
+
+        # atoms out of the box are lost, as in LAMMPS
+        if not math.isfinite(energy) or np.any((frac < 0) | (frac >= 1)):
+            return structData, 1e300
 
-        return minData, mineng
+        minData = {
+            "lattice": structData['lattice'],
+            "parameters": frac.flatten(),
+            "species": structData['species'].copy(),
+            "constraint": structData['constraint'],
+        }
+        if not check_constrains(minData):
+            logger.info('Minimized structure failed constraints, skipped.')
+            return minData, 1e300
+
+        return minData, energy
@@ -0,0 +1,266 @@
+"""
+Cache of evaluated structures, so that duplicate structures are not
+minimized again.
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from hashlib import sha256 as hashfunc
+
+import numpy as np
+
+from CASTING.clusterfun import check_constrains, get_coords, is_screened
+from CASTING.utilis import DistanceMatrix
+
+from . import logger
+
+
+def fingerprint(structData, tolerance=0.01):
+    """
+    Key of a structure that does not change under translation, rotation or
+    permutation of the atoms: the sorted pair distances of every pair of
+    species, rounded to tolerance (in Angstrom).
+    """
+    species = np.array(structData['species'])
+    coords = get_coords(np.asarray(structData['parameters']))
+    D = DistanceMatrix(coords, structData['lattice'].matrix)
+    D = np.rint(D / tolerance).astype(np.int64)
+
+    h = hashfunc()
+    for i, sp1 in enumerate(sorted(set(species))):
+        for sp2 in sorted(set(species))[i:]:
+            m1, m2 = species == sp1, species == sp2
+            d = D[m1][:, m2]
+            d = d[np.triu_indices_from(d, k=1)] if sp1 == sp2 else d.ravel()
+            h.update(f"{sp1}{m1.sum()}-{sp2}{m2.sum()}:".encode())
+            h.update(np.sort(d).tobytes())
+    return h.hexdigest()
+
+
+def cartesian_coords(structData):
+    x = get_coords(np.asarray(structData['parameters']))
+    return x @ structData['lattice'].matrix
+
+
+class EvaluationCache(object):
+    """
+    Bounded LRU cache of (energy, species, relaxed coordinates) by
+    fingerprint, optionally backed by an SQLite file that can be shared by
+    runs of the same system and potential. New entries are written to the
+    file in short transactions of buffer entries, in write-ahead log mode,
+    so that concurrent runs sharing the file do not wait on each other.
+    """
+
+    def __init__(
+        self, system, size=100000, file=None, tolerance=0.01, buffer=100
+    ):
+        """
+        :system: string identifying the simulator and potential, entries of
+            other systems in a shared file are not used.
+        :size: maximum number of entries kept in memory.
+        :file: SQLite file of the on-disk cache, None to keep it in memory.
+        :tolerance: pair distances are compared to within this (Angstrom).
+        :buffer: number of new entries written to the file at once.
+        """
+        self.system = hashfunc(system.encode()).hexdigest()
+        self.size = size
+        self.tolerance = tolerance
+        self.buffer = buffer
+        self.entries = OrderedDict()
+        self.db = None
+        if file is not None:
+            self.db = sqlite3.connect(
+                file, timeout=60, check_same_thread=False
+            )
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (system TEXT, key TEXT, "
+                "energy REAL, species TEXT, coords BLOB, "
+                "PRIMARY KEY (system, key))"
+            )
+            self.db.commit()
+        # results of submitted evaluations are stored from other threads
+        self.lock = threading.RLock()
+        self.rows = []  # new entries not yet written to the file
+        self.lookups = 0
+        self.hits = 0
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self._flush()
+                self.db.close()
+                self.db = None
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def get(self, key):
+        with self.lock:
+            return self._get(key)
+
+    def _get(self, key):
+        self.lookups += 1
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT energy, species, coords FROM cache "
+                "WHERE system = ? AND key = ?",
+                (self.system, key),
+            ).fetchone()
+            if row is not None:
+                energy, species, coords = row
+                value = (energy, species.split(), np.frombuffer(coords))
+                self._remember(key, value)
+                self.hits += 1
+                return value
+        return None
+
+    def put(self, key, energy, species, coords):
+        with self.lock:
+            self._put(key, energy, species, coords)
+
+    def _put(self, key, energy, species, coords):
+        value = (energy, list(species), np.ascontiguousarray(coords))
+        self._remember(key, value)
+        if self.db is not None:
+            self.rows.append(
+                (
+                    self.system,
+                    key,
+                    energy,
+                    ' '.join(species),
+                    value[2].tobytes(),
+                )
+            )
+            if len(self.rows) >= self.buffer:
+                self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                self.rows,
+            )
+            self.db.commit()
+            self.rows = []
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class CachedEvaluator(object):
+    """
+    Wraps an evaluator and returns cached results for structures whose
+    input or relaxed fingerprint has been seen before.
+    """
+
+    def __init__(self, evaluator, cache, report_every=1000):
+        self.evaluator = evaluator
+        self.cache = cache
+        self.report_every = report_every
+
+    def lookup(self, structData):
+        """(key, cached result or None) of a structure."""
+        key = fingerprint(structData, self.cache.tolerance)
+        value = self.cache.get(key)
+        if self.cache.lookups % self.report_every == 0:
+            self.report()
+        if value is None:
+            return key, None
+
+        # place the cached structure at the position of the input
+        energy, species, x = value
+        x = x.reshape(-1, 3) + cartesian_coords(structData).mean(axis=0)
+        frac = x @ np.linalg.inv(structData['lattice'].matrix)
+        minData = {
+            "lattice": structData['lattice'],
+            "parameters": frac.flatten(),
+            "species": list(species),
+            "constraint": structData['constraint'],
+        }
+        # the key does not depend on the lattice, a structure cached from
+        # a larger box may not fit into this one
+        if energy < 1e300 and (
+            np.any((frac < 0) | (frac >= 1)) or not check_constrains(minData)
+        ):
+            with self.cache.lock:
+                self.cache.hits -= 1
+            return key, None
+        return key, (minData, energy)
+
+    def store(self, key, result):
+        minData, energy = result
+        if is_screened(minData):
+            return  # an upper bound, that depends on the best energy yet
+        x = cartesian_coords(minData)
+        x = (x - x.mean(axis=0)).flatten()
+        self.cache.put(key, energy, minData['species'], x)
+        if energy < 1e300:
+            # a relaxed minimum relaxes to itself
+            relaxed = fingerprint(minData, self.cache.tolerance)
+            self.cache.put(relaxed, energy, minData['species'], x)
+
+    def evaluate(self, structData):
+        key, result = self.lookup(structData)
+        if result is None:
+            result = self.evaluator.evaluate(structData)
+            self.store(key, result)
+        return result
+
+    def submit(self, structData):
+        """
+        Start evaluating a structure with the submit of the wrapped
+        evaluator, returns a Future of the result.
+        """
+        key, result = self.lookup(structData)
+        if result is not None:
+            future = Future()
+            future.set_result(result)
+            return future
+
+        def store(future):
+            if future.exception() is None:
+                self.store(key, future.result())
+
+        future = self.evaluator.submit(structData)
+        future.add_done_callback(store)
+        return future
+
+    def evaluate_batch(self, structDatas):
+        lookups = [self.lookup(structData) for structData in structDatas]
+        misses = [i for i, (_, result) in enumerate(lookups) if result is None]
+        candidates = [structDatas[i] for i in misses]
+        if hasattr(self.evaluator, 'evaluate_batch'):
+            evaluated = self.evaluator.evaluate_batch(candidates)
+        else:
+            evaluated = [self.evaluator.evaluate(c) for c in candidates]
+
+        results = [result for _, result in lookups]
+        for i, result in zip(misses, evaluated):
+            self.store(lookups[i][0], result)
+            results[i] = result
+        return results
+
+    def close(self):
+        self.report()
+        self.cache.close()
+        if hasattr(self.evaluator, 'close'):
+            self.evaluator.close()
+
+    def report(self):
+        logger.info(
+            f"Evaluation cache: {self.cache.hits} hits in "
+            f"{self.cache.lookups} lookups "
+            f"({100 * self.cache.hit_rate:.1f}%)."
+        )
+
@@ -0,0 +1,96 @@
+"""
+Checkpointing of the MCTS search state.
+"""
+
+import os
+import pickle
+import random
+
+import numpy as np
+
+from CASTING.tree import MCTSTree
+
+from . import logger
+
+
+def save_checkpoint(
+    path,
+    tree,
+    iteration,
+    selected_node,
+    minima=None,
+    operators=None,
+    prescreen=None,
+    evaluator=None,
+):
+    """
+    Write the tree, the position in the search, the states of the random
+    number generators, and the states of the minima index, mutation
+    operators, surrogate pre-screen and evaluator if any to path. The file is replaced
+    atomically, a run killed while writing leaves the previous checkpoint
+    intact.
+    """
+    rng_state = pickle.dumps((random.getstate(), np.random.get_state()))
+    arrays = tree.to_arrays()
+    for part in (minima, operators, prescreen, evaluator):
+        if part is not None:
+            arrays.update(part.to_arrays())
+    tmppath = f"{path}.tmp"
+    with open(tmppath, 'wb') as f:
+        np.savez(
+            f,
+            iteration=iteration,
+            selected_node=selected_node,
+            rng_state=np.frombuffer(rng_state, dtype=np.uint8),
+            **arrays,
+        )
+    os.replace(tmppath, path)
+    logger.debug(f'Checkpoint written at iteration {iteration}.')
+
+
+def load_checkpoint(
+    path, minima=None, operators=None, prescreen=None, evaluator=None
+):
+    """
+    Read a checkpoint written by save_checkpoint and restore the random
+    number generators, and the minima index, mutation operators, surrogate
+    pre-screen and evaluator if given, returns (tree, iteration,
+    selected_node).
+    """
+    with np.load(path) as data:
+        arrays = dict(data)
+    tree = MCTSTree.from_arrays(arrays)
+    py_state, np_state = pickle.loads(arrays['rng_state'].tobytes())
+    random.setstate(py_state)
+    np.random.set_state(np_state)
+    for part, key, lost in [
+        (
+            minima,
+            'minima_keys',
+            "duplicates of the minima found so far are not detected",
+        ),
+        (
+            operators,
+            'operators_state',
+            "the partner pool and operator statistics start empty",
+        ),
+        (
+            prescreen,
+            'surrogate_XtX',
+            "the surrogate model is trained again from scratch",
+        ),
+        (
+            evaluator,
+            'evaluator_best',
+            "the staged evaluation screens against the next minima only",
+        ),
+    ]:
+        if part is None:
+            continue
+        if key in arrays:
+            part.load_arrays(arrays)
+        else:
+            logger.warning(f"No {key} in '{path}', {lost}.")
+    iteration = int(arrays['iteration'])
+    logger.info(f"Resuming from '{path}' at iteration {iteration}.")
+    return tree, iteration, int(arrays['selected_node'])
@@ -4,36 +4,80 @@ Created on 2022-12-13 20:36:01.409428
 """
 
 from collections import Counter
-from itertools import product
 from random import choice, random, shuffle
 
-import networkx as nx
 import numpy as np
-from ase.build import bulk, make_supercell
 from pymatgen.core import Structure
-from scipy.spatial.distance import pdist, squareform
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
-from CASTING.utilis import DistanceMatrix, get_factors, get_lattice
+from CASTING.utilis import get_lattice, neighbor_pairs
 
 from . import logger
 
 
-def random_sub_cluster_sample(A, natoms):
-    indexes = np.arange(0, natoms, 1)
-    sampled_nodes = [choice(indexes)]
-    for i in range(natoms - 1):
-        connections = np.where(A[sampled_nodes[i], :] != 0)[0]
-        connections_wth_sam = [
-            n for n in connections if n not in sampled_nodes
+# nearest neighbours of a site of the FCC lattice, in units of half the
+# cubic lattice constant: sites are the integer points with an even sum
+FCC_NEIGHBORS = [
+    (i, j, 0)[p:] + (i, j, 0)[:p]
+    for p in range(3)
+    for i in (-1, 1)
+    for j in (-1, 1)
+]
+
+
+def fcc_random_walk(natoms, ncells, max_tries=100):
+    """
+    Self avoiding random walk of natoms sites on an FCC lattice of
+    ncells x ncells x ncells cubic cells, returns the visited sites as an
+    (natoms, 3) integer array in units of half the lattice constant.
+
+    Neighbours are generated on the fly and visited sites are kept in a set.
+    When the walk is stuck it continues from another visited site, so the
+    walk only fails if the region is full. It is restarted at most
+    max_tries times before giving up.
+    """
+    size = 2 * ncells
+    if 4 * ncells**3 < natoms:
+        raise ValueError(f"{ncells}^3 FCC cells cannot hold {natoms} atoms.")
+
+    def free_neighbors(site):
+        x, y, z = site
+        return [
+            n
+            for n in ((x + i, y + j, z + k) for i, j, k in FCC_NEIGHBORS)
+            if n not in visited and all(0 <= c < size for c in n)
         ]
-        shuffle(connections_wth_sam)
-        next_node = connections_wth_sam[0]
-        sampled_nodes.append(next_node)
 
-    return sampled_nodes
-
-
-def createRandomData(lattice, constrains, multiplier=10):
+    for _ in range(max_tries):
+        start = tuple(int(c) for c in np.random.randint(0, size, 3))
+        if sum(start) % 2:
+            start = (start[0] ^ 1,) + start[1:]
+        sites = [start]
+        visited = {start}
+        free = free_neighbors(start)
+        while len(sites) < natoms:
+            if not free:
+                # stuck, branch off from another visited site
+                candidates = sites[:-1]
+                shuffle(candidates)
+                free = next(
+                    (f for f in map(free_neighbors, candidates) if f), None
+                )
+                if free is None:
+                    break
+            current = choice(free)
+            sites.append(current)
+            visited.add(current)
+            free = free_neighbors(current)
+        if len(sites) == natoms:
+            return np.array(sites)
+
+    raise RuntimeError(f"No cluster of {natoms} atoms in {max_tries} tries.")
+
+
+def _random_cluster(lattice, constrains, multiplier=10):
+    """createRandomData, also returns the lattice sites of the cluster."""
     L = lattice
     C = constrains
 
@@ -50,27 +94,24 @@ def createRandomData(lattice, constrains, multiplier=10):
     ]
 
     shuffle(species)
+    natoms = len(species)
 
-    # ----------------Bulk FCC with natoms X multiplier atoms and select cluster with random walk -----------
+    # -------- cluster from a random walk on an FCC lattice with room for
+    # about natoms X multiplier atoms -----------
 
+    # nearest neighbour distance 2r between the largest minimum and the
+    # smallest maximum pair distance, so that no pair overlaps and the
+    # cluster is connected
     r0 = C["min_atom_pair_distance"]
     r1 = C["max_atom_pair_distance"]
+    r0 = max(r0.values()) if isinstance(r0, dict) else r0
+    r1 = min(r1.values()) if isinstance(r1, dict) else r1
     # radius of an indivisual atom from fcc packing
-    r = (r1 + random() * abs(r0 - r1)) * 0.5
+    r = (r0 + random() * abs(r1 - r0)) * 0.5
     a = 2 * 2**0.5 * r
-    a1 = bulk("Cu", "fcc", a=a)  # 'Cu' dummy species
-    factors = get_factors(natoms * multiplier, 3)
-    P = np.diag(factors, k=0)  # transformation mattrx
-    pos = make_supercell(a1, P).get_positions()
-    A = squareform(pdist(pos, metric="euclidean"))
-    A[A > 2 * r] = 0
-    A[A != 0] = 1
-    while True:
-        try:
-            sampled_nodes = random_sub_cluster_sample(A, natoms)
-            break
-        except Exception:
-            continue
+    ncells = int(np.ceil((natoms * multiplier / 4) ** (1 / 3)))
+    sites = fcc_random_walk(natoms, ncells)
+    cluster_pos = sites * (0.5 * a)
 
     latt = get_lattice(
         **{
@@ -88,18 +129,52 @@ def createRandomData(lattice, constrains, multiplier=10):
 
     M = latt.matrix  # lattice matrix
 
-    cluster_pos = pos[sampled_nodes, :]
     box_centre = np.sum(M, axis=0) * 0.5
     cluster_centre = np.mean(cluster_pos, axis=0)
     cluster_pos = box_centre + cluster_centre - cluster_pos
     cluster_pos_fractional = np.matmul(cluster_pos, np.linalg.inv(M))
 
-    return {
+    structData = {
         "lattice": latt,
         "parameters": cluster_pos_fractional.flatten(),
         "species": species,
         "constraint": C,
     }
+    return structData, sites
+
+
+def createRandomData(lattice, constrains, multiplier=10):
+    return _random_cluster(lattice, constrains, multiplier)[0]
+
+
+def createRandomSeeds(lattice, constrains, nseeds, multiplier=10):
+    """
+    nseeds random structures with distinct cluster shapes, e.g. as roots of
+    several searches. Shapes are compared by the sorted squared distances
+    between their lattice sites.
+    """
+    seeds = []
+    shapes = set()
+    for _ in range(10 * nseeds):
+        structData, sites = _random_cluster(lattice, constrains, multiplier)
+        d = (sites[:, None, :] - sites[None, :, :]) ** 2
+        shape = np.sort(d.sum(axis=-1), axis=None).tobytes()
+        if shape in shapes:
+            continue
+        shapes.add(shape)
+        seeds.append(structData)
+        if len(seeds) == nseeds:
+            return seeds
+    logger.warning(f"Only {len(seeds)} of {nseeds} seeds are distinct.")
+    return seeds
+
+
+def is_screened(structData):
+    """
+    Whether structData is the result of an evaluation rejected before
+    its full minimization, whose energy is only an upper bound.
+    """
+    return structData.get('screened', False)
 
 
 def get_coords(parameters):
@@ -108,17 +183,11 @@ def get_coords(parameters):
     return coords
 
 
-def check_constrains(structData):
-    parameters = structData["parameters"].copy()
-    species = structData["species"].copy()
+def check_composition(natoms, species, constrains):
     specieCount = dict(Counter(species))
-    coords = get_coords(parameters)
-
-    constrains = structData['constraint']
 
     # ======= number of atom constrains==============
 
-    natoms = coords.shape[0]
     if (
         not constrains['min_num_atoms']
         <= natoms
@@ -140,47 +209,175 @@ def check_constrains(structData):
             logger.debug("composition inconsistent.")
             return False
 
-    # ======================================
+    return True
 
-    latt = structData["lattice"]
-    M = np.array((latt.matrix))
-    D = DistanceMatrix(coords, M)
-    np.fill_diagonal(D, 1e300)
-    A = np.empty(D.shape)
 
-    indices = {}
+def check_constrains(structData):
+    parameters = structData["parameters"].copy()
+    species = structData["species"].copy()
+    coords = get_coords(parameters)
 
-    for key in constrains["composition"].keys():
-        indices[key] = np.where(np.array(species) == key)[0].tolist()
+    constrains = structData['constraint']
 
-    for c in product(list(indices.keys()), repeat=2):
-        index1, index2 = indices[c[0]], indices[c[1]]
-        d_sub = D[index1, :][:, index2]
+    natoms = coords.shape[0]
+    if not check_composition(natoms, species, constrains):
+        return False
 
-        rmin = constrains["min_atom_pair_distance"]
-        rmax = constrains["max_atom_pair_distance"]
-        if np.sum(d_sub < rmin):  # overlapping test
-            logger.debug("overlapping atoms.")
-            return False
+    # ======================================
 
-        d_sub[d_sub <= rmax] = 1
-        d_sub[d_sub > rmax] = 0
+    names, codes = np.unique(species, return_inverse=True)
+    rmin = pair_table(constrains["min_atom_pair_distance"], names)
+    rmax = pair_table(constrains["max_atom_pair_distance"], names)
 
-        C = A[index1, :]
-        C[:, index2] = d_sub
-        A[index1, :] = C
+    latt = structData["lattice"]
+    M = np.array((latt.matrix))
+    i, j, d = neighbor_pairs(coords, M, max(rmin.max(), rmax.max()))
+    ci, cj = codes[i], codes[j]
 
-    G = nx.from_numpy_matrix(A)
+    if np.any(d < rmin[ci, cj]):  # overlapping test
+        logger.debug("overlapping atoms.")
+        return False
 
     # -------fragmentation test----------------
 
-    if len(list(nx.connected_components(G))) > 1:
+    bonded = d <= rmax[ci, cj]
+    A = coo_matrix(
+        (np.ones(bonded.sum()), (i[bonded], j[bonded])), shape=(natoms, natoms)
+    )
+    ncomponents, _ = connected_components(A, directed=False)
+
+    if ncomponents > 1:
         logger.debug("Fragmented cluster.")
         return False
 
     return True
 
 
+def pair_table(value, names):
+    """
+    Per species pair lookup table of a distance constraint, given either as
+    one number or as a dict like {"Au-Au": 2.0, "Au-Al": 2.2, ...}.
+    """
+    if not isinstance(value, dict):
+        return np.full((len(names), len(names)), float(value))
+
+    table = np.empty((len(names), len(names)))
+    for i, sp1 in enumerate(names):
+        for j, sp2 in enumerate(names):
+            key = f"{sp1}-{sp2}"
+            table[i, j] = value[key] if key in value else value[f"{sp2}-{sp1}"]
+    return table
+
+
+class BatchConstraintChecker(object):
+    """
+    Constraint check of many structures at once. The structures share one
+    lattice and species list, their distance matrices are computed in one
+    vectorized pass into buffers that are kept between calls.
+    """
+
+    def __init__(self, max_elements=2**22):
+        """
+        :max_elements: bound on the size of the pair buffers, larger
+            batches are processed in chunks.
+        """
+        self.max_elements = max_elements
+        self.diff = np.empty(0)
+        self.work = np.empty(0)
+        self.D = np.empty(0)
+
+    def buffers(self, B, N):
+        n = B * N * N
+        if self.D.size < n:
+            self.diff = np.empty(3 * n)
+            self.work = np.empty(3 * n)
+            self.D = np.empty(n)
+        return (
+            self.diff[: 3 * n].reshape(B, N, N, 3),
+            self.work[: 3 * n].reshape(B, N, N, 3),
+            self.D[:n].reshape(B, N, N),
+        )
+
+    def __call__(self, frac_stack, species, lattice, constrains):
+        """
+        :frac_stack: (B, N, 3) or (B, 3N) fractional coordinates.
+        :returns: (B,) boolean mask of the structures that pass.
+        """
+        B = len(frac_stack)
+        frac_stack = np.asarray(frac_stack).reshape(B, -1, 3)
+        N = frac_stack.shape[1]
+        if not check_composition(N, species, constrains):
+            return np.zeros(B, dtype=bool)
+
+        names, codes = np.unique(species, return_inverse=True)
+        rmin = pair_table(constrains["min_atom_pair_distance"], names)
+        rmin = rmin[codes[:, None], codes[None, :]]
+        rmax = pair_table(constrains["max_atom_pair_distance"], names)
+        rmax = rmax[codes[:, None], codes[None, :]]
+        M = np.array(lattice.matrix)
+
+        valid = np.empty(B, dtype=bool)
+        chunk = max(1, self.max_elements // (3 * N * N))
+        for start in range(0, B, chunk):
+            x = frac_stack[start : start + chunk]
+            valid[start : start + len(x)] = self._check(x, M, rmin, rmax)
+        return valid
+
+    def _check(self, x, M, rmin, rmax):
+        B, N, _ = x.shape
+        diff, work, D = self.buffers(B, N)
+
+        # periodic distance matrices, same convention as DistanceMatrix
+        np.subtract(x[:, :, None, :], x[:, None, :, :], out=diff)
+        np.rint(diff, out=work)
+        np.subtract(diff, work, out=diff)
+        np.matmul(diff, M, out=work)
+        np.square(work, out=work)
+        np.sum(work, axis=-1, out=D)
+        np.sqrt(D, out=D)
+        D[:, np.arange(N), np.arange(N)] = np.inf
+
+        # overlapping test
+        valid = ~np.any(D < rmin, axis=(1, 2))
+
+        # fragmentation test, on one block diagonal graph of all structures
+        b, i, j = np.nonzero(D <= rmax)
+        A = coo_matrix(
+            (np.ones(len(b)), (b * N + i, b * N + j)), shape=(B * N, B * N)
+        )
+        _, labels = connected_components(A, directed=False)
+        labels = np.sort(labels.reshape(B, N), axis=1)
+        ncomponents = 1 + np.count_nonzero(np.diff(labels, axis=1), axis=1)
+        valid &= ncomponents == 1
+        return valid
+
+
+check_constrains_batch = BatchConstraintChecker()
+
+
+def screen_constrains(structDatas):
+    """
+    Constraint check of a list of structures, batched when they share
+    lattice and species.
+    """
+    if not len(structDatas):
+        return np.zeros(0, dtype=bool)
+    first = structDatas[0]
+    if all(
+        s['lattice'] is first['lattice']
+        and s['species'] == first['species']
+        and s['constraint'] is first['constraint']
+        for s in structDatas
+    ):
+        return check_constrains_batch(
+            np.stack([s['parameters'] for s in structDatas]),
+            first['species'],
+            first['lattice'],
+            first['constraint'],
+        )
+    return np.array([check_constrains(s) for s in structDatas])
+
+
 # ---------------------------------------
 
 
@@ -0,0 +1,344 @@
+"""
+Distributed evaluation of structures through a spool directory on a
+shared file system.
+
+The optimizer side (SpoolEvaluator) writes tasks to the spool, workers
+started with 'python -m CASTING worker SPOOL' on any host that sees the
+spool claim tasks, evaluate them and write back the results:
+
+    spool/config.json            evaluator module, class and parameters
+    spool/tasks/ID.pkl           tasks waiting for a worker
+    spool/claimed/ID.WORKER.pkl  tasks being evaluated by WORKER
+    spool/results/ID.pkl         results waiting to be collected
+    spool/workers/WORKER.json    heartbeat and statistics of a worker
+    spool/stop                   asks the workers to exit
+
+Files are moved with os.rename, which is atomic, so a task is claimed by
+one worker only. A task whose worker stops sending heartbeats is put back
+into tasks/ and tried again.
+"""
+
+import itertools
+import json
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+
+from . import logger
+
+_dirs = ['tasks', 'claimed', 'results', 'workers']
+
+
+def _write(path, obj):
+    """Pickle obj to path atomically."""
+    tmppath = path.with_suffix('.tmp')
+    with open(tmppath, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmppath, path)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class SpoolEvaluator(object):
+    """
+    Evaluates structures on workers that share a spool directory.
+    """
+
+    def __init__(
+        self,
+        modulename,
+        clsname,
+        pars,
+        spool='spool',
+        timeout=60,
+        max_retries=3,
+        local_workers=0,
+        poll=0.05,
+    ):
+        """
+        :modulename: module of the evaluator class run by the workers.
+        :clsname: evaluator class name.
+        :pars: parameters passed to the evaluator of every worker.
+        :spool: spool directory, on a file system shared with the workers.
+        :timeout: seconds without a heartbeat after which a worker is
+            considered lost and its task is given to another worker.
+        :max_retries: number of times a lost or failed task is tried
+            again before it is scored 1e300.
+        :local_workers: number of workers to start on this host.
+        :poll: seconds between checks for results.
+        """
+        self.spool = Path(spool)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.poll = poll
+        for d in _dirs:
+            (self.spool / d).mkdir(parents=True, exist_ok=True)
+        (self.spool / 'stop').unlink(missing_ok=True)
+        with open(self.spool / 'config.json', 'w') as f:
+            json.dump(
+                {
+                    'modulename': modulename,
+                    'clsname': clsname,
+                    'pars': pars,
+                    'timeout': timeout,
+                },
+                f,
+            )
+
+        self.prefix = uuid.uuid4().hex[:8]
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.tasks = {}  # ID -> [future, structData, attempts]
+        self.started = time.time()
+        self.closed = False
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+        self.processes = [
+            subprocess.Popen(
+                [sys.executable, '-m', 'CASTING', 'worker', str(self.spool)]
+            )
+            for _ in range(local_workers)
+        ]
+        logger.info(
+            f"Distributed evaluation through '{self.spool}', "
+            f"{local_workers} local workers."
+        )
+
+    # ---------------------------------------------------------
+
+    def submit(self, structData):
+        """Queue a structure for evaluation, returns a Future of the result."""
+        ID = f"{self.prefix}-{next(self.counter):09d}"
+        future = Future()
+        with self.lock:
+            self.tasks[ID] = [future, structData, 0]
+        _write(self.spool / 'tasks' / f'{ID}.pkl', structData)
+        return future
+
+    def evaluate(self, structData):
+        return self.submit(structData).result()
+
+    def evaluate_batch(self, structDatas):
+        """Evaluate a list of structures, results are in input order."""
+        futures = [self.submit(structData) for structData in structDatas]
+        return [future.result() for future in futures]
+
+    # ---------------------------------------------------------
+
+    def _collect(self):
+        """Collect results and requeue lost tasks, runs in a thread."""
+        last_check = time.time()
+        while not self.closed:
+            for path in (self.spool / 'results').glob('*.pkl'):
+                self._receive(path)
+            if time.time() - last_check > self.timeout / 4:
+                self._requeue_lost()
+                last_check = time.time()
+            time.sleep(self.poll)
+
+    def _receive(self, path):
+        ID = path.stem
+        try:
+            ok, result = _read(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return  # not there anymore or still being written
+        path.unlink(missing_ok=True)  # acknowledge
+        with self.lock:
+            task = self.tasks.get(ID)
+        if task is None:
+            return  # result of a task that was retried and done already
+        if ok:
+            with self.lock:
+                del self.tasks[ID]
+            task[0].set_result(result)
+        else:
+            logger.warning(f"Task {ID} failed on a worker: {result}")
+            self._retry(ID)
+
+    def _retry(self, ID, claimed=None):
+        """Put a task back in the queue, or give up on it."""
+        with self.lock:
+            task = self.tasks.get(ID)
+            if task is None:
+                return
+            task[2] += 1
+            giveup = task[2] > self.max_retries
+            if giveup:
+                del self.tasks[ID]
+        if claimed is not None:
+            claimed.unlink(missing_ok=True)
+        if giveup:
+            logger.warning(f"Task {ID} failed {task[2]} times, skipped.")
+            task[0].set_result((task[1], 1e300))
+        else:
+            _write(self.spool / 'tasks' / f'{ID}.pkl', task[1])
+
+    def _requeue_lost(self):
+        now = time.time()
+        for path in (self.spool / 'claimed').glob('*.pkl'):
+            ID, worker = path.stem.split('.', 1)
+            heartbeat = self.spool / 'workers' / f'{worker}.json'
+            try:
+                alive = now - heartbeat.stat().st_mtime < self.timeout
+            except FileNotFoundError:
+                alive = False
+            if not alive:
+                logger.warning(f"Worker {worker} lost, retrying task {ID}.")
+                self._retry(ID, claimed=path)
+
+    # ---------------------------------------------------------
+
+    def utilization(self):
+        """Statistics of the workers seen during this run."""
+        stats = []
+        for path in sorted((self.spool / 'workers').glob('*.json')):
+            try:
+                with open(path) as f:
+                    s = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if s['last_seen'] >= self.started:
+                stats.append(s)
+        return stats
+
+    def report(self):
+        for s in self.utilization():
+            uptime = max(s['last_seen'] - s['started'], 1e-9)
+            logger.info(
+                f"Worker {s['name']}: {s['tasks']} tasks, "
+                f"{s['failures']} failed, "
+                f"{100 * s['busy'] / uptime:.1f}% busy."
+            )
+
+    def close(self):
+        (self.spool / 'stop').touch()
+        for process in self.processes:
+            process.wait()
+        self.report()
+        self.closed = True
+        self.collector.join()
+
+
+# -------------------------------------------------------------
+
+
+class Worker(object):
+    """
+    Evaluates the tasks of a spool directory until asked to stop.
+    """
+
+    def __init__(self, spool, name=None, idle_timeout=None):
+        """
+        :spool: spool directory shared with the optimizer.
+        :name: worker name, without dots. Defaults to host-pid.
+        :idle_timeout: exit after this many seconds without a task.
+        """
+        self.spool = Path(spool)
+        host = socket.gethostname().replace('.', '_')
+        self.name = name or f"{host}-{os.getpid()}"
+        if '.' in self.name:
+            raise ValueError("Worker names cannot contain dots.")
+        self.idle_timeout = idle_timeout
+        self.stats = {
+            'name': self.name,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'started': time.time(),
+            'last_seen': time.time(),
+            'busy': 0.0,
+            'tasks': 0,
+            'failures': 0,
+        }
+        self.lock = threading.Lock()
+
+        with open(self.spool / 'config.json') as f:
+            config = json.load(f)
+        # well within the time after which the optimizer gives up on us
+        self.heartbeat = config['timeout'] / 4
+        sim_module = __import__(config['modulename'], fromlist=[''])
+        self.evaluator = getattr(sim_module, config['clsname'])(
+            config['pars']
+        )
+
+    def beat(self):
+        with self.lock:
+            self.stats['last_seen'] = time.time()
+            path = self.spool / 'workers' / f'{self.name}.json'
+            with open(path.with_suffix('.tmp'), 'w') as f:
+                json.dump(self.stats, f)
+            os.replace(path.with_suffix('.tmp'), path)
+
+    def _beat_forever(self, stop):
+        while not stop.wait(self.heartbeat):
+            self.beat()
+
+    def claim(self):
+        """Claim a task, returns (ID, claimed path) or None."""
+        for path in sorted((self.spool / 'tasks').glob('*.pkl')):
+            claimed = self.spool / 'claimed' / f'{path.stem}.{self.name}.pkl'
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            return path.stem, claimed
+        return None
+
+    def run_task(self, ID, claimed):
+        start = time.time()
+        try:
+            result = (True, self.evaluator.evaluate(_read(claimed)))
+        except Exception as err:
+            result = (False, repr(err))
+        _write(self.spool / 'results' / f'{ID}.pkl', result)
+        claimed.unlink(missing_ok=True)
+        with self.lock:
+            self.stats['busy'] += time.time() - start
+            self.stats['tasks'] += 1
+            self.stats['failures'] += not result[0]
+        self.beat()
+
+    def run(self, poll=0.05):
+        logger.info(f"Worker {self.name} serving '{self.spool}'.")
+        stop = threading.Event()
+        threading.Thread(
+            target=self._beat_forever, args=(stop,), daemon=True
+        ).start()
+        self.beat()
+
+        idle_since = time.time()
+        wait = poll
+        while not (self.spool / 'stop').exists():
+            task = self.claim()
+            if task is not None:
+                self.run_task(*task)
+                idle_since = time.time()
+                wait = poll
+                continue
+            if (
+                self.idle_timeout is not None
+                and time.time() - idle_since > self.idle_timeout
+            ):
+                break
+            time.sleep(wait)
+            wait = min(2 * wait, 20 * poll)
+
+        stop.set()
+        if hasattr(self.evaluator, 'close'):
+            self.evaluator.close()
+        self.beat()
+        uptime = self.stats['last_seen'] - self.stats['started']
+        logger.info(
+            f"Worker {self.name} done: {self.stats['tasks']} tasks, "
+            f"{100 * self.stats['busy'] / max(uptime, 1e-9):.1f}% busy."
+        )
@@ -0,0 +1,292 @@
+"""
+Embedded atom method energies and forces in NumPy, and minimizers working
+on flat coordinate arrays.
+
+The potential files are read once into cubic spline tables built the way
+LAMMPS pair_style eam and eam/alloy build them, so energies agree with
+LAMMPS to round-off.
+"""
+
+import numpy as np
+from pymatgen.core.periodic_table import Element
+from scipy.optimize import minimize
+from scipy.spatial import cKDTree
+
+# Hartree * Bohr in eV * Angstrom, as used by LAMMPS for funcfl files
+_ZCONV = 27.2 * 0.529
+
+
+def spline_table(f, delta):
+    """
+    Cubic spline coefficients of the values f on a grid of spacing delta,
+    one row [3a/delta, 2b/delta, c/delta, a, b, c, f] per grid point, as in
+    LAMMPS PairEAM::interpolate.
+    """
+    n = len(f)
+    c = np.zeros((n, 7))
+    c[:, 6] = f
+    d = np.empty(n)
+    d[0] = f[1] - f[0]
+    d[1] = 0.5 * (f[2] - f[0])
+    d[-2] = 0.5 * (f[-1] - f[-3])
+    d[-1] = f[-1] - f[-2]
+    d[2:-2] = ((f[:-4] - f[4:]) + 8.0 * (f[3:-1] - f[1:-3])) / 12.0
+    c[:, 5] = d
+    c[:-1, 4] = 3.0 * (f[1:] - f[:-1]) - 2.0 * d[:-1] - d[1:]
+    c[:-1, 3] = d[:-1] + d[1:] - 2.0 * (f[1:] - f[:-1])
+    c[:, 2] = c[:, 5] / delta
+    c[:, 1] = 2.0 * c[:, 4] / delta
+    c[:, 0] = 3.0 * c[:, 3] / delta
+    return c
+
+
+def _lookup(x, rdelta, n):
+    """Grid interval and position in it of x, as in LAMMPS."""
+    p = x * rdelta
+    k = np.minimum(p.astype(int), n - 2)  # x >= 0
+    return k, np.minimum(p - k, 1.0)
+
+
+def _value(c, p):
+    return ((c[..., 3] * p + c[..., 4]) * p + c[..., 5]) * p + c[..., 6]
+
+
+def _derivative(c, p):
+    return (c[..., 0] * p + c[..., 1]) * p + c[..., 2]
+
+
+class EAMPotential(object):
+    """
+    EAM potential from a funcfl (pair_style eam, one element) or setfl
+    (pair_style eam/alloy) file.
+    """
+
+    def __init__(self, filename, form=None):
+        """
+        :filename: potential file.
+        :form: 'eam' for funcfl or 'alloy' for setfl files. Guessed from
+            the file extension if None.
+        """
+        if form is None:
+            form = 'alloy' if str(filename).endswith('.alloy') else 'eam'
+        with open(filename) as f:
+            lines = f.readlines()
+        if form == 'eam':
+            self._read_funcfl(lines)
+        elif form == 'alloy':
+            self._read_setfl(lines)
+        else:
+            raise ValueError(f"Unknown EAM file form '{form}'.")
+
+        self.rdrho = 1.0 / self.drho
+        self.rdr = 1.0 / self.dr
+        self.frho = np.array([spline_table(f, self.drho) for f in self.F])
+        self.rhor = np.array([spline_table(f, self.dr) for f in self.rho])
+        self.z2r = np.array(
+            [[spline_table(f, self.dr) for f in row] for row in self.rphi]
+        )
+        del self.F, self.rho, self.rphi
+
+    def _read_header(self, line):
+        nrho, drho, nr, dr, cutoff = line.split()[:5]
+        self.nrho, self.drho = int(nrho), float(drho)
+        self.nr, self.dr = int(nr), float(dr)
+        self.cutoff = float(cutoff)
+        self.rhomax = (self.nrho - 1) * self.drho
+
+    def _read_funcfl(self, lines):
+        Z = int(lines[1].split()[0])
+        self.elements = [Element.from_Z(Z).symbol]
+        self._read_header(lines[2])
+        values = np.array(''.join(lines[3:]).split(), dtype=float)
+        sections = np.cumsum([self.nrho, self.nr, self.nr])
+        F, z, rho = np.split(values, sections)[:3]
+        # LAMMPS tabulates funcfl files without their last grid point, but
+        # keeps rhomax
+        self.nrho -= 1
+        self.nr -= 1
+        self.F, self.rho = [F[:-1]], [rho[:-1]]
+        self.rphi = [[_ZCONV * z[:-1] * z[:-1]]]
+
+    def _read_setfl(self, lines):
+        self.elements = lines[3].split()[1:]
+        nel = len(self.elements)
+        self._read_header(lines[4])
+        self.F, self.rho = [], []
+        tokens = ''.join(lines[5:]).split()
+        pos = 0
+        for _ in range(nel):
+            pos += 4  # atomic number, mass, lattice constant and type
+            self.F.append(np.array(tokens[pos : pos + self.nrho], float))
+            pos += self.nrho
+            self.rho.append(np.array(tokens[pos : pos + self.nr], float))
+            pos += self.nr
+        self.rphi = [[None] * nel for _ in range(nel)]
+        for i in range(nel):
+            for j in range(i + 1):
+                rphi = np.array(tokens[pos : pos + self.nr], float)
+                self.rphi[i][j] = self.rphi[j][i] = rphi
+                pos += self.nr
+
+    def types(self, species):
+        """Index of each atom's element in the potential."""
+        index = {el: i for i, el in enumerate(self.elements)}
+        try:
+            return np.array([index[s] for s in species])
+        except KeyError as err:
+            raise ValueError(f"Element {err} not in the potential.")
+
+    def energy_forces(self, x, types, pairs):
+        """
+        Total energy and forces of atoms at cartesian positions x (N, 3).
+        :types: element index of each atom, see types.
+        :pairs: (i, j) index arrays of the pairs within the cutoff, each
+            pair once.
+        """
+        i, j = pairs
+        n = len(x)
+        ij = np.concatenate([i, j])
+        dx = x[i] - x[j]
+        r = np.sqrt(np.einsum('ij,ij->i', dx, dx))
+        k, p = _lookup(r, self.rdr, self.nr)
+
+        # densities, each atom gets the density function of its neighbor
+        if len(self.elements) == 1:
+            ci = cj = self.rhor[0, k]
+            rhoj = rhoi = _value(ci, p)
+            rhojp = rhoip = _derivative(ci, p)
+            cz = self.z2r[0, 0, k]
+        else:
+            ti, tj = types[i], types[j]
+            ci, cj = self.rhor[ti, k], self.rhor[tj, k]
+            rhoi, rhoj = _value(ci, p), _value(cj, p)
+            rhoip, rhojp = _derivative(ci, p), _derivative(cj, p)
+            cz = self.z2r[ti, tj, k]
+        rho = np.bincount(ij, np.concatenate([rhoj, rhoi]), n)
+
+        # embedding energies
+        km, pm = _lookup(rho, self.rdrho, self.nrho)
+        cm = self.frho[types, km]
+        fp = _derivative(cm, pm)
+        energy = np.sum(_value(cm, pm))
+        energy += np.dot(fp, np.maximum(rho - self.rhomax, 0.0))
+
+        # pair energies, z2r holds r * phi
+        z2, z2p = _value(cz, p), _derivative(cz, p)
+        recip = 1.0 / r
+        phi = z2 * recip
+        energy += np.sum(phi)
+        phip = (z2p - phi) * recip
+        psip = fp[i] * rhojp + fp[j] * rhoip + phip
+
+        f = dx * (-psip * recip)[:, None]
+        forces = np.bincount(
+            (3 * ij[:, None] + np.arange(3)).ravel(),
+            np.concatenate([f, -f]).ravel(),
+            3 * n,
+        ).reshape(n, 3)
+        return energy, forces
+
+
+class NeighborList(object):
+    """
+    Pairs within cutoff of a set of non periodic atoms. Pairs within
+    cutoff + skin are kept and only rebuilt once an atom moved more than
+    skin / 2.
+    """
+
+    def __init__(self, cutoff, skin=2.0):
+        self.cutoff = cutoff
+        self.skin = skin
+        self.x0 = None
+
+    def pairs(self, x):
+        if (
+            self.x0 is None
+            or len(x) != len(self.x0)
+            or np.max(np.sum(np.square(x - self.x0), axis=1))
+            > 0.25 * self.skin**2
+        ):
+            self.x0 = x.copy()
+            self.candidates = cKDTree(x).query_pairs(
+                self.cutoff + self.skin, output_type='ndarray'
+            ).T
+        i, j = self.candidates
+        dx = x[i] - x[j]
+        keep = np.einsum('ij,ij->i', dx, dx) < self.cutoff**2
+        return i[keep], j[keep]
+
+
+# -------------------------------------------------------------
+
+
+def max_force(gradient):
+    return np.sqrt(np.max(np.sum(np.square(gradient.reshape(-1, 3)), 1)))
+
+
+def fire(
+    fun,
+    x0,
+    fmax=1e-3,
+    max_steps=10000,
+    dt=0.1,
+    dt_max=1.0,
+    max_move=0.2,
+    n_min=5,
+    f_inc=1.1,
+    f_dec=0.5,
+    a_start=0.1,
+    f_a=0.99,
+):
+    """
+    FIRE minimization (Bitzek et al., PRL 97, 170201), with the defaults
+    of ASE. Returns (x, energy, number of steps).
+    :fun: function of the flat coordinates returning (energy, gradient).
+    :fmax: stop once the largest atomic force is below fmax.
+    :max_move: largest move of all coordinates in one step.
+    """
+    x = np.array(x0, dtype=float)
+    v = np.zeros_like(x)
+    a, n_pos = a_start, 0
+    energy, g = fun(x)
+    step = 0
+    for step in range(max_steps):
+        if max_force(g) < fmax:
+            break
+        f = -g
+        if np.dot(f, v) > 0.0:
+            v = (1.0 - a) * v + a * f * np.sqrt(np.dot(v, v) / np.dot(f, f))
+            if n_pos > n_min:
+                dt = min(dt * f_inc, dt_max)
+                a *= f_a
+            n_pos += 1
+        else:
+            v[:] = 0.0
+            a, n_pos = a_start, 0
+            dt *= f_dec
+        v += dt * f
+        dx = dt * v
+        norm = np.sqrt(np.dot(dx, dx))
+        if norm > max_move:
+            dx *= max_move / norm
+        x += dx
+        energy, g = fun(x)
+    return x, energy, step
+
+
+def lbfgs(fun, x0, fmax=1e-3, max_steps=10000):
+    """
+    L-BFGS minimization with scipy. Returns (x, energy, number of steps).
+    :fmax: stop once the largest gradient component is below fmax.
+    """
+    res = minimize(
+        fun,
+        x0,
+        jac=True,
+        method='L-BFGS-B',
+        options={'maxiter': max_steps, 'gtol': fmax, 'ftol': 0.0},
+    )
+    return res.x, res.fun, res.nit
+
+
+minimizers = {'fire': fire, 'lbfgs': lbfgs}
@@ -10,22 +10,23 @@ Created on 2022-12-13 20:36:01.409428
 
 
 import math
-import time
-from hashlib import sha256 as hashfunc
+import os
+import shutil
+import tempfile
+from ctypes import c_double, c_int
 
-from lammps import lammps
-from pymatgen.io.lammps.data import LammpsData
-from pymatgen.io.xyz import XYZ
+import numpy as np
+from lammps import LMP_STYLE_ATOM, LMP_TYPE_VECTOR, lammps
+from pymatgen.core.periodic_table import Element
+from pymatgen.io.lammps.data import LammpsData, lattice_2_lmpbox
 
-from CASTING.clusterfun import check_constrains, parm2struc, struc2param
+from CASTING.clusterfun import check_constrains, get_coords, parm2struc
 
 from . import logger
 
 # In[ ]:
 
 cmds = ["-screen", "none", "-log", "none"]
-lmp = lammps(cmdargs=cmds)
-# lmp  = lammps()
 
 
 class LammpsEvaluator:
@@ -34,17 +35,133 @@ class LammpsEvaluator:
     """
 
     def __init__(self, pars):
+        """
+        :pars: LAMMPS parameters. 'pair_style' and 'pair_coeff' are required,
+            'data_transfer' is either 'memory' (default), where atoms are
+            passed through the library interface, or 'file', where they go
+            through data files in a private scratch directory.
+            'setup' is either 'cold' (default), where the simulation is set
+            up from scratch for every structure, or 'warm', where the box
+            and potential are kept and only the atoms are replaced. A warm
+            evaluator falls back to a full set up when the box or the set
+            of species changes.
+            'staged', if given, is a dict enabling the staged evaluation
+            of a structure: its single point energy, then a coarse
+            minimization, then the tight minimization, see screen. Keys
+            are 'window' (eV/atom, default 0.25), 'single_point_window'
+            (eV/atom, default None for no check), 'coarse_force' (force
+            tolerance of the coarse minimization, eV/Angstrom, default
+            0.01) and 'coarse_steps' (default 100).
+            'batch', if given, is a dict enabling evaluate_batch to
+            minimize several structures together in one simulation, see
+            evaluate_batch. Keys are 'size' (structures per simulation,
+            default 16) and 'gap' (distance between the boxes of the
+            structures, Angstrom, default 20, more than the cutoff plus
+            the neighbor skin).
+        """
         self.pars = pars
+        self.data_transfer = pars.get('data_transfer', 'memory')
+        if self.data_transfer not in ('memory', 'file'):
+            raise ValueError(
+                f"Unknown data_transfer '{self.data_transfer}'."
+            )
+        self.setup_mode = pars.get('setup', 'cold')
+        if self.setup_mode not in ('cold', 'warm'):
+            raise ValueError(f"Unknown setup '{self.setup_mode}'.")
+        if self.setup_mode == 'warm' and self.data_transfer == 'file':
+            raise ValueError("Warm setup requires data_transfer 'memory'.")
+        # one instance per evaluator, evaluators may run concurrently
+        self.lmp = lammps(cmdargs=cmds)
+        self.scratch = None
+        if self.data_transfer == 'file':
+            self.scratch = tempfile.mkdtemp(prefix='lammps.', dir='.')
+        self.setup_key = None  # (box, species set) of the current setup
+        self.types = None  # current atom types, in atom ID order
 
-    def evaluate(self, structData):
-        if not check_constrains(structData):
-            return structData, 1e300
+        self.staged = pars.get('staged', None)
+        if self.staged is not None:
+            self.staged = {
+                'window': 0.25,
+                'single_point_window': None,
+                'coarse_force': 0.01,
+                'coarse_steps': 100,
+                **self.staged,
+            }
+        self.batch = pars.get('batch', None)
+        if self.batch is not None:
+            self.batch = {'size': 16, 'gap': 20.0, **self.batch}
+            if self.staged is not None or self.data_transfer == 'file':
+                raise ValueError(
+                    "Batches require data_transfer 'memory' and no staged "
+                    "evaluation."
+                )
 
-        struct = parm2struc(structData)
-        LammpsData.from_structure(struct, atom_style="atomic").write_file(
-            "in.data"
+        self.best = math.inf  # lowest energy after a tight minimization
+        # outcome of the evaluations that got past the constraint check
+        self.stages = {'single_point': 0, 'coarse': 0, 'tight': 0}
+
+    def __del__(self):
+        if getattr(self, 'scratch', None) is not None:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def create_box(self, structData):
+        """Create the box and atom types through the library interface."""
+        lmp = self.lmp
+        box, _ = lattice_2_lmpbox(structData['lattice'])
+        (xlo, xhi), (ylo, yhi), (zlo, zhi) = box.bounds
+        xy, xz, yz = box.tilt if box.tilt is not None else (0.0, 0.0, 0.0)
+
+        # same type numbering as LammpsData.from_structure
+        elements = sorted(Element(el) for el in set(structData['species']))
+        self.typemap = {el.symbol: i + 1 for i, el in enumerate(elements)}
+        self.boxmatrix = box.to_lattice().matrix
+
+        lmp.command(
+            f"region box prism {xlo} {xhi} {ylo} {yhi} {zlo} {zhi} "
+            f"{xy} {xz} {yz} units box"
         )
+        lmp.command(f"create_box {len(elements)} box")
+        for el in elements:
+            lmp.command(
+                f"mass {self.typemap[el.symbol]} {float(el.atomic_mass)}"
+            )
+
+    def create_atoms(self, structData):
+        """Add the atoms to an existing box through the library interface."""
+        frac = get_coords(structData['parameters']) % 1.0
+        x = frac @ self.boxmatrix
+        self.types = [self.typemap[s] for s in structData['species']]
+        self.lmp.create_atoms(len(x), None, self.types, x.flatten())
+
+    def reset_atoms(self, structData):
+        """Replace the atoms of a warm simulation."""
+        lmp = self.lmp
+        types = [self.typemap[s] for s in structData['species']]
+        if lmp.get_natoms() != len(types):
+            # atom count changed or atoms were lost, rebuild the atoms
+            lmp.command("delete_atoms group all")
+            self.create_atoms(structData)
+            return
 
+        frac = get_coords(structData['parameters']) % 1.0
+        x = (frac @ self.boxmatrix).flatten()
+        lmp.scatter_atoms("x", 1, 3, (c_double * len(x))(*x))
+        if types != self.types:
+            lmp.scatter_atoms("type", 0, 1, (c_int * len(types))(*types))
+            self.types = types
+
+    def setup(self, structData):
+        """Set up the simulation of a structure from scratch."""
+        self.clear()
+        if self.data_transfer == 'file':
+            self.read_data(structData)
+        else:
+            self.create_box(structData)
+            self.create_atoms(structData)
+        self.set_potential()
+
+    def clear(self):
+        lmp = self.lmp
         lmp.command("clear")
         lmp.command("dimension 3")
         lmp.command("box tilt large")
@@ -53,7 +170,9 @@ class LammpsEvaluator:
         lmp.command("neighbor 2.0 bin")
         lmp.command("atom_modify map array sort 0 0")
         lmp.command("boundary f f f")
-        lmp.command("read_data in.data")
+
+    def set_potential(self):
+        lmp = self.lmp
         lmp.command(f"{self.pars['pair_style']}")
         lmp.command(f"{self.pars['pair_coeff']}")
         lmp.command("thermo 1000")
@@ -61,11 +180,127 @@ class LammpsEvaluator:
         lmp.command("thermo_modify format float %5.14g lost ignore")
         lmp.command("variable potential equal pe/atoms")
         lmp.command("neigh_modify one 5000 delay 0 every 1 check yes")
-        lmp.command("run 0 pre no")
 
-        # ------------guard for bad structures---------
+    def load(self, structData):
+        """Put a structure into the simulation, warm if possible."""
+        if self.setup_mode == 'warm':
+            key = (
+                structData['lattice'].matrix.tobytes(),
+                frozenset(structData['species']),
+            )
+            if key == self.setup_key:
+                self.reset_atoms(structData)
+                return
+            self.setup_key = key
+        self.setup(structData)
+
+    def read_data(self, structData):
+        """Set up the box and atoms from a data file."""
+        datafile = os.path.join(self.scratch, 'in.data')
+        struct = parm2struc(structData)
+        LammpsData.from_structure(struct, atom_style="atomic").write_file(
+            datafile
+        )
+        self.lmp.command(f"read_data {datafile}")
+
+    def relaxed_coords(self, structData):
+        """Fractional coordinates of the atoms, in atom ID order."""
+        if self.data_transfer == 'file':
+            minfile = os.path.join(self.scratch, 'min.geo')
+            self.lmp.command(f"write_data {minfile}")
+            minstruct = LammpsData.from_file(
+                minfile, atom_style="atomic"
+            ).structure
+            return minstruct.frac_coords.flatten()
+
+        x = np.ctypeslib.as_array(self.lmp.gather_atoms("x", 1, 3))
+        x = x.reshape(-1, 3) @ np.linalg.inv(self.boxmatrix)
+        return x.flatten()
 
+    def minimized_data(self, structData):
+        """structData with the current coordinates of the simulation."""
+        return {
+            "lattice": structData['lattice'],
+            "parameters": self.relaxed_coords(structData),
+            "species": structData['species'].copy(),
+            "constraint": structData['constraint'],
+        }
+
+    def screen(self, structData, energy):
+        """
+        Early rejection of a structure whose single point energy is
+        single_point_window, or whose energy after a coarse minimization is
+        window, above the best energy found so far (per atom). Returns
+        (data, energy) of a rejected structure, the energy being an upper
+        bound of its minimized energy and data marked 'screened', so that
+        it is not taken for a minimum, see is_screened. Returns None to
+        carry on with the tight minimization.
+        """
+        lmp = self.lmp
+        st = self.staged
+        window = st['single_point_window']
+        if window is not None and energy - self.best > window:
+            self.count('single_point')
+            return {**structData, 'screened': True}, energy
+
+        # no energy tolerance, the energy often stalls on the way down
+        ftol, steps = st['coarse_force'], st['coarse_steps']
+        lmp.command(f"minimize 0 {ftol} {steps} {10 * steps}")
+        lmp.command("run 0")
         energy = lmp.extract_variable("potential", None, 0)
+        if lmp.get_natoms() != len(structData['species']):
+            return None  # let the tight minimization deal with it
+
+        if energy - self.best > st['window']:
+            self.count('coarse')
+            minData = self.minimized_data(structData)
+            if not check_constrains(minData):
+                return minData, 1e300
+            minData['screened'] = True
+            return minData, energy
+        return None
+
+    def count(self, stage, report_every=1000):
+        self.stages[stage] += 1
+        if sum(self.stages.values()) % report_every == 0:
+            self.report()
+
+    def report(self):
+        if self.staged is None:
+            return
+        n = sum(self.stages.values())
+        logger.info(
+            f"Staged evaluation: {n} structures, "
+            f"{self.stages['single_point']} rejected after the single point, "
+            f"{self.stages['coarse']} after the coarse minimization, "
+            f"{self.stages['tight']} fully minimized."
+        )
+
+    def close(self):
+        self.report()
+
+    def to_arrays(self):
+        """Reference energy of the staged evaluation, for a checkpoint."""
+        return {'evaluator_best': np.array(self.best)}
+
+    def load_arrays(self, arrays):
+        """Restore the state written by to_arrays."""
+        self.best = float(arrays['evaluator_best'])
+
+    def single_point(self, structData):
+        """Put a structure into the simulation, returns its energy per atom."""
+        self.load(structData)
+        self.lmp.command("run 0")
+        return self.lmp.extract_variable("potential", None, 0)
+
+    def evaluate(self, structData):
+        if not check_constrains(structData):
+            return structData, 1e300
+
+        lmp = self.lmp
+        energy = self.single_point(structData)
+
+        # ------------guard for bad structures---------
 
         if math.isinf(float(energy)):
             return structData, 1e300
@@ -73,43 +308,171 @@ class LammpsEvaluator:
             return structData, 1e300
         # ---------------------------------------------
 
+        if self.staged is not None:
+            rejected = self.screen(structData, energy)
+            if rejected is not None:
+                return rejected
+
         lmp.command("minimize 1.0e-8 1.0e-8 10000 10000")
-        lmp.command("write_data min.geo")
-        lmp.command("run 0 pre no")
+        lmp.command("run 0")
 
         energy = lmp.extract_variable("potential", None, 0)
 
-        # lost ignore: compare number of atoms written and expected
-        expected_natom = lmp.get_natoms()
-        with open("min.geo") as f:
-            for i, line in enumerate(f):
-                if i == 2:
-                    natom = int(line.split()[0])
-                    break
-        if natom != expected_natom:
+        # lost ignore: compare number of atoms left and expected
+        if lmp.get_natoms() != len(structData['species']):
             return structData, 1e300
 
-        minstruct = LammpsData.from_file(
-            "min.geo", atom_style="atomic"
-        ).structure
+        return self.finish(self.minimized_data(structData), energy)
+
+    def finish(self, minData, energy):
+        """Result of a minimized structure."""
+        if not check_constrains(minData):
+            logger.info('Minimized structure failed constraints, skipped.')
+            return minData, 1e300
+
+        if self.staged is not None:
+            self.count('tight')
+            self.best = min(self.best, energy)
 
-        ID = hashfunc(str(minstruct.as_dict()).encode()).hexdigest()[:6]
+        return minData, energy
 
-        minData, mineng = struc2param(
-            minstruct,
-            energy,
-            structData['constraint'],
-            CheckFrConstrains=True,
-            # writefile="dumpfile.dat",
+    # ---------------------------------------------------------
+
+    def setup_batch(self, structDatas):
+        """
+        Set up one simulation holding all structDatas, each box placed on
+        a cubic grid with gap Angstrom between neighboring boxes. Returns
+        the offset of each box and the first atom ID of each structure.
+        """
+        lmp = self.lmp
+        self.clear()
+        self.setup_key = None  # a warm evaluate needs its own set up again
+        Ms = [s['lattice'].matrix for s in structDatas]
+        # extent of the boxes, coordinates are in [0, extent)
+        cell = np.max([np.abs(M).sum(axis=0) for M in Ms], axis=0)
+        cell += self.batch['gap']
+        nside = math.ceil(len(structDatas) ** (1 / 3) - 1e-9)
+        grid = np.indices((nside,) * 3).reshape(3, -1).T[: len(structDatas)]
+        offsets = grid * cell
+
+        species = {sp for s in structDatas for sp in s['species']}
+        elements = sorted(Element(el) for el in species)
+        self.typemap = {el.symbol: i + 1 for i, el in enumerate(elements)}
+        xhi, yhi, zhi = nside * cell
+        lmp.command(f"region box block 0 {xhi} 0 {yhi} 0 {zhi} units box")
+        lmp.command(f"create_box {len(elements)} box")
+        for el in elements:
+            lmp.command(
+                f"mass {self.typemap[el.symbol]} {float(el.atomic_mass)}"
+            )
+
+        x = np.concatenate(
+            [
+                (get_coords(s['parameters']) % 1.0) @ M + offset
+                for s, M, offset in zip(structDatas, Ms, offsets)
+            ]
         )
+        types = [self.typemap[sp] for s in structDatas for sp in s['species']]
+        lmp.create_atoms(len(x), None, types, x.flatten())
+        self.set_potential()
+        lmp.command("compute peatom all pe/atom")
 
-        if mineng is False:
-            logger.info(f'Structure {ID} failed constraints, skipped.')
-            return minData, 1e300
+        natoms = [len(s['species']) for s in structDatas]
+        first = np.cumsum([1] + natoms[:-1])
+        return offsets, first
+
+    def split_batch(self, structDatas, offsets, first):
+        """
+        Energy per atom and fractional coordinates of each structure of a
+        batch simulation, or (None, None) for a structure that lost atoms,
+        in the simulation or out of its own box.
+        """
+        lmp = self.lmp
+        lmp.command("run 0")
+        ids = np.array(lmp.numpy.extract_atom("id"))
+        x = np.array(lmp.numpy.extract_atom("x"))
+        pe = np.array(
+            lmp.numpy.extract_compute(
+                "peatom", LMP_STYLE_ATOM, LMP_TYPE_VECTOR
+            )
+        )
+        order = np.argsort(ids)
+        ids, x, pe = ids[order], x[order], pe[order]
+        which = np.searchsorted(first, ids, side='right') - 1
+
+        results = []
+        for b, (s, offset) in enumerate(zip(structDatas, offsets)):
+            mine = which == b
+            natoms = len(s['species'])
+            if np.count_nonzero(mine) != natoms:
+                results.append((None, None))
+                continue
+            frac = (x[mine] - offset) @ np.linalg.inv(s['lattice'].matrix)
+            if np.any((frac < 0) | (frac >= 1)):
+                results.append((None, None))
+                continue
+            energy = float(np.sum(pe[mine])) / natoms
+            results.append((energy, frac.flatten()))
+        return results
+
+    def evaluate_batch(self, structDatas):
+        """
+        Evaluate a list of structures, results are in input order. With
+        'batch' set, up to 'size' structures are minimized together in one
+        simulation, which saves the set up and per run overhead that
+        dominates for small clusters. Each structure is checked on its own
+        for bad energies and lost atoms. The minimization stops on the
+        criteria of the whole batch, so results can differ slightly from
+        minimizing the structures one by one.
+        """
+        if self.batch is None:
+            return [self.evaluate(s) for s in structDatas]
+
+        results = [(s, 1e300) for s in structDatas]
+        todo = [i for i, s in enumerate(structDatas) if check_constrains(s)]
+        size = self.batch['size']
+        for start in range(0, len(todo), size):
+            chunk = todo[start : start + size]
+            batch = [structDatas[i] for i in chunk]
+            for i, result in zip(chunk, self.minimize_batch(batch)):
+                results[i] = result
+        return results
+
+    def minimize_batch(self, structDatas):
+        lmp = self.lmp
+        offsets, first = self.setup_batch(structDatas)
+
+        # ------------guard for bad structures---------
+
+        bad = [
+            b
+            for b, (energy, _) in enumerate(
+                self.split_batch(structDatas, offsets, first)
+            )
+            if energy is None or not math.isfinite(energy)
+        ]
+        for b in bad:
+            last = first[b] + len(structDatas[b]['species']) - 1
+            lmp.command(f"group bad id {first[b]}:{last}")
+            lmp.command("delete_atoms group bad compress no")
+            lmp.command("group bad delete")
+        # ---------------------------------------------
 
-        # output structure to xyz file
-        XYZ(minstruct).write_file(f'structures/{ID}.xyz')
-        open('dumpfile.dat', 'a').write(f"{time.time()} {ID} {mineng}\n")
-        logger.info(f"Output structure {ID}.")
+        if len(bad) < len(structDatas):
+            lmp.command("minimize 1.0e-8 1.0e-8 10000 10000")
 
-        return minData, mineng
+        results = []
+        for s, (energy, frac) in zip(
+            structDatas, self.split_batch(structDatas, offsets, first)
+        ):
+            if energy is None:
+                results.append((s, 1e300))
+                continue
+            minData = {
+                "lattice": s['lattice'],
+                "parameters": frac,
+                "species": s['species'].copy(),
+                "constraint": s['constraint'],
+            }
+            results.append(self.finish(minData, energy))
+        return results
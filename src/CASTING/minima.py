@@ -0,0 +1,84 @@
+"""
+Index of the relaxed minima of the MCTS tree nodes, used to merge
+expansions that relax into a minimum the tree already has.
+"""
+
+import numpy as np
+
+from CASTING.cache import fingerprint
+
+from . import logger
+
+
+class MinimaIndex(object):
+    """
+    Node of each relaxed minimum by fingerprint (sorted pair distances per
+    species pair, rounded to tolerance), with duplicate statistics.
+    """
+
+    def __init__(self, tolerance=0.01, report_every=100):
+        """
+        :tolerance: pair distances are compared to within this (Angstrom).
+        :report_every: number of expansions between log reports.
+        """
+        self.tolerance = tolerance
+        self.report_every = report_every
+        self.nodes = {}  # fingerprint -> node
+        self.nexpansions = 0
+        self.nduplicates = 0
+        self.nsaved = 0  # playout evaluations skipped
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def lookup(self, structData):
+        """(fingerprint, node with that minimum or None) of structData."""
+        key = fingerprint(structData, self.tolerance)
+        return key, self.nodes.get(key)
+
+    def add(self, key, node):
+        """Record the minimum of a node, keeps the first node."""
+        self.nodes.setdefault(key, node)
+
+    def duplicate(self, nsaved):
+        """Record an expansion merged into an existing node."""
+        self.nduplicates += 1
+        self.nsaved += nsaved
+        self.count()
+
+    def count(self):
+        """Count an expansion."""
+        self.nexpansions += 1
+        if self.nexpansions % self.report_every == 0:
+            self.report()
+
+    @property
+    def duplicate_rate(self):
+        return self.nduplicates / self.nexpansions if self.nexpansions else 0.0
+
+    def report(self):
+        logger.info(
+            f"Duplicate minima: {self.nduplicates} of {self.nexpansions} "
+            f"expansions ({100 * self.duplicate_rate:.1f}%), "
+            f"{self.nsaved} playout evaluations saved, "
+            f"{len(self.nodes)} distinct minima."
+        )
+
+    # ---------------------------------------------------------
+
+    def to_arrays(self):
+        return {
+            'minima_keys': np.array(list(self.nodes), dtype=str),
+            'minima_nodes': np.array(list(self.nodes.values()), dtype=np.int64),
+            'minima_stats': np.array(
+                [self.nexpansions, self.nduplicates, self.nsaved],
+                dtype=np.int64,
+            ),
+        }
+
+    def load_arrays(self, arrays):
+        """Restore the state written by to_arrays."""
+        keys, nodes = arrays['minima_keys'], arrays['minima_nodes']
+        self.nodes = {str(k): int(n) for k, n in zip(keys, nodes)}
+        stats = arrays['minima_stats']
+        self.nexpansions, self.nduplicates, self.nsaved = map(int, stats)
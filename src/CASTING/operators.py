@@ -0,0 +1,589 @@
+"""
+Mutation operators of the search, drawn with the probabilities of the
+perturbation block of the inputs.
+
+Each operator makes n candidates from a structure in one call and may
+return fewer, e.g. none when adding an atom to a cluster that already has
+max_num_atoms atoms. The missing candidates are made by displacement.
+"""
+
+import pickle
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from CASTING.clusterfun import get_coords, pair_table
+from CASTING.perturb import perturbate
+from CASTING.utilis import get_lattice
+
+from . import logger
+
+# operator names, prob_<name> is the probability of an operator
+names = [
+    'displace',
+    'add_atom',
+    'del_atom',
+    'mutate_atom',
+    'mutate_lattice_length',
+    'mutate_lattice_ang',
+    'slicing',
+    'merging',
+    'crossover',
+]
+
+
+def bond_lengths(constraint):
+    """
+    Smallest allowed pair distance and largest bonded pair distance that
+    hold for every species pair of the composition.
+    """
+    species = sorted(constraint['composition'])
+    rmin = pair_table(constraint['min_atom_pair_distance'], species).max()
+    rmax = pair_table(constraint['max_atom_pair_distance'], species).min()
+    return rmin, rmax
+
+
+def cartesian(structData):
+    frac = get_coords(np.asarray(structData['parameters'], dtype=float))
+    return frac @ structData['lattice'].matrix
+
+
+def with_atoms(structData, x, species):
+    """
+    structData with the atoms at cartesian positions x, None if an atom is
+    out of the box.
+    """
+    frac = x @ np.linalg.inv(structData['lattice'].matrix)
+    if np.any((frac < 0) | (frac > 1)):
+        return None
+    return {
+        "lattice": structData['lattice'],
+        "parameters": frac.flatten(),
+        "species": list(species),
+        "constraint": structData['constraint'],
+    }
+
+
+def join(x, y, away, rmin, rmax, steps=5):
+    """
+    y moved along the unit vector away, pointing from x to y, so that the
+    closest pair of an atom of x and one of y is at a bond length,
+    halfway between rmin and the bond lengths of add_atom.
+    """
+    target = 0.75 * rmin + 0.25 * rmax
+    for _ in range(steps):
+        d = np.min(np.linalg.norm(x[:, None] - y[None], axis=-1))
+        if abs(d - target) < 0.01:
+            break
+        y = y + (target - d) * away
+    return y
+
+
+def random_directions(rng, n):
+    u = rng.standard_normal((n, 3))
+    return u / np.linalg.norm(u, axis=1)[:, None]
+
+
+class MutationOperators(object):
+    """
+    Draws the candidates of the search, each with an operator drawn with
+    its probability, and keeps statistics per operator of the evaluated
+    candidates: the fraction accepted, i.e. passing the constraints and
+    relaxing without losing atoms, and the fraction improved, i.e. relaxing
+    below the energy of the structure it was made from. Energies are per
+    atom, so a candidate with another number of atoms is compared with the
+    lowest energy found so far at its number of atoms instead.
+
+    Merging and crossover combine the structure with a partner from a pool
+    of the lowest energy structures evaluated so far.
+
+    An evaluation is wasted if the candidate fails or relaxes back into
+    the minimum it was made from. With adaptive, the length of the
+    displacements is tuned on the two kinds of waste: every window
+    displacements it is made step_factor times smaller if more failed
+    than came back to their minimum, and larger otherwise. The operator
+    probabilities follow the recent improvement rate of each operator,
+    weighting the configured probabilities.
+    """
+
+    def __init__(
+        self,
+        lattice=None,
+        max_mutation=0.05,
+        strain=0.05,
+        shear=5.0,
+        pool_size=10,
+        report_every=500,
+        seed=None,
+        adaptive=False,
+        window=50,
+        step_factor=1.2,
+        learning_rate=0.05,
+        exploration=0.2,
+        tolerance=1e-4,
+        **probs,
+    ):
+        """
+        :lattice: lattice block of the inputs, the bounds of the lattice
+            mutations. Without it the lattice is not mutated.
+        :max_mutation: length of a displacement, as a fraction of the box.
+        :strain: standard deviation of the relative change of a lattice
+            length.
+        :shear: standard deviation of the change of a lattice angle
+            (degrees).
+        :pool_size: number of structures in the partner pool.
+        :report_every: number of evaluated candidates between reports.
+        :seed: see perturbate.
+        :adaptive: tune the displacement length and the operator
+            probabilities during the run.
+        :window: number of displacements between step length updates.
+        :step_factor: factor the step length is changed by, it is kept
+            within 10 times max_mutation either way.
+        :learning_rate: weight of the last result in the running
+            improvement rate of an operator.
+        :exploration: share of the configured probabilities kept in the
+            adapted ones.
+        :tolerance: energies closer than this (eV/atom) are the same
+            minimum.
+        :probs: prob_<operator> for each operator name, 0.125 by default,
+            except prob_displace which defaults to the probability left by
+            the others.
+        """
+        p = {name: probs.pop(f'prob_{name}', 0.125) for name in names[1:]}
+        p['displace'] = probs.pop(
+            'prob_displace', max(0.0, 1.0 - sum(p.values()))
+        )
+        if probs:
+            raise ValueError(f"Unknown perturbation parameters {list(probs)}.")
+        self.p = np.array([p[name] for name in names], dtype=float)
+        if np.any(self.p < 0) or self.p.sum() <= 0:
+            raise ValueError("Perturbation probabilities must be >= 0.")
+        self.p /= self.p.sum()
+        self.prior = self.p.copy()
+
+        L = lattice or {}
+        self.length_bounds = np.array(
+            [
+                [
+                    L.get(f'{m}_{k}', np.nan) + 2.0 * L.get(f'pad_{k}', 0.0)
+                    for k in 'abc'
+                ]
+                for m in ('min', 'max')
+            ]
+        )
+        self.angle_bounds = np.array(
+            [
+                [L.get(f'{m}_{k}', np.nan) for k in ('alpha', 'beta', 'gamma')]
+                for m in ('min', 'max')
+            ]
+        )
+        self.strain = strain
+        self.shear = shear
+
+        self.displacement = perturbate(max_mutation, seed)
+        self.rng = self.displacement.rng
+        self.operators = {name: getattr(self, name) for name in names[1:]}
+        self.pool = []  # (energy, structData), lowest first
+        self.pool_size = pool_size
+
+        self.drawn = dict.fromkeys(names, 0)
+        self.evaluated = dict.fromkeys(names, 0)
+        self.accepted = dict.fromkeys(names, 0)
+        self.improved = dict.fromkeys(names, 0)
+        self.repeated = dict.fromkeys(names, 0)
+        self.report_every = report_every
+        self.nevaluated = 0
+        self.best_by_size = {}  # number of atoms -> lowest energy
+
+        self.adaptive = adaptive
+        self.window = window
+        self.step_factor = step_factor
+        self.step_bounds = (0.1 * max_mutation, 10.0 * max_mutation)
+        self.learning_rate = learning_rate
+        self.exploration = exploration
+        self.tolerance = tolerance
+        self.rate = np.full(len(names), 0.2)  # running improvement rates
+        self.nfailed = self.nrepeated = self.ndisplaced = 0
+
+    # ---------------------------------------------------------
+
+    def perturb_many(self, structData, n, depth, a, maxdepth):
+        """n candidates made from structData."""
+        counts = self.rng.multinomial(n, self.p)
+        candidates, made_by = [], []
+        for name, count in zip(names[1:], counts[1:]):
+            if count:
+                made = self.operators[name](structData, count)
+                candidates += made
+                made_by += [name] * len(made)
+        if len(candidates) < n:
+            candidates += self.displacement.perturb_many(
+                structData, n - len(candidates), depth, a, maxdepth
+            )
+            made_by += ['displace'] * (n - len(made_by))
+
+        # the operator travels with the candidate to update
+        for candidate, name in zip(candidates, made_by):
+            candidate['operator'] = name
+            self.drawn[name] += 1
+        return candidates
+
+    def perturb(self, structData, depth, a, maxdepth):
+        return self.perturb_many(structData, 1, depth, a, maxdepth)[0]
+
+    def update(self, candidates, results, reference, natoms):
+        """
+        Record the results of evaluated candidates.
+        :reference: energy of the structure the candidates were made from.
+        :natoms: number of atoms of that structure.
+        """
+        for candidate, (relaxed, score) in zip(candidates, results):
+            name = candidate.pop('operator', None)
+            if name is None:
+                continue
+            self.evaluated[name] += 1
+            self.nevaluated += 1
+            failed = score >= 1e300
+            size = len(relaxed['species'])
+            ref = reference if size == natoms else self.best_by_size.get(size)
+            compared = not failed and ref is not None
+            repeated = compared and abs(score - ref) <= self.tolerance
+            improved = compared and score < ref - self.tolerance
+            if not failed:
+                best = self.best_by_size.get(size, np.inf)
+                self.best_by_size[size] = min(best, score)
+                self.accepted[name] += 1
+                self.repeated[name] += repeated
+                self.improved[name] += improved
+                self.keep(relaxed, score)
+            if self.adaptive:
+                self.adapt(name, failed, repeated, improved)
+            if self.nevaluated % self.report_every == 0:
+                self.report()
+
+    def adapt(self, name, failed, repeated, improved):
+        """Update the step length and the probabilities with a result."""
+        i = names.index(name)
+        self.rate[i] += self.learning_rate * (improved - self.rate[i])
+        w = self.prior * self.rate
+        if w.sum() > 0:
+            self.p = (1.0 - self.exploration) * w / w.sum()
+            self.p += self.exploration * self.prior
+
+        if name != 'displace':
+            return
+        self.nfailed += failed
+        self.nrepeated += repeated
+        self.ndisplaced += 1
+        if self.ndisplaced < self.window:
+            return
+        step = self.displacement.max_mutation
+        if self.nfailed > self.nrepeated:
+            step /= self.step_factor
+        elif self.nrepeated > self.nfailed:
+            step *= self.step_factor
+        step = np.clip(step, *self.step_bounds)
+        self.displacement.max_mutation = float(step)
+        self.nfailed = self.nrepeated = self.ndisplaced = 0
+
+    def keep(self, structData, energy):
+        """Add a structure to the partner pool if it is among the best."""
+        if len(self.pool) == self.pool_size and energy >= self.pool[-1][0]:
+            return
+        # a structure with the same energy is most likely the same minimum
+        if any(abs(energy - e) < 1e-6 for e, _ in self.pool):
+            return
+        self.pool.append((energy, structData))
+        self.pool.sort(key=lambda item: item[0])
+        del self.pool[self.pool_size :]
+
+    def report(self):
+        for name in names:
+            n = self.evaluated[name]
+            if n == 0:
+                continue
+            wasted = n - self.accepted[name] + self.repeated[name]
+            logger.info(
+                f"Operator {name}: {self.drawn[name]} drawn, {n} evaluated, "
+                f"{100 * self.accepted[name] / n:.1f}% accepted, "
+                f"{100 * self.improved[name] / n:.1f}% improved, "
+                f"{100 * wasted / n:.1f}% wasted."
+            )
+        if self.adaptive:
+            p = ', '.join(
+                f"{name} {p:.3f}" for name, p in zip(names, self.p) if p > 0
+            )
+            logger.info(
+                f"Displacement length {self.displacement.max_mutation:.4f}, "
+                f"operator probabilities: {p}."
+            )
+
+    def to_arrays(self):
+        """
+        State of the operators for a checkpoint: partner pool, statistics,
+        adapted probabilities and step length and the random generator.
+        """
+        state = {
+            name: getattr(self, name)
+            for name in (
+                'pool',
+                'drawn',
+                'evaluated',
+                'accepted',
+                'improved',
+                'repeated',
+                'nevaluated',
+                'best_by_size',
+                'p',
+                'rate',
+                'nfailed',
+                'nrepeated',
+                'ndisplaced',
+            )
+        }
+        state['max_mutation'] = self.displacement.max_mutation
+        state['rng_state'] = self.rng.bit_generator.state
+        state = pickle.dumps(state)
+        return {'operators_state': np.frombuffer(state, dtype=np.uint8)}
+
+    def load_arrays(self, arrays):
+        """Restore the state written by to_arrays."""
+        state = pickle.loads(arrays['operators_state'].tobytes())
+        self.displacement.max_mutation = state.pop('max_mutation')
+        self.rng.bit_generator.state = state.pop('rng_state')
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    # ---------------------------------------------------------
+
+    def partner(self):
+        """Randomly rotated pool structure, centred on the origin."""
+        _, structData = self.pool[self.rng.integers(len(self.pool))]
+        y = cartesian(structData)
+        y = Rotation.random(random_state=self.rng).apply(y - y.mean(axis=0))
+        return y, structData['species']
+
+    def add_atom(self, structData, n):
+        """
+        An atom of a species drawn by the composition, at a bond length
+        from a random atom and at least the minimum pair distance away
+        from all others.
+        """
+        C = structData['constraint']
+        x = cartesian(structData)
+        if len(x) >= C['max_num_atoms']:
+            return []
+        rmin, rmax = bond_lengths(C)
+        elements = list(C['composition'])
+        w = np.array([C['composition'][el] for el in elements], dtype=float)
+        new = self.rng.choice(len(elements), n, p=w / w.sum())
+
+        # directions overlapping other atoms are drawn again
+        pos = np.full((n, 3), np.nan)
+        todo = np.arange(n)
+        for _ in range(10):
+            i = self.rng.integers(len(x), size=len(todo))
+            d = self.rng.uniform(rmin, 0.5 * (rmin + rmax), len(todo))
+            p = x[i] + random_directions(self.rng, len(todo)) * d[:, None]
+            dmin = np.min(np.linalg.norm(p[:, None] - x[None], axis=-1), 1)
+            ok = dmin >= rmin
+            pos[todo[ok]] = p[ok]
+            todo = todo[~ok]
+            if not len(todo):
+                break
+
+        made = []
+        for k in np.flatnonzero(np.isfinite(pos[:, 0])):
+            species = structData['species'] + [elements[new[k]]]
+            s = with_atoms(structData, np.vstack([x, pos[k]]), species)
+            if s is not None:
+                made.append(s)
+        return made
+
+    def del_atom(self, structData, n):
+        """A random atom removed, atoms with fewer neighbours more often."""
+        C = structData['constraint']
+        frac = get_coords(np.asarray(structData['parameters'], dtype=float))
+        N = len(frac)
+        if N <= C['min_num_atoms']:
+            return []
+        _, rmax = bond_lengths(C)
+        x = frac @ structData['lattice'].matrix
+        D = np.linalg.norm(x[:, None] - x[None], axis=-1)
+        w = 1.0 / np.maximum(np.count_nonzero(D <= rmax, axis=1) - 1, 1)
+        removed = self.rng.choice(N, n, p=w / w.sum())
+
+        species = np.array(structData['species'])
+        keep = np.ones((n, N), dtype=bool)
+        keep[np.arange(n), removed] = False
+        return [
+            {
+                "lattice": structData['lattice'],
+                "parameters": frac[k].flatten(),
+                "species": species[k].tolist(),
+                "constraint": C,
+            }
+            for k in keep
+        ]
+
+    def mutate_atom(self, structData, n):
+        """The species of two atoms of different species swapped."""
+        species = np.array(structData['species'])
+        if len(set(structData['species'])) < 2:
+            return []
+        x = np.array(structData['parameters'], dtype=float)
+        made = []
+        for i in self.rng.integers(len(species), size=n):
+            j = self.rng.choice(np.flatnonzero(species != species[i]))
+            swapped = species.copy()
+            swapped[[i, j]] = species[[j, i]]
+            made.append(
+                {
+                    "lattice": structData['lattice'],
+                    "parameters": x,
+                    "species": swapped.tolist(),
+                    "constraint": structData['constraint'],
+                }
+            )
+        return made
+
+    def _mutate_lattice(self, structData, n, which, bounds, change):
+        """
+        One lattice parameter of each candidate changed by change and
+        clipped to its bounds, the fractional coordinates are kept, so the
+        cluster is strained with the box.
+        """
+        free = np.flatnonzero(bounds[1] > bounds[0])
+        if not len(free):
+            return []
+        lattice = structData['lattice']
+        params = np.tile(np.concatenate([lattice.abc, lattice.angles]), (n, 1))
+        k = self.rng.choice(free, n)
+        rows = np.arange(n)
+        params[rows, which + k] = np.clip(
+            change(params[rows, which + k]), bounds[0, k], bounds[1, k]
+        )
+        made = []
+        for a, b, c, alpha, beta, gamma in params:
+            new = get_lattice(
+                a=a, b=b, c=c, alpha=alpha, beta=beta, gamma=gamma
+            )
+            if np.all(np.isfinite(new.matrix)):
+                made.append({**structData, "lattice": new})
+        return made
+
+    def mutate_lattice_length(self, structData, n):
+        """A lattice length changed by a random strain."""
+        return self._mutate_lattice(
+            structData,
+            n,
+            0,
+            self.length_bounds,
+            lambda v: v * (1.0 + self.strain * self.rng.standard_normal(n)),
+        )
+
+    def mutate_lattice_ang(self, structData, n):
+        """A lattice angle changed by a random shear."""
+        return self._mutate_lattice(
+            structData,
+            n,
+            3,
+            self.angle_bounds,
+            lambda v: v + self.shear * self.rng.standard_normal(n),
+        )
+
+    def slicing(self, structData, n):
+        """
+        The atoms on one side of a random plane through the centre rotated
+        by a random angle about the plane normal, and moved along it to a
+        bond length from the other atoms.
+        """
+        x = cartesian(structData)
+        c = x.mean(axis=0)
+        rmin, rmax = bond_lengths(structData['constraint'])
+        normal = random_directions(self.rng, n)
+        angle = self.rng.uniform(0.0, 2.0 * np.pi, n)
+        R = Rotation.from_rotvec(normal * angle[:, None]).as_matrix()
+        y = np.einsum('kij,nj->kni', R, x - c) + c
+        side = (x - c) @ normal.T > 0.0
+        made = []
+        for k in range(n):
+            moved = side[:, k]
+            if moved.all() or not moved.any():
+                continue
+            z = x.copy()
+            z[moved] = join(x[~moved], y[k, moved], normal[k], rmin, rmax)
+            s = with_atoms(structData, z, structData['species'])
+            if s is not None:
+                made.append(s)
+        return made
+
+    def merging(self, structData, n):
+        """
+        The structure with a random number of the atoms of a pool partner
+        superposed on it that are at least the minimum pair distance away
+        from its atoms, the ones closest to the centre first.
+        """
+        C = structData['constraint']
+        x = cartesian(structData)
+        room = C['max_num_atoms'] - len(x)
+        if not self.pool or room <= 0:
+            return []
+        rmin, _ = bond_lengths(C)
+        c = x.mean(axis=0)
+        made = []
+        for _ in range(n):
+            y, species = self.partner()
+            dmin = np.min(np.linalg.norm(y[:, None] + c - x[None], axis=-1), 1)
+            free = np.flatnonzero(dmin >= rmin)
+            if not len(free):
+                continue
+            free = free[np.argsort(np.linalg.norm(y[free], axis=1))]
+            free = free[: self.rng.integers(1, min(room, len(free)) + 1)]
+            s = with_atoms(
+                structData,
+                np.vstack([x, y[free] + c]),
+                structData['species'] + [species[i] for i in free],
+            )
+            if s is not None:
+                made.append(s)
+        return made
+
+    def crossover(self, structData, n):
+        """
+        Cut and splice (Deaven and Ho, PRL 75, 288): the atoms of the
+        structure on one side of a random plane joined with the atoms of a
+        pool partner on the other side, with the number of atoms of the
+        structure, joined at a bond length.
+        """
+        x = cartesian(structData)
+        N = len(x)
+        if not self.pool or N < 2:
+            return []
+        rmin, rmax = bond_lengths(structData['constraint'])
+        c = x.mean(axis=0)
+        made = []
+        for u in random_directions(self.rng, n):
+            y, species = self.partner()
+            k = self.rng.integers(1, N)  # atoms kept from the structure
+            if len(y) < N - k:
+                continue
+            px, py = (x - c) @ u, y @ u
+            mine = np.argsort(-px)[:k]
+            theirs = np.argsort(py)[: N - k]
+            # cut planes halfway between the kept and the dropped atoms,
+            # put on top of each other
+            sx, sy = np.sort(-px), np.sort(py)
+            cut_x = -0.5 * (sx[k - 1] + sx[k])
+            cut_y = sy[N - k - 1 : N - k + 1].mean()
+            y = y[theirs] + c + (cut_x - cut_y) * u
+            z = np.vstack([x[mine], join(x[mine], y, -u, rmin, rmax)])
+            s = with_atoms(
+                structData,
+                z,
+                [structData['species'][i] for i in mine]
+                + [species[i] for i in theirs],
+            )
+            if s is not None:
+                made.append(s)
+        return made
@@ -4,245 +4,722 @@ Created on 2022-12-13 20:36:01.409428
 """
 
 
-from math import log
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 
 import numpy as np
 
+from CASTING.checkpoint import load_checkpoint, save_checkpoint
+from CASTING.clusterfun import (
+    check_constrains,
+    is_screened,
+    screen_constrains,
+)
+from CASTING.tree import MCTSTree
+
+from . import logger
+
+
+def evaluate_all(candidates, evaluate, evaluate_batch=None):
+    """
+    Evaluate candidates in order, as a batch if supported. Candidates that
+    fail the constraints are scored 1e300, as the evaluators would, without
+    being passed to the evaluator.
+    """
+    valid = screen_constrains(candidates)
+    results = [(data, 1e300) for data in candidates]
+    todo = [data for data, ok in zip(candidates, valid) if ok]
+    if evaluate_batch is not None:
+        evaluated = evaluate_batch(todo) if todo else []
+    else:
+        evaluated = [evaluate(data) for data in todo]
+    for i, result in zip(np.flatnonzero(valid), evaluated):
+        results[i] = result
+    return results
+
+
+def submit_all(candidates, submit):
+    """
+    Submit candidates for evaluation, returns their futures. Candidates
+    that fail the constraints get a finished future with score 1e300.
+    """
+    futures = []
+    for data, ok in zip(candidates, screen_constrains(candidates)):
+        if ok:
+            futures.append(submit(data))
+        else:
+            future = Future()
+            future.set_result((data, 1e300))
+            futures.append(future)
+    return futures
+
+
+def submit_one(data, submit):
+    """submit_all for one candidate."""
+    if check_constrains(data):
+        return submit(data)
+    future = Future()
+    future.set_result((data, 1e300))
+    return future
+
+
+def draw_playouts(
+    data,
+    perturbate,
+    depth,
+    a,
+    maxdepth,
+    nplayouts=10,
+    prescreen=None,
+    perturbate_batch=None,
+):
+    """
+    Playout candidates of data, yielded as soon as they are drawn. With a
+    prescreen, more candidates are drawn and the most promising kept.
+
+    :perturbate_batch: function drawing many candidates in one call, see
+        perturb.perturbate.perturb_many.
+    """
+    n = nplayouts if prescreen is None else prescreen.factor * nplayouts
+    if perturbate_batch is not None:
+        pool = perturbate_batch(data, n, depth=depth, a=a, maxdepth=maxdepth)
+    elif prescreen is None:
+        for _ in range(n):
+            yield perturbate(data, depth=depth, a=a, maxdepth=maxdepth)
+        return
+    else:
+        pool = [
+            perturbate(data, depth=depth, a=a, maxdepth=maxdepth)
+            for _ in range(n)
+        ]
+    if prescreen is None:
+        yield from pool
+    else:
+        yield from prescreen.select(pool, nplayouts)
+
 
 def playouts(
-    idx,
-    depthlist,
-    playoutdata,
-    Scorelist,
-    parameterlist,
+    tree,
+    nodeID,
     perturbate,
     evaluate,
     a,
     maxdepth,
     nplayouts=10,
+    evaluate_batch=None,
+    submit=None,
+    prescreen=None,
+    perturbate_batch=None,
+    operators=None,
 ):
-    nodeID = idx
-
-    for i in range(nplayouts):
-        idx += 1
-        playdata = perturbate(
-            parameterlist[nodeID],
-            depth=depthlist[nodeID],
-            a=a,
-            maxdepth=maxdepth,
+    data = tree.data(nodeID)
+    depth = int(tree.depth[nodeID])
+
+    # perturbations are drawn before any evaluation so the random stream
+    # does not depend on whether the evaluations run in parallel
+    candidates, futures = [], []
+    for playdata in draw_playouts(
+        data,
+        perturbate,
+        depth,
+        a,
+        maxdepth,
+        nplayouts,
+        prescreen,
+        perturbate_batch,
+    ):
+        candidates.append(playdata)
+        if submit is not None:
+            futures.append(submit_one(playdata, submit))
+    if submit is not None:
+        results = [future.result() for future in futures]
+    else:
+        results = evaluate_all(candidates, evaluate, evaluate_batch)
+    if prescreen is not None:
+        prescreen.update(candidates, results)
+    if operators is not None:
+        operators.update(
+            candidates, results, tree.score[nodeID], tree.natoms[nodeID]
         )
-        playdata_relaxed, playscore = evaluate(playdata)
-        #        print("Node: {}, Playout: {} Score: {}".format(nodeID,i+1,playscore))
 
-        Scorelist.append(playscore)
-        parameterlist.append(playdata_relaxed)
-        playoutdata[nodeID].append(idx)
-
-    return idx, playoutdata, Scorelist, parameterlist
+    for playdata_relaxed, playscore in results:
+        #        print("Node: {}, Playout: {} Score: {}".format(nodeID,i+1,playscore))
+        tree.add_playout(nodeID, playdata_relaxed, playscore)
 
 
-def expansion_simulation(
+def expand(
+    tree,
     parentID,
-    idx,
-    visits,
-    childlist,
-    parent,
-    depthlist,
-    playoutdata,
-    Scorelist,
-    parameterlist,
     perturbate,
-    evaluate,
     a,
     maxdepth,
     nplayouts=10,
+    on_candidate=None,
+    prescreen=None,
+    perturbate_batch=None,
 ):
-    playindexes = playoutdata[parentID]
-    playscores = [Scorelist[i] for i in playindexes]
-    bestplayindex = playindexes[playscores.index(min(playscores))]
+    """
+    Start an expansion of parentID, returns the new node data and the
+    candidates to evaluate: the node data and its playouts.
+
+    :on_candidate: called with each candidate as soon as it is drawn.
+    """
+    bestplayindex = tree.best_playout(parentID)
 
     # =========== update =============
 
-    idx += 1
-    visits[parentID] += 1
-    visits[idx] = 1
-    try:
-        childlist[parentID].append(idx)
-    except:
-        childlist[parentID] = [idx]
-
-    parent[idx] = parentID
-    depth = depthlist[parentID] + 1
-    depthlist[idx] = depth
-    playoutdata[idx] = []
+    tree.visits[parentID] += 1
+    depth = int(tree.depth[parentID]) + 1
     data = perturbate(
-        parameterlist[bestplayindex], depth=depth, a=a, maxdepth=maxdepth
+        tree.data(bestplayindex), depth=depth, a=a, maxdepth=maxdepth
     )
-    data_relaxed, score = evaluate(data)
-    Scorelist.append(score)
-    parameterlist.append(data)
-
-    idx, playoutdata, Scorelist, parameterlist = playouts(
-        idx,
-        depthlist,
-        playoutdata,
-        Scorelist,
-        parameterlist,
+
+    # the playouts start from the unrelaxed node data, so the node and its
+    # playouts can be evaluated together in one batch
+    candidates = [data]
+    if on_candidate is not None:
+        on_candidate(data)
+    for playdata in draw_playouts(
+        data,
         perturbate,
-        evaluate,
+        depth,
         a,
         maxdepth,
-        nplayouts=nplayouts,
-    )
-
-    return (
-        visits,
-        childlist,
-        parent,
-        depthlist,
-        playoutdata,
-        Scorelist,
-        parameterlist,
-        idx,
+        nplayouts,
+        prescreen,
+        perturbate_batch,
+    ):
+        candidates.append(playdata)
+        if on_candidate is not None:
+            on_candidate(playdata)
+    return data, candidates
+
+
+def add_expansion(tree, parentID, data, results):
+    """Add an evaluated expansion to the tree, returns the new node."""
+    data_relaxed, score = results[0]
+    nodeID = tree.add_node(data, score, parent=parentID)
+    for playdata_relaxed, playscore in results[1:]:
+        tree.add_playout(nodeID, playdata_relaxed, playscore)
+
+    tree.backpropagate(nodeID)
+
+    return nodeID
+
+
+def merge_duplicate(tree, minima, result, playouts):
+    """
+    Look up the relaxed node of an expansion in the minima index. If an
+    existing node has that minimum, the expansion is merged into it: the
+    node gets the visit and the playouts are not evaluated. Returns
+    (fingerprint or None if the node failed, node merged into or None).
+    """
+    relaxed, score = result
+    if score >= 1e300 or is_screened(relaxed):
+        return None, None
+    key, node = minima.lookup(relaxed)
+    if node is not None:
+        tree.visits[node] += 1
+        minima.duplicate(int(np.sum(screen_constrains(playouts))))
+    return key, node
+
+
+def record_minimum(minima, key, nodeID):
+    """Add the minimum of a new node to the minima index."""
+    if key is not None:
+        minima.add(key, nodeID)
+    minima.count()
+
+
+def update_operators(tree, operators, parentID, candidates, results):
+    """
+    Results of the evaluated candidates of an expansion of parentID for
+    the operator statistics: the node is made from the best playout of
+    parentID and the playouts from the node.
+    """
+    best = tree.best_playout(parentID)
+    operators.update(
+        candidates[:1], results[:1], tree.score[best], tree.natoms[best]
     )
+    node, score = results[0]
+    operators.update(candidates[1:], results[1:], score, len(node['species']))
 
 
-def backpropagation_selection(
-    visits,
-    childlist,
-    parent,
-    depthlist,
-    playoutdata,
-    Scorelist,
-    parameterlist,
+def expansion_simulation(
+    tree,
+    parentID,
+    perturbate,
+    evaluate,
+    a,
     maxdepth,
-    exploreconstant=1,
+    nplayouts=10,
+    evaluate_batch=None,
+    submit=None,
+    prescreen=None,
+    perturbate_batch=None,
+    operators=None,
+    minima=None,
 ):
-    def get_linegae(node, childlist):
-        total_list = []
-        try:
-            total_list += childlist[node]
-        except:
-            return total_list
-        for child in childlist[node]:
-            total_list += get_linegae(child, childlist)
-
-        return total_list
-
-    selectionScores = []
-    nodes = list(parent.keys())
-
-    for n in nodes:
-        par = parent[n]
-        depth = depthlist[n]
-        if par is None or depth > maxdepth:
-            selectionScores.append(-1e300)
-
+    """
+    Expand parentID. With submit, each candidate is submitted as soon as it
+    is drawn, so that its evaluation overlaps with drawing the next ones.
+
+    :minima: MinimaIndex, if given the node is evaluated first and the
+        expansion is merged into the existing node with the same relaxed
+        minimum, if any, without evaluating the playouts.
+    """
+    if minima is not None:
+        data, candidates = expand(
+            tree,
+            parentID,
+            perturbate,
+            a,
+            maxdepth,
+            nplayouts=nplayouts,
+            prescreen=prescreen,
+            perturbate_batch=perturbate_batch,
+        )
+        if submit is not None:
+            first = submit_one(data, submit).result()
         else:
-            lineage = get_linegae(n, childlist)
-            allindexes = []
-            for l in [n] + lineage:
-                allindexes += playoutdata[l]
-
-            bestreward = min([Scorelist[i] for i in lineage + allindexes])
-
-            UCB_score = -bestreward + exploreconstant * np.sqrt(
-                log(visits[par]) / visits[n]
+            first = evaluate_all([data], evaluate, evaluate_batch)[0]
+        key, node = merge_duplicate(tree, minima, first, candidates[1:])
+        if node is not None:
+            if operators is not None:
+                update_operators(tree, operators, parentID, [data], [first])
+            return node
+        if submit is not None:
+            futures = submit_all(candidates[1:], submit)
+            results = [first] + [future.result() for future in futures]
+        else:
+            results = [first] + evaluate_all(
+                candidates[1:], evaluate, evaluate_batch
             )
+    elif submit is not None:
+        futures = []
 
-            selectionScores.append(UCB_score)
+        def start(candidate):
+            futures.append(submit_one(candidate, submit))
 
-    c = zip(selectionScores, nodes)
-    c = sorted(c, key=lambda x: -x[0])
-    selectionScores, nodes = zip(*c)
+        data, candidates = expand(
+            tree,
+            parentID,
+            perturbate,
+            a,
+            maxdepth,
+            nplayouts=nplayouts,
+            on_candidate=start,
+            prescreen=prescreen,
+            perturbate_batch=perturbate_batch,
+        )
+        results = [future.result() for future in futures]
+    else:
+        data, candidates = expand(
+            tree,
+            parentID,
+            perturbate,
+            a,
+            maxdepth,
+            nplayouts=nplayouts,
+            prescreen=prescreen,
+            perturbate_batch=perturbate_batch,
+        )
+        results = evaluate_all(candidates, evaluate, evaluate_batch)
+    if prescreen is not None:
+        prescreen.update(candidates[1:], results[1:])
+    if operators is not None:
+        update_operators(tree, operators, parentID, candidates, results)
+    nodeID = add_expansion(tree, parentID, data, results)
+    if minima is not None:
+        record_minimum(minima, key, nodeID)
+    return nodeID
 
-    return nodes[0]
 
+def backpropagation_selection(tree, maxdepth, exploreconstant=1):
+    return tree.select(maxdepth, exploreconstant=exploreconstant)
 
-def MCTS(
+
+def start_tree(
     rootdata,
     perturbate,
     evaluate,
-    niterations=200,
-    headexpand=10,
-    nexpand=3,
-    nsimulate=3,
     nplayouts=10,
-    exploreconstant=1,
     maxdepth=12,
     a=3,
     selected_node=0,
+    evaluate_batch=None,
+    checkpoint=None,
+    resume=False,
+    submit=None,
+    prescreen=None,
+    perturbate_batch=None,
+    operators=None,
+    minima=None,
+    evaluator=None,
 ):
-    if selected_node == 0:
-        visits = {0: 1}
-        childlist = {0: []}
-        parent = {0: None}
-        depthlist = {0: 0}
-        playoutdata = {0: []}
+    """
+    Tree of a new search with the evaluated root and its playouts, or the
+    tree stored in checkpoint, returns (tree, iteration, selected_node).
+    """
+    if resume and checkpoint is not None and os.path.exists(checkpoint):
+        tree, start, selected_node = load_checkpoint(
+            checkpoint, minima, operators, prescreen, evaluator
+        )
+
+    else:
+        if resume:
+            raise FileNotFoundError(f"No checkpoint '{checkpoint}' to resume.")
+        if selected_node != 0:
+            raise ValueError("A new search starts from selected_node 0.")
+        start = 0
+        tree = MCTSTree()
         data_relaxed, score = evaluate(rootdata)
-        Scorelist = [score]
-        parameterlist = [data_relaxed]
-        idx = 0
+        tree.add_node(data_relaxed, score)
+        if (
+            minima is not None
+            and score < 1e300
+            and not is_screened(data_relaxed)
+        ):
+            minima.add(minima.lookup(data_relaxed)[0], 0)
 
         # =======run playouts for rootnode ==================
 
-        idx, playoutdata, Scorelist, parameterlist = playouts(
-            idx,
-            depthlist,
-            playoutdata,
-            Scorelist,
-            parameterlist,
+        playouts(
+            tree,
+            0,
             perturbate,
             evaluate,
             a,
             maxdepth,
             nplayouts=nplayouts,
+            evaluate_batch=evaluate_batch,
+            submit=submit,
+            prescreen=prescreen,
+            perturbate_batch=perturbate_batch,
+            operators=operators,
         )
+        tree.backpropagate(0)
+
+    return tree, start, selected_node
+
+
+def MCTS(
+    rootdata,
+    perturbate,
+    evaluate,
+    niterations=200,
+    nexpand=3,
+    nplayouts=10,
+    exploreconstant=1,
+    maxdepth=12,
+    a=3,
+    selected_node=0,
+    evaluate_batch=None,
+    checkpoint=None,
+    checkpoint_interval=10,
+    resume=False,
+    submit=None,
+    prescreen=None,
+    perturbate_batch=None,
+    operators=None,
+    minima=None,
+    stop=None,
+    evaluator=None,
+):
+    """
+    :nexpand: number of expansions per iteration, the node to expand is
+        selected again after each.
+    :checkpoint: file the search state is written to every
+        checkpoint_interval iterations and at the end, None to disable.
+    :resume: continue the search stored in checkpoint instead of starting
+        from rootdata.
+    :submit: function submitting one structure for evaluation and
+        returning a concurrent.futures.Future of (relaxed data, score).
+        Used instead of evaluate and evaluate_batch, so that candidates are
+        evaluated while the next ones are drawn.
+    :prescreen: model selecting the playouts worth evaluating among more
+        candidates, e.g. SurrogatePrescreen, None to evaluate all.
+    :perturbate_batch: function drawing all the playouts of a node in one
+        call, e.g. perturbate.perturb_many, None to call perturbate for
+        each.
+    :operators: MutationOperators perturbate draws from, given the results
+        of the candidates for its statistics and partner pool.
+    :minima: MinimaIndex merging expansions that relax into the minimum of
+        an existing node into that node, None to keep them all.
+    :stop: StopCriteria checked after each iteration, ending the search
+        before niterations, None to run all iterations.
+    :evaluator: simulator behind evaluate whose state is saved in the
+        checkpoints, e.g. the reference energy of the staged evaluation of
+        LammpsEvaluator, None if it has none.
+    """
+    tree, start, selected_node = start_tree(
+        rootdata,
+        perturbate,
+        evaluate,
+        nplayouts=nplayouts,
+        maxdepth=maxdepth,
+        a=a,
+        selected_node=selected_node,
+        evaluate_batch=evaluate_batch,
+        checkpoint=checkpoint,
+        resume=resume,
+        submit=submit,
+        prescreen=prescreen,
+        perturbate_batch=perturbate_batch,
+        operators=operators,
+        minima=minima,
+        evaluator=evaluator,
+    )
 
     # =======simulation and expansion==================
 
-    for _ in range(niterations):
+    for iteration in range(start, niterations):
         for _ in range(nexpand):
-            (
-                visits,
-                childlist,
-                parent,
-                depthlist,
-                playoutdata,
-                Scorelist,
-                parameterlist,
-                idx,
-            ) = expansion_simulation(
+            expansion_simulation(
+                tree,
                 selected_node,
-                idx,
-                visits,
-                childlist,
-                parent,
-                depthlist,
-                playoutdata,
-                Scorelist,
-                parameterlist,
                 perturbate,
                 evaluate,
                 a,
                 maxdepth,
                 nplayouts=nplayouts,
+                evaluate_batch=evaluate_batch,
+                submit=submit,
+                prescreen=prescreen,
+                perturbate_batch=perturbate_batch,
+                operators=operators,
+                minima=minima,
             )
 
             selected_node = backpropagation_selection(
-                visits,
-                childlist,
-                parent,
-                depthlist,
-                playoutdata,
-                Scorelist,
-                parameterlist,
+                tree,
                 maxdepth,
                 exploreconstant=exploreconstant,
             )
 
         print(
             "total evaluations: {}, best score yet : {}".format(
-                len(Scorelist), min(Scorelist)
+                len(tree), tree.score[: len(tree)].min()
             )
         )
+
+        done = iteration + 1
+        stopped = stop is not None and stop(tree, minima)
+        if checkpoint is not None and (
+            done % checkpoint_interval == 0
+            or done == niterations
+            or stopped
+        ):
+            save_checkpoint(
+                checkpoint,
+                tree,
+                done,
+                selected_node,
+                minima,
+                operators,
+                prescreen,
+                evaluator,
+            )
+        if stopped:
+            break
+
+    return tree
+
+
+def ParallelMCTS(
+    rootdata,
+    perturbate,
+    evaluate,
+    niterations=200,
+    nexpand=3,
+    nplayouts=10,
+    exploreconstant=1,
+    maxdepth=12,
+    a=3,
+    selected_node=0,
+    evaluate_batch=None,
+    checkpoint=None,
+    checkpoint_interval=10,
+    resume=False,
+    submit=None,
+    nparallel=2,
+    virtual_loss=1,
+    prescreen=None,
+    perturbate_batch=None,
+    operators=None,
+    minima=None,
+    stop=None,
+    evaluator=None,
+):
+    """
+    Tree parallel MCTS: up to nparallel expansions are evaluated at the
+    same time and each is added to the tree as soon as all its evaluations
+    are done. An iteration is nexpand finished expansions, as in MCTS.
+
+    :submit: function submitting one structure for evaluation and
+        returning a concurrent.futures.Future of (relaxed data, score).
+    :nparallel: number of expansions in flight.
+    :virtual_loss: visits counted for each pending expansion of a node
+        during selection, see MCTSTree.select.
+    :prescreen, perturbate_batch, operators: see MCTS.
+    :minima: see MCTS. The node of an expansion is evaluated first and its
+        playouts are only submitted if it is a new minimum.
+    :stop: see MCTS. No expansion is launched once it is met, those in
+        flight are finished.
+    :evaluator: see MCTS.
+
+    Checkpoints hold the finished expansions only, expansions in flight
+    are drawn again on resume.
+    """
+    if submit is None:
+        raise ValueError("ParallelMCTS needs an evaluator with submit.")
+
+    tree, start, selected_node = start_tree(
+        rootdata,
+        perturbate,
+        evaluate,
+        nplayouts=nplayouts,
+        maxdepth=maxdepth,
+        a=a,
+        selected_node=selected_node,
+        evaluate_batch=evaluate_batch,
+        checkpoint=checkpoint,
+        resume=resume,
+        submit=submit,
+        prescreen=prescreen,
+        perturbate_batch=perturbate_batch,
+        operators=operators,
+        minima=minima,
+        evaluator=evaluator,
+    )
+
+    selected_node = tree.select(
+        maxdepth, exploreconstant=exploreconstant, virtual_loss=virtual_loss
+    )
+    total = niterations * nexpand
+    launched = finished = start * nexpand
+    jobs = {}  # future -> expansion it belongs to
+    t0, n0 = time.perf_counter(), len(tree)
+    stopped = False
+
+    while finished < total:
+        # =======selection and expansion==================
+
+        while launched < total and launched - finished < nparallel:
+            parentID = selected_node
+            data, candidates = expand(
+                tree,
+                parentID,
+                perturbate,
+                a,
+                maxdepth,
+                nplayouts=nplayouts,
+                prescreen=prescreen,
+                perturbate_batch=perturbate_batch,
+            )
+            if minima is None:
+                futures = submit_all(candidates, submit)
+            else:
+                futures = [submit_one(data, submit)]
+            # parent, node data, candidates, futures, fingerprint of the node
+            job = [parentID, data, candidates, futures, None]
+            for future in futures:
+                jobs[future] = job
+            tree.pending[parentID] += 1
+            launched += 1
+            selected_node = tree.select(
+                maxdepth,
+                exploreconstant=exploreconstant,
+                virtual_loss=virtual_loss,
+            )
+
+        # =======simulation and backpropagation==================
+
+        done, _ = wait(list(jobs), return_when=FIRST_COMPLETED)
+        for future in done:
+            job = jobs.pop(future)
+            parentID, data, candidates, futures, key = job
+            if any(f in jobs for f in futures):
+                continue
+            results = [f.result() for f in futures]
+
+            node = None
+            if minima is not None and len(futures) == 1:
+                # node evaluated, merge it or submit its playouts
+                key, node = merge_duplicate(
+                    tree, minima, results[0], candidates[1:]
+                )
+                job[4] = key
+                if node is None and len(candidates) > 1:
+                    futures += submit_all(candidates[1:], submit)
+                    for f in futures[1:]:
+                        jobs[f] = job
+                    continue
+
+            if operators is not None:
+                update_operators(
+                    tree, operators, parentID, candidates, results
+                )
+            tree.pending[parentID] -= 1
+            if node is None:
+                if prescreen is not None:
+                    prescreen.update(candidates[1:], results[1:])
+                nodeID = add_expansion(tree, parentID, data, results)
+                if minima is not None:
+                    record_minimum(minima, key, nodeID)
+            finished += 1
+
+            if finished % nexpand:
+                continue
+            elapsed = time.perf_counter() - t0
+            print(
+                "total evaluations: {}, best score yet : {}, "
+                "evaluations/s: {:.2f}".format(
+                    len(tree),
+                    tree.score[: len(tree)].min(),
+                    (len(tree) - n0) / elapsed,
+                )
+            )
+            done_iterations = finished // nexpand
+            if checkpoint is not None and (
+                done_iterations % checkpoint_interval == 0
+                or done_iterations == niterations
+            ):
+                save_checkpoint(
+                    checkpoint,
+                    tree,
+                    done_iterations,
+                    selected_node,
+                    minima,
+                    operators,
+                    prescreen,
+                    evaluator,
+                )
+            if not stopped and stop is not None and stop(tree, minima):
+                stopped, total = True, launched
+
+        # a finished expansion changes the tree, select again
+        selected_node = tree.select(
+            maxdepth,
+            exploreconstant=exploreconstant,
+            virtual_loss=virtual_loss,
+        )
+
+    if stopped and checkpoint is not None:
+        save_checkpoint(
+            checkpoint,
+            tree,
+            finished // nexpand,
+            selected_node,
+            minima,
+            operators,
+            prescreen,
+            evaluator,
+        )
+    elapsed = time.perf_counter() - t0
+    logger.info(
+        f"{len(tree) - n0} evaluations in {elapsed:.1f} s "
+        f"({(len(tree) - n0) / elapsed:.2f} evaluations/s)."
+    )
+    return tree
@@ -0,0 +1,103 @@
+"""
+Asynchronous evaluation of structures.
+
+Asynchronous evaluators have, besides evaluate(structData), a method
+submit(structData) that starts the evaluation and returns a
+concurrent.futures.Future of (relaxed structData, score).
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import logger
+
+# evaluator owned by a worker process
+_evaluator = None
+
+
+def _init_worker(modulename, clsname, pars):
+    global _evaluator
+    sim_module = __import__(f'{modulename}', fromlist=[''])
+    _evaluator = getattr(sim_module, clsname)(pars)
+
+
+def _evaluate(structData):
+    return _evaluator.evaluate(structData)
+
+
+class PoolEvaluator:
+    """
+    Evaluates structures over a pool of worker processes, each of which
+    holds its own simulator instance.
+    """
+
+    def __init__(self, modulename, clsname, pars, num_workers):
+        """
+        :modulename: module of the evaluator class, e.g. 'CASTING.lammpsEvaluate'.
+        :clsname: evaluator class name, e.g. 'LammpsEvaluator'.
+        :pars: parameters passed to the evaluator in every worker.
+        :num_workers: number of worker processes.
+        """
+        self.num_workers = num_workers
+        # spawn, so that no simulator state is inherited from the parent
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(modulename, clsname, pars),
+        )
+        logger.info(f'Started {num_workers} evaluator processes.')
+
+    def evaluate(self, structData):
+        return self.executor.submit(_evaluate, structData).result()
+
+    def submit(self, structData):
+        """Start evaluating a structure, returns a Future of the result."""
+        return self.executor.submit(_evaluate, structData)
+
+    def evaluate_batch(self, structDatas):
+        """Evaluate a list of structures, results are in input order."""
+        return list(self.executor.map(_evaluate, structDatas))
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class ThreadPoolEvaluator:
+    """
+    Makes a synchronous evaluator asynchronous by running its evaluations
+    in background threads, so that the optimizer can prepare the next
+    structures while the simulator is busy.
+    """
+
+    def __init__(self, evaluator, num_threads=1):
+        """
+        :evaluator: evaluator with an evaluate(structData) method.
+        :num_threads: number of evaluations run at the same time. Keep 1
+            for evaluators that are not thread safe, like LammpsEvaluator.
+        """
+        self.evaluator = evaluator
+        self.executor = ThreadPoolExecutor(max_workers=num_threads)
+
+    def evaluate(self, structData):
+        return self.submit(structData).result()
+
+    def submit(self, structData):
+        """Start evaluating a structure, returns a Future of the result."""
+        return self.executor.submit(self.evaluator.evaluate, structData)
+
+    def evaluate_batch(self, structDatas):
+        """Evaluate a list of structures, results are in input order."""
+        return list(self.executor.map(self.evaluator.evaluate, structDatas))
+
+    def close(self):
+        self.executor.shutdown()
+        if hasattr(self.evaluator, 'close'):
+            self.evaluator.close()
+
+
+def as_async(evaluator, num_threads=1):
+    """evaluator if it has submit, otherwise wrapped in ThreadPoolEvaluator."""
+    if hasattr(evaluator, 'submit'):
+        return evaluator
+    return ThreadPoolEvaluator(evaluator, num_threads=num_threads)
@@ -3,40 +3,80 @@ Created on 2022-12-13 20:36:01.409428
 @author: suvobanik
 """
 
-from random import random
-
 import numpy as np
 
 
 class perturbate(object):
-    def __init__(
-        self,
-        max_mutation,
-    ):
+    def __init__(self, max_mutation, seed=None):
+        """
+        :max_mutation: length of a perturbation, as a fraction of the box.
+        :seed: seed of the random generator of the perturbations. If None
+            the generator draws from the numpy.random stream, so that it is
+            seeded with np.random.seed and restored from checkpoints.
+        """
         self.max_mutation = max_mutation
+        if seed is None:
+            self.rng = np.random.Generator(np.random.get_bit_generator())
+        else:
+            self.rng = np.random.default_rng(seed)
 
-    def scale(self, depth, a, maxdepth):
-        if random() <= 0.2:
-            a = 0
+    def scale(self, depth, a, maxdepth, n=None):
+        """
+        Depth scaling of a perturbation, or an array of n of them, unscaled
+        for one in five.
+        """
+        a = np.where(self.rng.random(n) <= 0.2, 0, a)
         depthscale = np.exp(-a * (depth / maxdepth) ** 2)
         return depthscale
 
+    def perturb_batch(self, structData, n, depth, a, maxdepth):
+        """
+        Parameters of n perturbations of structData, as an (n, 3N) array:
+        random directions of length max_mutation, scaled with the depth,
+        clipped to the box.
+        """
+        x = np.asarray(structData["parameters"], dtype=float)
+        u = self.rng.standard_normal((n, len(x)))
+        length = self.max_mutation * self.scale(depth, a, maxdepth, n)
+        u *= (length / np.linalg.norm(u, axis=1))[:, None]
+        u += x
+        return np.clip(u, 0, 1, out=u)
+
+    def perturb_many(self, structData, n, depth, a, maxdepth):
+        """perturb_batch as a list of structures."""
+        X = self.perturb_batch(structData, n, depth, a, maxdepth)
+        return perturbed_structures(structData, X)
+
     def perturb(self, structData, depth, a, maxdepth):
-        x = structData["parameters"].copy()
-        species = structData["species"].copy()
-        u = np.random.normal(0.0, 1.0, len(x))
-        delta = (
-            (u / np.linalg.norm(u))
-            * self.max_mutation
-            * self.scale(depth, a, maxdepth)
+        # same draws as perturb_batch with n = 1
+        u = self.rng.standard_normal(len(structData["parameters"]))
+        scale = self.scale(depth, a, maxdepth)
+        x = structData["parameters"] + u * (
+            self.max_mutation * scale / np.linalg.norm(u)
         )
-        x += delta
         x[x > 1] = 1
         x[x < 0] = 0
 
         return {
+            "lattice": structData['lattice'],
+            "parameters": x,
+            "species": structData["species"].copy(),
+            "constraint": structData['constraint'],
+        }
+
+
+def perturbed_structures(structData, X):
+    """
+    Structures with the lattice, species and constraint of structData and
+    each row of X as parameters. The species list is shared.
+    """
+    species = structData["species"].copy()
+    return [
+        {
             "lattice": structData['lattice'],
             "parameters": x,
             "species": species,
             "constraint": structData['constraint'],
         }
+        for x in X
+    ]
@@ -0,0 +1,191 @@
+"""
+Append-only store of the evaluated structures, replacing dumpfile.dat and
+the per-structure XYZ files.
+"""
+
+import sqlite3
+import threading
+import time
+from hashlib import sha256 as hashfunc
+
+import numpy as np
+from pymatgen.core import Lattice
+
+from CASTING.cache import fingerprint
+from CASTING.clusterfun import get_coords, is_screened
+
+from . import logger
+
+
+class ResultsStore(object):
+    """
+    SQLite table of the minimized structures: time, ID, fingerprint, energy
+    per atom, species, lattice matrix and fractional coordinates. Writes
+    are buffered and the table is indexed on energy and fingerprint, so
+    that the lowest energy structures and the duplicates of a structure
+    are found without reading the whole table.
+    """
+
+    def __init__(self, file='results.db', buffer=100, tolerance=0.01):
+        """
+        :file: SQLite file, results of a resumed run are appended.
+        :buffer: number of structures written at once.
+        :tolerance: pair distance tolerance of the fingerprints (Angstrom).
+        """
+        self.file = file
+        self.buffer = buffer
+        self.tolerance = tolerance
+        self.rows = []
+        # results of submitted evaluations are stored from other threads
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(file, timeout=60, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results (time REAL, id TEXT, "
+            "fingerprint TEXT, energy REAL, species TEXT, lattice BLOB, "
+            "coords BLOB)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS results_energy ON results (energy)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS results_fingerprint "
+            "ON results (fingerprint)"
+        )
+        self.db.commit()
+
+    def add(self, structData, energy):
+        """Append a minimized structure, returns its ID."""
+        lattice = np.ascontiguousarray(structData['lattice'].matrix)
+        coords = get_coords(np.asarray(structData['parameters'], float))
+        species = ' '.join(structData['species'])
+        h = hashfunc(lattice.tobytes())
+        h.update(species.encode())
+        h.update(coords.tobytes())
+        ID = h.hexdigest()[:12]
+        row = (
+            time.time(),
+            ID,
+            fingerprint(structData, self.tolerance),
+            float(energy),
+            species,
+            lattice.tobytes(),
+            coords.tobytes(),
+        )
+        with self.lock:
+            self.rows.append(row)
+            if len(self.rows) >= self.buffer:
+                self._flush()
+        logger.info(f"Output structure {ID}.")
+        return ID
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self.db.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", self.rows
+            )
+            self.db.commit()
+            self.rows = []
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self._flush()
+                self.db.close()
+                self.db = None
+
+    def __len__(self):
+        self.flush()
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @staticmethod
+    def _record(row):
+        ID, fp, energy, species, lattice, coords = row
+        structData = {
+            "lattice": Lattice(np.frombuffer(lattice).reshape(3, 3)),
+            "parameters": np.frombuffer(coords).copy(),
+            "species": species.split(),
+        }
+        return ID, fp, energy, structData
+
+    def lowest(self, n=None, emax=None):
+        """
+        Iterator of (ID, fingerprint, energy, structData) of the stored
+        structures by increasing energy, at most n of them and only those
+        with energy <= emax if given. Rows are read as they are consumed.
+        """
+        self.flush()
+        query = (
+            "SELECT id, fingerprint, energy, species, lattice, coords "
+            "FROM results"
+        )
+        args = []
+        if emax is not None:
+            query += " WHERE energy <= ?"
+            args.append(emax)
+        query += " ORDER BY energy"
+        if n is not None:
+            query += " LIMIT ?"
+            args.append(n)
+        for row in self.db.execute(query, args):
+            yield self._record(row)
+
+    def duplicates(self, structData):
+        """(ID, energy) of the stored structures equivalent to structData."""
+        self.flush()
+        key = fingerprint(structData, self.tolerance)
+        return self.db.execute(
+            "SELECT id, energy FROM results WHERE fingerprint = ?", (key,)
+        ).fetchall()
+
+
+class RecordingEvaluator(object):
+    """
+    Wraps an evaluator and adds the structures it minimizes successfully
+    to a ResultsStore. Runs in the optimizer process, so that the results
+    of pool and distributed workers end up in one store.
+    """
+
+    def __init__(self, evaluator, store):
+        self.evaluator = evaluator
+        self.store = store
+        self.nevaluations = 0  # all results, failed ones included
+
+    def record(self, result):
+        self.nevaluations += 1
+        minData, energy = result
+        if energy < 1e300 and not is_screened(minData):
+            self.store.add(minData, energy)
+        return result
+
+    def evaluate(self, structData):
+        return self.record(self.evaluator.evaluate(structData))
+
+    def submit(self, structData):
+        """
+        Start evaluating a structure with the submit of the wrapped
+        evaluator, returns a Future of the result.
+        """
+
+        def record(future):
+            if future.exception() is None:
+                self.record(future.result())
+
+        future = self.evaluator.submit(structData)
+        future.add_done_callback(record)
+        return future
+
+    def evaluate_batch(self, structDatas):
+        if hasattr(self.evaluator, 'evaluate_batch'):
+            results = self.evaluator.evaluate_batch(structDatas)
+        else:
+            results = [self.evaluator.evaluate(s) for s in structDatas]
+        return [self.record(result) for result in results]
+
+    def close(self):
+        if hasattr(self.evaluator, 'close'):
+            self.evaluator.close()
+        self.store.close()
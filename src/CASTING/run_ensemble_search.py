@@ -0,0 +1,169 @@
+"""
+Ensemble of independent structure searches, over seeds and cluster sizes,
+run over a pool of processes. Each search runs as a structure_search job
+with its own results store and checkpoint in its own directory, and the
+lowest energy structures of all of them are written to one ranking.
+"""
+
+import contextlib
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import CASTING
+import CASTING.run_structure_search as run_structure_search
+from CASTING.clusterfun import createRandomSeeds
+from CASTING.results import ResultsStore
+from CASTING.writer import StructureWriter
+
+logger = CASTING.logger
+
+
+def fixed_size(constraint, natoms):
+    """constraint with natoms atoms, unchanged if natoms is None."""
+    if natoms is None:
+        return constraint
+    return {**constraint, 'min_num_atoms': natoms, 'max_num_atoms': natoms}
+
+
+def run_conf(conf, directory, seed, natoms=None):
+    """
+    Configuration of one search of the ensemble, the files it writes go to
+    directory. With resume, only a search with a checkpoint in directory
+    is resumed. See fixed_size for natoms.
+    """
+    conf = {**conf, 'job_type': 'structure_search', 'seed': seed}
+    conf.pop('ensemble', None)
+    conf['constraint'] = fixed_size(conf['constraint'], natoms)
+    for block, key, default in [
+        ('results', 'file', 'results.db'),
+        ('checkpoint', 'file', 'checkpoint.npz'),
+        # a spool, and its workers, per search
+        ('distributed', 'spool', 'spool'),
+    ]:
+        if block == 'distributed' and block not in conf:
+            continue
+        pars = conf.get(block, {})
+        name = os.path.basename(pars.get(key, default))
+        conf[block] = {**pars, key: os.path.join(directory, name)}
+    # a search that had not written a checkpoint yet starts afresh
+    if conf.get('resume', False):
+        conf['resume'] = os.path.exists(conf['checkpoint']['file'])
+    return conf
+
+
+def search(conf, root_node):
+    """
+    Run one search of the ensemble in a worker process, its output goes to
+    output.log in its directory. Returns its statistics.
+    """
+    resultsfile = conf['results']['file']
+    directory = os.path.dirname(resultsfile)
+    os.makedirs(directory, exist_ok=True)
+    t = time.perf_counter()
+    with open(os.path.join(directory, 'output.log'), 'a') as out:
+        with contextlib.redirect_stdout(out):
+            nevaluations = run_structure_search.run(conf, root_node)
+    wall = time.perf_counter() - t
+
+    store = ResultsStore(resultsfile)
+    best = next(store.lowest(1), (None, None, np.inf, None))[2]
+    store.close()
+    return {
+        'directory': directory,
+        'results': resultsfile,
+        'seed': conf['seed'],
+        'natoms': len(root_node['species']),
+        'evaluations': nevaluations,
+        'wall': wall,
+        'best': best,
+    }
+
+
+def run(conf):
+    ens = conf.get('ensemble', {})
+    num_runs = ens.get('num_runs', 4)
+    num_workers = ens.get('num_workers', os.cpu_count())
+    outdir = ens.get('directory', 'ensemble')
+    sizes = ens.get('num_atoms', [None])
+    seed = conf.get('seed', 12)
+    random.seed(seed)
+    np.random.seed(seed)
+
+    # runs cycle over the cluster sizes, roots of the same size are distinct
+    L = conf.get('lattice', None)
+    sizes = [sizes[i % len(sizes)] for i in range(num_runs)]
+    confs, roots = [], []
+    for natoms in dict.fromkeys(sizes):
+        runs = [i for i in range(num_runs) if sizes[i] == natoms]
+        C = fixed_size(conf['constraint'], natoms)
+        # the number of atoms of a random structure excludes the maximum
+        draw = C if natoms is None else {**C, 'max_num_atoms': natoms + 1}
+        seeds = createRandomSeeds(L, draw, len(runs), multiplier=10)
+        for i, root_node in zip(runs, seeds):
+            root_node['constraint'] = C
+            directory = os.path.join(outdir, f'run_{i:03d}')
+            confs.append(run_conf(conf, directory, seed + i, natoms))
+            roots.append(root_node)
+    num_workers = min(num_workers, len(confs))
+    logger.info(
+        f'Start {len(confs)} searches over {num_workers} processes in '
+        f'{outdir}.'
+    )
+
+    t0 = time.perf_counter()
+    stats = []
+    # spawn, so that no simulator state is inherited from the parent
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+    ) as pool:
+        futures = {
+            pool.submit(search, c, r): c for c, r in zip(confs, roots)
+        }
+        for future in as_completed(futures):
+            try:
+                s = future.result()
+            except (Exception, SystemExit) as err:
+                # run_structure_search exits on a simulator it cannot load
+                directory = os.path.dirname(futures[future]['results']['file'])
+                logger.error(
+                    f'Search {directory} failed, see its output.log. {err!r}'
+                )
+                continue
+            stats.append(s)
+            logger.info(
+                f"Search {s['directory']} (root of {s['natoms']} atoms, seed "
+                f"{s['seed']}): {s['evaluations']} evaluations in "
+                f"{s['wall']:.1f} s ({s['evaluations'] / s['wall']:.2f} "
+                f"evaluations/s), best {s['best']}."
+            )
+    wall = time.perf_counter() - t0
+
+    nevaluations = sum(s['evaluations'] for s in stats)
+    logger.info(
+        f'{len(stats)} of {len(confs)} searches done, {nevaluations} '
+        f'evaluations in {wall:.1f} s ({nevaluations / wall:.2f} '
+        f'evaluations/s, {sum(s["wall"] for s in stats) / wall:.2f} '
+        f'searches at a time).'
+    )
+    if not stats:
+        return
+
+    # global ranking of the structures of all searches
+    writer = StructureWriter(
+        [s['results'] for s in stats],
+        outpath=os.path.join(outdir, 'structures'),
+        objfile=os.path.join(outdir, 'energy.dat'),
+        file_format=ens.get('file_format', 'poscar'),
+    )
+    ranking = writer.write(ens.get('num_to_write', 10), unique=True)
+    if ranking:
+        logger.info(
+            f'Wrote the {len(ranking)} lowest energy structures to '
+            f'{outdir}, best {ranking[0][1]}.'
+        )
@@ -1,61 +1,149 @@
+import json
 import random
 
 import numpy as np
 
 import CASTING
 import CASTING.optimizers as optimizers
+from CASTING.cache import CachedEvaluator, EvaluationCache
 from CASTING.clusterfun import createRandomData
+from CASTING.distributed import SpoolEvaluator
+from CASTING.minima import MinimaIndex
+from CASTING.operators import MutationOperators
+from CASTING.parallel import PoolEvaluator, as_async
 from CASTING.perturb import perturbate
+from CASTING.results import RecordingEvaluator, ResultsStore
+from CASTING.stopping import StopCriteria
+from CASTING.surrogate import SurrogatePrescreen
 
 logger = CASTING.logger
 
 simulator_list = {
     # name: (module, class name)
     'lammps': ('CASTING.lammpsEvaluate', 'LammpsEvaluator'),
+    'eam': ('CASTING.aseEamEvaluate', 'AseEamEvaluator'),
 }
 
 
-def run(conf):
-    seed = 12
+def run(conf, root_node=None):
+    """
+    Returns the number of structures evaluated by the run, failed ones
+    included.
+    :root_node: structure the search starts from, a random one if None.
+    """
+    seed = conf.get('seed', 12)
     random.seed(seed)
     np.random.seed(seed)
 
     # initialize root node data
-    logger.info('Create random initial structure.')
     L = conf.get('lattice', None)
     C = conf.get('constraint', None)
-    root_node = createRandomData(L, C, multiplier=10)
+    if root_node is None:
+        logger.info('Create random initial structure.')
+        root_node = createRandomData(L, C, multiplier=10)
 
     # initialize evaluator
+    num_workers = conf.get('parallel', {}).get('num_workers', 1)
+    simulator = None  # local evaluator whose state is checkpointed
     try:
         simname = conf.get('simulator', 'unspecified')
         simpars = conf.get(simname, {})
         modulename, clsname = simulator_list[simname]
-        sim_module = __import__(f'{modulename}', fromlist=[''])
-        evaluator = getattr(sim_module, clsname)(simpars)
-        logger.info(f'Initialized {simname} simulator.')
+        if 'distributed' in conf:
+            evaluator = SpoolEvaluator(
+                modulename, clsname, simpars, **conf['distributed']
+            )
+        elif num_workers > 1:
+            evaluator = PoolEvaluator(
+                modulename, clsname, simpars, num_workers
+            )
+        else:
+            sim_module = __import__(f'{modulename}', fromlist=[''])
+            evaluator = getattr(sim_module, clsname)(simpars)
+            if hasattr(evaluator, 'to_arrays'):
+                simulator = evaluator
+            if conf.get('parallel', {}).get('background', False):
+                evaluator = as_async(evaluator)
     except Exception as err:
         print(f"Cannot load '{simname}' simulator. {err}")
         raise SystemExit
+    logger.info(f'Initialized {simname} simulator.')
+
+    # wrappers have submit, it only works if the simulator has one
+    asynchronous = hasattr(evaluator, 'submit')
+    store = ResultsStore(**conf.get('results', {}))
+    evaluator = recorder = RecordingEvaluator(evaluator, store)
+    if 'cache' in conf:
+        system = json.dumps([simname, simpars], sort_keys=True)
+        cache = EvaluationCache(system, **conf['cache'])
+        evaluator = CachedEvaluator(evaluator, cache)
+        logger.info('Initialized evaluation cache.')
 
     # run optimizer
     pt = {
         'max_mutation': 0.05,  # Put in fraction of the box length 0.01 means 100*0.01 =1Angs
     }
-    optname = conf['optimizer']['name']
+    cp = conf.get('checkpoint', {})
+    opt = conf['optimizer']
+    optname = opt['name']
     optimizer = getattr(optimizers, optname)
+    optpars = {}
+    if optname == 'ParallelMCTS':
+        par = conf.get('parallel', {})
+        optpars = {
+            # enough expansions to keep all workers busy
+            'nparallel': par.get('num_expansions', num_workers // 11 + 2),
+            'virtual_loss': par.get('virtual_loss', 1),
+        }
+    prescreen = None
+    if 'surrogate' in conf:
+        prescreen = SurrogatePrescreen(**conf['surrogate'])
+        logger.info('Initialized surrogate pre-screen of playouts.')
+    minima = None
+    if 'dedup' in conf:
+        minima = MinimaIndex(**conf['dedup'])
+        logger.info('Initialized index of duplicate minima.')
+    operators = None
+    if 'perturbation' in conf:
+        operators = MutationOperators(L, **{**pt, **conf['perturbation']})
+        perturber = operators
+        logger.info('Initialized mutation operators.')
+    else:
+        perturber = perturbate(**pt)
+    stop = StopCriteria(
+        opt.get('max_evaluations'), opt.get('walltime'), opt.get('stagnation')
+    )
     logger.info(f'Initialized {optname} optimizer.')
     optimizer(
         root_node,
-        perturbate(**pt).perturb,  # perturbation
+        perturber.perturb,  # perturbation
         evaluator.evaluate,
-        niterations=2000,
-        headexpand=10,
-        nexpand=3,
-        nsimulate=3,
-        nplayouts=10,
-        exploreconstant=1,
-        maxdepth=12,
-        a=0,
+        niterations=opt.get('num_iteration', 2000),
+        nexpand=opt.get('num_head_expansions', 10),
+        nplayouts=opt.get('num_play_expansions', 10),
+        exploreconstant=opt.get('exploration_const', 60),
+        maxdepth=opt.get('max_depth', 12),
+        a=opt.get('depth_scaling', 0),
         selected_node=0,
+        evaluate_batch=getattr(evaluator, 'evaluate_batch', None),
+        submit=evaluator.submit if asynchronous else None,
+        checkpoint=cp.get('file', 'checkpoint.npz'),
+        checkpoint_interval=cp.get('interval', 10),
+        resume=conf.get('resume', False),
+        prescreen=prescreen,
+        minima=minima,
+        perturbate_batch=perturber.perturb_many,
+        operators=operators,
+        stop=stop,
+        evaluator=simulator,
+        **optpars,
     )
+    if prescreen is not None:
+        prescreen.report()
+    if minima is not None:
+        minima.report()
+    if operators is not None:
+        operators.report()
+    if hasattr(evaluator, 'close'):
+        evaluator.close()
+    return recorder.nevaluations
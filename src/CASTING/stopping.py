@@ -0,0 +1,58 @@
+"""
+Criteria ending a search before its number of iterations.
+"""
+
+import time
+
+import numpy as np
+
+from . import logger
+
+
+class StopCriteria(object):
+    """
+    Ends a search once it made max_evaluations evaluations, ran for
+    walltime seconds or made stagnation evaluations without finding a
+    lower score. Criteria that are None are not used. Evaluations are the
+    entries of the tree and the expansions merged into existing nodes.
+    """
+
+    def __init__(self, max_evaluations=None, walltime=None, stagnation=None):
+        """
+        :walltime: seconds, counted from the creation of the criteria.
+        :stagnation: number of evaluations, counted from the start of the
+            search or from the resume of a stopped one.
+        """
+        self.max_evaluations = max_evaluations
+        self.walltime = walltime
+        self.stagnation = stagnation
+        self.t0 = time.perf_counter()
+        self.best = np.inf
+        self.best_at = 0  # evaluations when the best score was found
+        self.reason = None
+
+    def __call__(self, tree, minima=None):
+        """Whether the search in tree should stop."""
+        n = len(tree)
+        if minima is not None:
+            n += minima.nduplicates
+        best = tree.score[: len(tree)].min()
+        if best < self.best:
+            self.best, self.best_at = best, n
+
+        elapsed = time.perf_counter() - self.t0
+        if self.max_evaluations is not None and n >= self.max_evaluations:
+            self.reason = f"{n} evaluations"
+        elif self.walltime is not None and elapsed >= self.walltime:
+            self.reason = f"{elapsed:.0f} s"
+        elif (
+            self.stagnation is not None
+            and n - self.best_at >= self.stagnation
+        ):
+            self.reason = (
+                f"{n - self.best_at} evaluations without a better score"
+            )
+        else:
+            return False
+        logger.info(f"Search stopped after {self.reason}.")
+        return True
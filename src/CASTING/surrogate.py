@@ -0,0 +1,165 @@
+"""
+Surrogate energy model used to pre-screen playouts.
+"""
+
+from collections import deque
+
+import numpy as np
+from scipy.stats import spearmanr
+
+from CASTING.clusterfun import get_coords, screen_constrains
+from CASTING.utilis import DistanceMatrix
+
+from . import logger
+
+
+def radial_features(structData, centers, width, cutoff):
+    """
+    Smooth pair distance histogram per atom of a structure: for each
+    center, the sum over pairs of a Gaussian of the pair distance, with a
+    cosine cutoff, divided by the number of atoms.
+    """
+    coords = get_coords(np.asarray(structData['parameters']))
+    natoms = len(coords)
+    D = DistanceMatrix(coords, structData['lattice'].matrix)
+    d = D[np.triu_indices(natoms, k=1)]
+    d = d[d < cutoff]
+    fc = 0.5 * (np.cos(np.pi * d / cutoff) + 1.0)
+    g = np.exp(-0.5 * ((d[:, None] - centers[None, :]) / width) ** 2)
+    return np.concatenate([[1.0, 1.0 / natoms], fc @ g / natoms])
+
+
+class SurrogatePrescreen(object):
+    """
+    Ridge regression of the relaxed energy per atom on radial features of
+    the unrelaxed structure, trained online on the evaluated structures.
+
+    Playouts draw factor times more candidates than they evaluate, and
+    select keeps the ones with the lowest predicted energy. Until
+    min_samples structures have been evaluated the candidates are taken
+    in the order they were drawn.
+    """
+
+    def __init__(
+        self,
+        factor=3,
+        min_samples=50,
+        ridge=1e-3,
+        cutoff=6.0,
+        width=0.25,
+        refit_every=10,
+        report_every=500,
+    ):
+        """
+        :factor: candidates drawn per evaluated playout.
+        :min_samples: evaluated structures needed before the model is used.
+        :ridge: regularization of the regression.
+        :cutoff: pair distance cutoff of the features (Angstrom).
+        :width: width of the Gaussians of the features (Angstrom).
+        :refit_every: number of updates between refits of the model.
+        :report_every: number of ranked structures between log reports.
+        """
+        self.factor = factor
+        self.min_samples = min_samples
+        self.ridge = ridge
+        self.cutoff = cutoff
+        self.width = width
+        self.centers = np.arange(1.5, cutoff, width)
+        self.refit_every = refit_every
+        self.report_every = report_every
+
+        nfeatures = len(self.centers) + 2
+        self.XtX = np.zeros((nfeatures, nfeatures))
+        self.Xty = np.zeros(nfeatures)
+        self.nsamples = 0
+        self.nupdates = 0
+        self.weights = None
+
+        self.ranked = deque(maxlen=report_every)  # (prediction, energy)
+        self.nranked = 0
+
+    def features(self, structData):
+        return radial_features(
+            structData, self.centers, self.width, self.cutoff
+        )
+
+    def select(self, candidates, n):
+        """The n most promising of candidates, in the order drawn."""
+        valid = np.flatnonzero(screen_constrains(candidates))
+        if self.weights is None or len(valid) == 0:
+            keep = valid[:n]
+        else:
+            X = np.array([self.features(candidates[i]) for i in valid])
+            prediction = X @ self.weights
+            best = np.sort(np.argsort(prediction, kind='stable')[:n])
+            keep = valid[best]
+            # carried by the candidate, and dropped with it if it is not
+            # evaluated
+            for i, p in zip(keep, prediction[best]):
+                candidates[i]['prediction'] = p
+        if len(keep) < n:
+            # not enough valid candidates, fill up with invalid ones
+            invalid = np.setdiff1d(np.arange(len(candidates)), valid)
+            keep = np.sort(np.concatenate([keep, invalid[: n - len(keep)]]))
+        return [candidates[i] for i in keep]
+
+    def update(self, candidates, results):
+        """Train on the evaluated candidates and their results."""
+        for data, (_, score) in zip(candidates, results):
+            prediction = data.pop('prediction', None)
+            if score >= 1e300:
+                continue
+            if prediction is not None:
+                self.ranked.append((prediction, score))
+                self.nranked += 1
+                if self.nranked % self.report_every == 0:
+                    self.report()
+            x = self.features(data)
+            self.XtX += np.outer(x, x)
+            self.Xty += x * score
+            self.nsamples += 1
+
+        self.nupdates += 1
+        if (
+            self.nsamples >= self.min_samples
+            and self.nupdates % self.refit_every == 0
+        ):
+            A = self.XtX + self.ridge * np.eye(len(self.Xty))
+            self.weights = np.linalg.solve(A, self.Xty)
+
+    def to_arrays(self):
+        """Training set, model and ranking statistics for a checkpoint."""
+        return {
+            'surrogate_XtX': self.XtX,
+            'surrogate_Xty': self.Xty,
+            'surrogate_weights': (
+                np.zeros(0) if self.weights is None else self.weights
+            ),
+            'surrogate_ranked': np.array(self.ranked).reshape(-1, 2),
+            'surrogate_stats': np.array(
+                [self.nsamples, self.nupdates, self.nranked], dtype=np.int64
+            ),
+        }
+
+    def load_arrays(self, arrays):
+        """Restore the state written by to_arrays."""
+        self.XtX = arrays['surrogate_XtX'].copy()
+        self.Xty = arrays['surrogate_Xty'].copy()
+        weights = arrays['surrogate_weights']
+        self.weights = weights.copy() if len(weights) else None
+        self.ranked.clear()
+        self.ranked.extend(map(tuple, arrays['surrogate_ranked']))
+        stats = arrays['surrogate_stats']
+        self.nsamples, self.nupdates, self.nranked = map(int, stats)
+
+    def report(self):
+        if len(self.ranked) < 2:
+            return
+        prediction, energy = np.array(self.ranked).T
+        rho = spearmanr(prediction, energy).correlation
+        mae = np.mean(np.abs(prediction - energy))
+        logger.info(
+            f"Surrogate on the last {len(self.ranked)} ranked playouts: "
+            f"Spearman rank correlation {rho:.3f}, "
+            f"mean absolute error {mae:.4f} eV/atom."
+        )
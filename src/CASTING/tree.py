@@ -0,0 +1,286 @@
+"""
+Array-backed storage of the MCTS search tree.
+"""
+
+import json
+
+import numpy as np
+from pymatgen.core import Lattice
+
+# entry and node arrays written to and read from files
+_arrays = [
+    'score',
+    'offset',
+    'natoms',
+    'lattice_id',
+    'species_id',
+    'constraint_id',
+    'isnode',
+    'parent',
+    'depth',
+    'visits',
+    'best',
+    'playout_start',
+    'playout_count',
+]
+
+
+def _grow(array, size, fill=0):
+    """Return array with room for at least size items."""
+    if size <= len(array):
+        return array
+    new = np.full(max(size, 3 * len(array) // 2), fill, dtype=array.dtype)
+    new[: len(array)] = array
+    return new
+
+
+class MCTSTree(object):
+    """
+    Search tree of MCTS.
+
+    Tree nodes and playouts share one index space, entry i is the i-th
+    evaluated structure with its score. Nodes store the structure they were
+    expanded with, playouts their relaxed structure. The playouts of a node
+    are stored right after it, so they are kept as a (start, count) range.
+
+    Coordinates of all entries are kept in one flat array. Lattices,
+    species lists and constraints are shared by many entries and are
+    stored once and referenced by id.
+    """
+
+    def __init__(self, capacity=1024, natoms=32):
+        self.size = 0  # number of entries
+        self.ncoords = 0  # used length of coords
+
+        # ---------- entries ----------
+        self.score = np.empty(capacity)
+        self.offset = np.zeros(capacity, dtype=np.int64)
+        self.natoms = np.zeros(capacity, dtype=np.int32)
+        self.lattice_id = np.zeros(capacity, dtype=np.int32)
+        self.species_id = np.zeros(capacity, dtype=np.int32)
+        self.constraint_id = np.zeros(capacity, dtype=np.int32)
+        self.coords = np.empty(3 * natoms * capacity)
+
+        # ---------- nodes, indexed by entry ----------
+        self.isnode = np.zeros(capacity, dtype=bool)
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.depth = np.zeros(capacity, dtype=np.int32)
+        self.visits = np.zeros(capacity, dtype=np.int64)
+        self.best = np.full(capacity, np.inf)  # best score in subtree
+        self.playout_start = np.zeros(capacity, dtype=np.int64)
+        self.playout_count = np.zeros(capacity, dtype=np.int32)
+        # expansions of a node that are being evaluated, not saved
+        self.pending = np.zeros(capacity, dtype=np.int32)
+
+        self.nodes = np.zeros(capacity, dtype=np.int64)  # creation order
+        self.nnodes = 0
+
+        # children in CSR form, rebuilt when nodes were added
+        self._child_offsets = None
+        self._child_index = None
+
+        # ---------- interned objects ----------
+        self.lattices = []
+        self.species = []
+        self.constraints = []
+        self._lattice_ids = {}
+        self._species_ids = {}
+
+    # ---------------------------------------------------------
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays."""
+        return sum(
+            v.nbytes for v in vars(self).values() if isinstance(v, np.ndarray)
+        )
+
+    def _reserve(self, size, ncoords):
+        if size > len(self.score):
+            for name in _arrays + ['nodes', 'pending']:
+                fill = {'parent': -1, 'best': np.inf}.get(name, 0)
+                setattr(self, name, _grow(getattr(self, name), size, fill))
+        self.coords = _grow(self.coords, ncoords)
+
+    def _intern_lattice(self, lattice):
+        key = lattice.matrix.tobytes()
+        if key not in self._lattice_ids:
+            self._lattice_ids[key] = len(self.lattices)
+            self.lattices.append(lattice)
+        return self._lattice_ids[key]
+
+    def _intern_species(self, species):
+        key = tuple(species)
+        if key not in self._species_ids:
+            self._species_ids[key] = len(self.species)
+            self.species.append(key)
+        return self._species_ids[key]
+
+    def _intern_constraint(self, constraint):
+        for i, c in enumerate(self.constraints):
+            if c is constraint:
+                return i
+        for i, c in enumerate(self.constraints):
+            if c == constraint:
+                return i
+        self.constraints.append(constraint)
+        return len(self.constraints) - 1
+
+    # ---------------------------------------------------------
+
+    def add(self, structData, score):
+        """Append an entry, returns its index."""
+        x = np.asarray(structData['parameters'], dtype=float)
+        idx = self.size
+        self._reserve(idx + 1, self.ncoords + len(x))
+
+        self.score[idx] = score
+        self.offset[idx] = self.ncoords
+        self.natoms[idx] = len(x) // 3
+        self.coords[self.ncoords : self.ncoords + len(x)] = x
+        self.lattice_id[idx] = self._intern_lattice(structData['lattice'])
+        self.species_id[idx] = self._intern_species(structData['species'])
+        self.constraint_id[idx] = self._intern_constraint(
+            structData['constraint']
+        )
+
+        self.size += 1
+        self.ncoords += len(x)
+        return idx
+
+    def add_node(self, structData, score, parent=None):
+        """Append a tree node below parent (None for the root)."""
+        idx = self.add(structData, score)
+        self.isnode[idx] = True
+        self.visits[idx] = 1
+        if parent is not None:
+            self.parent[idx] = parent
+            self.depth[idx] = self.depth[parent] + 1
+        self.playout_start[idx] = idx + 1
+        self.nodes[self.nnodes] = idx
+        self.nnodes += 1
+        self._child_offsets = None
+        return idx
+
+    def add_playout(self, node, structData, score):
+        """Append a playout of node, must directly follow its others."""
+        end = self.playout_start[node] + self.playout_count[node]
+        if end != self.size:
+            raise ValueError(f"Playouts of node {node} must be contiguous.")
+        idx = self.add(structData, score)
+        self.playout_count[node] += 1
+        return idx
+
+    # ---------------------------------------------------------
+
+    def data(self, idx):
+        """structData of entry idx."""
+        start = self.offset[idx]
+        return {
+            "lattice": self.lattices[self.lattice_id[idx]],
+            "parameters": self.coords[start : start + 3 * self.natoms[idx]].copy(),
+            "species": list(self.species[self.species_id[idx]]),
+            "constraint": self.constraints[self.constraint_id[idx]],
+        }
+
+    def get_nodes(self):
+        return self.nodes[: self.nnodes]
+
+    def playouts(self, node):
+        start = self.playout_start[node]
+        return np.arange(start, start + self.playout_count[node])
+
+    def children(self, node):
+        if self._child_offsets is None:
+            nodes = self.get_nodes()
+            parents = self.parent[nodes]
+            order = np.argsort(parents, kind='stable')
+            counts = np.bincount(parents[parents >= 0], minlength=self.size)
+            self._child_offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._child_index = nodes[order][np.sum(parents < 0) :]
+        offsets = self._child_offsets
+        return self._child_index[offsets[node] : offsets[node + 1]]
+
+    def best_playout(self, node):
+        """Index of the best playout of node, first one on ties."""
+        playouts = self.playouts(node)
+        return playouts[np.argmin(self.score[playouts])]
+
+    # ---------------------------------------------------------
+
+    def backpropagate(self, node):
+        """
+        Record the best playout score of a new node and pass the best of
+        its own and playout scores up to its ancestors. best[n] is the best
+        score among the playouts of n and the nodes and playouts below n.
+        """
+        playouts = self.playouts(node)
+        best = self.score[playouts].min() if len(playouts) else np.inf
+        self.best[node] = best
+        value = min(self.score[node], best)
+
+        # an ancestor is never worse than its descendants, stop at the
+        # first one that is already at least as good
+        par = self.parent[node]
+        while par >= 0 and value < self.best[par]:
+            self.best[par] = value
+            par = self.parent[par]
+
+    def select(self, maxdepth, exploreconstant=1, virtual_loss=0):
+        """
+        Node with the highest UCB score, the first one on ties.
+
+        :virtual_loss: visits counted for each pending expansion of a node,
+            so that concurrent selections spread over the tree.
+        """
+        nodes = self.get_nodes()
+        parents = self.parent[nodes]
+        valid = (parents >= 0) & (self.depth[nodes] <= maxdepth)
+
+        visits = self.visits
+        if virtual_loss:
+            visits = visits + virtual_loss * self.pending
+
+        UCB_scores = np.full(len(nodes), -1e300)
+        n = nodes[valid]
+        UCB_scores[valid] = -self.best[n] + exploreconstant * np.sqrt(
+            np.log(visits[parents[valid]]) / visits[n]
+        )
+        return int(nodes[np.argmax(UCB_scores)])
+
+    # ---------------------------------------------------------
+
+    def to_arrays(self):
+        """Contents of the tree as a dict of arrays."""
+        out = {name: getattr(self, name)[: self.size] for name in _arrays}
+        out['coords'] = self.coords[: self.ncoords]
+        out['nodes'] = self.get_nodes()
+        out['lattices'] = np.array([l.matrix for l in self.lattices])
+        out['species'] = np.array([' '.join(s) for s in self.species])
+        out['constraints'] = np.array(
+            [json.dumps(c) for c in self.constraints]
+        )
+        return out
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Tree from the output of to_arrays."""
+        size = len(arrays['score'])
+        tree = cls(capacity=max(size, 1), natoms=0)
+        tree._reserve(size, len(arrays['coords']))
+        for name in _arrays:
+            getattr(tree, name)[:size] = arrays[name]
+        tree.size = size
+        tree.ncoords = len(arrays['coords'])
+        tree.coords[: tree.ncoords] = arrays['coords']
+        tree.nnodes = len(arrays['nodes'])
+        tree.nodes[: tree.nnodes] = arrays['nodes']
+        for matrix in arrays['lattices']:
+            tree._intern_lattice(Lattice(matrix))
+        for species in arrays['species']:
+            tree._intern_species(str(species).split())
+        tree.constraints = [json.loads(str(c)) for c in arrays['constraints']]
+        return tree
@@ -7,6 +7,7 @@ Created on 2022-12-13 20:36:01.409428
 import numpy as np
 import pandas as pd
 from pymatgen.core import Lattice
+from scipy.spatial import cKDTree
 
 
 def r_datafame(distance_dict):
@@ -33,47 +34,42 @@ def get_lattice(**kwargs):
     return Lattice.from_parameters(**kwargs)
 
 
-def get_factors(n, m):
-    factors = []
-    factor = int(
-        n ** (1.0 / m) + 0.1
-    )  # fudged to deal with precision problem with float roots
-    while n % factor != 0:
-        factor = factor - 1
-    factors.append(factor)
-    if m > 1:
-        factors = factors + get_factors(n / factor, m - 1)
-
-    return factors
-
-
 def DistanceMatrix(frac_coordinates, M):
-    a, b, c = (
-        frac_coordinates[:, 0],
-        frac_coordinates[:, 1],
-        frac_coordinates[:, 2],
-    )
-
-    def getDist(mat):
-        n, m = np.meshgrid(mat, mat)
-        dist = m - n
-        dist -= np.rint(dist)
-        return dist
-
-    da, db, dc = (
-        getDist(a),
-        getDist(b),
-        getDist(c),
-    )  # Fracrtional difference matrix
+    # ---------fractional differences------------
+
+    diff = frac_coordinates[:, None, :] - frac_coordinates[None, :, :]
+    diff -= np.rint(diff)
 
     # ---------cartesian differences------------
 
-    DX = M[0][0] * da + M[1][0] * db + M[2][0] * dc
-    DY = M[0][1] * da + M[1][1] * db + M[2][1] * dc
-    DZ = M[0][2] * da + M[1][2] * db + M[2][2] * dc
+    diff = diff @ M
 
     # -----------distance matrix--------------
 
-    D = np.sqrt(np.square(DX) + np.square(DY) + np.square(DZ))
-
-    return D
+    return np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+
+
+def neighbor_pairs(frac_coordinates, M, rcut):
+    """
+    Pairs of atoms (i < j) within rcut of each other and their distances,
+    with the same periodic convention as DistanceMatrix. Uses a k-d tree for
+    orthogonal lattices and falls back to the dense distance matrix for
+    tilted ones.
+    """
+    n = frac_coordinates.shape[0]
+    if np.count_nonzero(M - np.diag(np.diag(M))) == 0:
+        lengths = np.diag(M)
+        x = np.mod(frac_coordinates, 1.0) * lengths
+        x[x >= lengths] = 0.0  # mod can round up to the box length
+        pairs = cKDTree(x, boxsize=lengths).query_pairs(
+            rcut, output_type='ndarray'
+        )
+        i, j = pairs[:, 0], pairs[:, 1]
+        df = frac_coordinates[i] - frac_coordinates[j]
+        df -= np.rint(df)
+        d = np.sqrt(np.sum(np.square(df @ M), axis=1))
+    else:
+        i, j = np.triu_indices(n, k=1)
+        d = DistanceMatrix(frac_coordinates, M)[i, j]
+    keep = d <= rcut
+    return i[keep], j[keep], d[keep]
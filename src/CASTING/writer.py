@@ -3,90 +3,115 @@ Created on 2023-01-17 16:12:01.409428
 @author: suvobanik
 """
 
-import math
+import heapq
+import itertools
 import os
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
-import numpy as np
-from pymatgen.core import Lattice, Structure
 from pymatgen.io.cif import CifWriter
 from pymatgen.io.vasp import Poscar
+from pymatgen.io.xyz import XYZ
 from tqdm import tqdm
 
+from CASTING.clusterfun import parm2struc
+from CASTING.results import ResultsStore
+
 # In[10]:
 
+formats = {
+    # name: (writer class, file extension)
+    "poscar": (Poscar, "POSCAR"),
+    "cif": (CifWriter, "cif"),
+    "xyz": (XYZ, "xyz"),
+}
+
 
 class StructureWriter(object):
     def __init__(
         self,
-        dumpfile,
+        resultsfile="results.db",
         outpath="structures",
         objfile="energy.dat",
         file_format="poscar",
+        num_threads=4,
     ):
         """
-        :dumpfile: full path of the file, where structures are written by MCTS.
+        :resultsfile: full path of the results store written during the search, or a list of them to export the best structures of several runs.
         :outpath: full path of the directory where the structures are to be extracted.
         :objfile: full path of the file, where the objectives are to be written.
-        :file_format: file format of the extracted structures. Currently only cif or poscar is supported .
+        :file_format: file format of the extracted structures, poscar, cif or xyz.
+        :num_threads: number of threads writing the structure files.
         """
 
-        self.dumpfile = dumpfile
+        if isinstance(resultsfile, (str, os.PathLike)):
+            resultsfile = [resultsfile]
+        for path in resultsfile:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No results store '{path}'.")
+        self.resultsfiles = list(resultsfile)
         self.outpath = outpath
         self.objfile = objfile
-        if file_format == "poscar":
-            self.writer = Poscar
-        elif file_format == "cif":
-            self.writer = CifWriter
-        else:
-            raise Exception("The file format not specified")
+        if file_format not in formats:
+            raise ValueError(f"Unknown file format '{file_format}'.")
+        self.writer, self.extension = formats[file_format]
+        self.num_threads = num_threads
 
         if not os.path.exists(self.outpath):
             os.mkdir(self.outpath)
 
-        try:
-            os.remove(self.objfile)
-        except:
-            pass
-
-    def gel_latt_coords(self, parameters):
-        lattice = parameters[:6]
-        coords = parameters[6:]
-        coords = coords.reshape(int(coords.shape[0] / 3), 3)
-        return lattice, coords
-
-    def write(self, num_to_write, sort=True):
-        structurelist = []
-
-        with open(self.dumpfile, "r") as infile:
-            for i, line in enumerate(infile):
-                col = line.split("|")
-                energy = float(col[2])
-                if math.isnan(energy):
+    def select(self, stores, num_to_write, window=None, unique=False):
+        """
+        The num_to_write lowest energy results of the stores, as (ID,
+        energy, structData). Each store is read in order of energy and
+        the streams are merged through a heap, so only the selected
+        results are held in memory.
+        :window: only results within window (eV/atom) of the lowest energy.
+        :unique: skip results with the fingerprint of a lower one.
+        """
+        streams = [store.lowest() for store in stores]
+        merged = heapq.merge(*streams, key=itemgetter(2))
+        selected, seen = [], set()
+        emax = None
+        for ID, key, energy, structData in merged:
+            if emax is None and window is not None:
+                emax = energy + window
+            if emax is not None and energy > emax:
+                break
+            if unique:
+                if key in seen:
                     continue
-                parms = np.array([float(val) for val in col[0].split()])
-                species = col[1].split()
-                structurelist.append([energy, parms, species])
-
-        if sort:
-            structurelist.sort(key=lambda x: x[0])
-
-        for i, val in tqdm(enumerate(structurelist[:num_to_write])):
-            parameters = val[1]
-            species = val[2]
-            lattice, coords = self.gel_latt_coords(parameters)
-
-            lattice = Lattice.from_parameters(
-                a=lattice[0],
-                b=lattice[1],
-                c=lattice[2],
-                alpha=lattice[3],
-                beta=lattice[4],
-                gamma=lattice[5],
+                seen.add(key)
+            selected.append((ID, energy, structData))
+            if len(selected) == num_to_write:
+                break
+        return selected
+
+    def write_one(self, i, structData):
+        struct = parm2struc(structData)
+        path = os.path.join(self.outpath, f"{i}.{self.extension}")
+        self.writer(struct).write_file(path)
+
+    def write(self, num_to_write, window=None, unique=False):
+        """
+        Write the num_to_write lowest energy structures, numbered by rank,
+        and their energies to objfile. See select for window and unique.
+        """
+        stores = [ResultsStore(path) for path in self.resultsfiles]
+        selected = self.select(stores, num_to_write, window, unique)
+        for store in stores:
+            store.close()
+
+        with ThreadPoolExecutor(self.num_threads) as pool:
+            done = pool.map(
+                self.write_one,
+                itertools.count(),
+                [structData for _, _, structData in selected],
             )
+            for _ in tqdm(done, total=len(selected)):
+                pass
 
-            struct = Structure(lattice, species, coords, to_unit_cell=True)
-
-            with open(self.objfile, "a") as outfile:
-                outfile.write("{} {}\n".format(i, val[0]))
-
-            Poscar(struct).write_file("{}/{}.POSCAR".format(self.outpath, i))
+        with open(self.objfile, "w") as outfile:
+            for i, (ID, energy, _) in enumerate(selected):
+                outfile.write(f"{i} {energy} {ID}\n")
+        return selected
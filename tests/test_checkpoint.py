@@ -0,0 +1,97 @@
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("lammps")
+
+from CASTING import optimizers  # noqa: E402
+from CASTING.clusterfun import createRandomData  # noqa: E402
+from CASTING.lammpsEvaluate import LammpsEvaluator  # noqa: E402
+from CASTING.operators import MutationOperators  # noqa: E402
+from CASTING.surrogate import SurrogatePrescreen  # noqa: E402
+
+example = Path(__file__).resolve().parents[1] / 'example_AuCluster'
+pars = {
+    "pair_style": "pair_style eam",
+    "pair_coeff": f"pair_coeff * * {example / 'Au.eam'}",
+}
+constraint = {
+    "composition": {"Au": 1.0},
+    "min_atom_pair_distance": 2,
+    "max_atom_pair_distance": 4,
+    "min_num_atoms": 8,
+    "max_num_atoms": 12,
+}
+lattice = {}
+for k in 'abc':
+    lattice.update({f'min_{k}': 10.0, f'max_{k}': 10.0, f'pad_{k}': 5.0})
+for k in ('alpha', 'beta', 'gamma'):
+    lattice.update({f'min_{k}': 90.0, f'max_{k}': 90.0})
+
+
+def search(niterations, resume=False, surrogate=False, staged=False):
+    random.seed(12)
+    np.random.seed(12)
+    root = createRandomData(lattice, constraint)
+    operators = MutationOperators(
+        lattice, adaptive=True, window=5, report_every=10**9
+    )
+    evaluator = LammpsEvaluator(
+        {**pars, 'staged': {'window': 0.001}} if staged else pars
+    )
+    prescreen = None
+    if surrogate:
+        prescreen = SurrogatePrescreen(
+            factor=2, min_samples=5, refit_every=2, report_every=10**9
+        )
+    return optimizers.MCTS(
+        root,
+        operators.perturb,
+        evaluator.evaluate,
+        niterations=niterations,
+        nexpand=3,
+        nplayouts=5,
+        a=0,
+        checkpoint='checkpoint.npz',
+        checkpoint_interval=1,
+        resume=resume,
+        perturbate_batch=operators.perturb_many,
+        operators=operators,
+        prescreen=prescreen,
+        evaluator=evaluator,
+    )
+
+
+def test_resume_with_operators(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    full = search(6)
+    search(3)
+    resumed = search(6, resume=True)
+    assert len(resumed) == len(full)
+    np.testing.assert_array_equal(
+        resumed.score[: len(full)], full.score[: len(full)]
+    )
+
+
+def test_resume_with_surrogate(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    full = search(6, surrogate=True)
+    search(3, surrogate=True)
+    resumed = search(6, resume=True, surrogate=True)
+    assert len(resumed) == len(full)
+    np.testing.assert_array_equal(
+        resumed.score[: len(full)], full.score[: len(full)]
+    )
+
+
+def test_resume_staged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    full = search(6, staged=True)
+    search(3, staged=True)
+    resumed = search(6, resume=True, staged=True)
+    assert len(resumed) == len(full)
+    np.testing.assert_array_equal(
+        resumed.score[: len(full)], full.score[: len(full)]
+    )
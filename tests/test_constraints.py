@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+from pymatgen.core import Lattice
+
+from CASTING.clusterfun import (
+    BatchConstraintChecker,
+    check_constrains,
+    screen_constrains,
+)
+from CASTING.utilis import DistanceMatrix, neighbor_pairs
+
+constraints = [
+    {
+        "composition": {"Au": 1.0, "Cu": 1.0},
+        "min_atom_pair_distance": 2.0,
+        "max_atom_pair_distance": 3.0,
+        "min_num_atoms": 2,
+        "max_num_atoms": 20,
+    },
+    {
+        "composition": {"Au": 1.0, "Cu": 1.0},
+        "min_atom_pair_distance": {"Au-Au": 2.1, "Au-Cu": 2.0, "Cu-Cu": 1.9},
+        "max_atom_pair_distance": {"Au-Au": 3.1, "Cu-Au": 3.0, "Cu-Cu": 2.8},
+        "min_num_atoms": 2,
+        "max_num_atoms": 20,
+    },
+]
+lattices = [
+    Lattice.cubic(8.0),
+    Lattice.orthorhombic(7.0, 9.0, 11.0),
+    Lattice.from_parameters(9.0, 9.0, 10.0, 70.0, 80.0, 100.0),
+]
+
+
+def random_clusters(lattice, constraint, n, natoms=10, seed=0):
+    """
+    Clusters grown on a simple cubic grid of bond length spacing, with
+    noise so that some bonds break or atoms overlap, and sometimes one atom
+    moved away, wrapped into the box.
+    """
+    rng = np.random.default_rng(seed)
+    species = ["Au", "Cu"] * (natoms // 2)
+    steps = np.concatenate([np.eye(3, dtype=int), -np.eye(3, dtype=int)])
+    inv = np.linalg.inv(lattice.matrix)
+    for _ in range(n):
+        sites = [(0, 0, 0)]
+        while len(sites) < natoms:
+            site = tuple(sites[rng.integers(len(sites))] + rng.choice(steps))
+            if site not in sites:
+                sites.append(site)
+        x = 2.5 * np.array(sites) + rng.normal(0.0, 0.15, (natoms, 3))
+        if rng.random() < 0.2:
+            x[rng.integers(natoms)] += 4.0 * rng.normal(size=3)
+        frac = np.mod(x @ inv + rng.random(3), 1.0)
+        yield {
+            "lattice": lattice,
+            "parameters": frac.flatten(),
+            "species": species,
+            "constraint": constraint,
+        }
+
+
+def lookup(value, sp1, sp2):
+    if not isinstance(value, dict):
+        return value
+    return value.get(f"{sp1}-{sp2}", value.get(f"{sp2}-{sp1}"))
+
+
+def dense_check(structData):
+    """Constraint check on the full distance matrix."""
+    coords = structData['parameters'].reshape(-1, 3)
+    species = structData['species']
+    C = structData['constraint']
+    n = len(coords)
+    if not C['min_num_atoms'] <= n <= C['max_num_atoms']:
+        return False
+    D = DistanceMatrix(coords, structData['lattice'].matrix)
+    np.fill_diagonal(D, np.inf)
+    rmin = np.array(
+        [
+            [lookup(C['min_atom_pair_distance'], a, b) for b in species]
+            for a in species
+        ]
+    )
+    rmax = np.array(
+        [
+            [lookup(C['max_atom_pair_distance'], a, b) for b in species]
+            for a in species
+        ]
+    )
+    if np.any(D < rmin):
+        return False
+
+    # fragmentation, by a walk over the bonds from the first atom
+    bonded = D <= rmax
+    seen, stack = {0}, [0]
+    while stack:
+        for j in np.nonzero(bonded[stack.pop()])[0]:
+            if j not in seen:
+                seen.add(j)
+                stack.append(j)
+    return len(seen) == n
+
+
+@pytest.mark.parametrize("lattice", lattices)
+@pytest.mark.parametrize("constraint", constraints)
+def test_check_constrains(lattice, constraint):
+    structures = list(random_clusters(lattice, constraint, 200))
+    expected = [dense_check(s) for s in structures]
+    # both outcomes are covered
+    assert 0 < sum(expected) < len(expected)
+    assert [check_constrains(s) for s in structures] == expected
+
+
+@pytest.mark.parametrize("lattice", lattices)
+@pytest.mark.parametrize("constraint", constraints)
+def test_batch_constraint_checker(lattice, constraint):
+    structures = list(random_clusters(lattice, constraint, 200, seed=1))
+    expected = np.array([dense_check(s) for s in structures])
+    frac = np.stack([s['parameters'] for s in structures])
+    species = structures[0]['species']
+
+    # small buffers, so that the batch is processed in several chunks
+    checker = BatchConstraintChecker(max_elements=3 * 10 * 10 * 7)
+    np.testing.assert_array_equal(
+        checker(frac, species, lattice, constraint), expected
+    )
+    np.testing.assert_array_equal(screen_constrains(structures), expected)
+
+
+def test_batch_constraint_checker_composition():
+    s = next(random_clusters(lattices[0], constraints[0], 1))
+    C = {**constraints[0], 'max_num_atoms': 8}
+    checker = BatchConstraintChecker()
+    assert not checker(
+        s['parameters'][None], s['species'], s['lattice'], C
+    ).any()
+
+
+def test_screen_constrains_empty():
+    assert screen_constrains([]).shape == (0,)
+
+
+@pytest.mark.parametrize("lattice", lattices)
+def test_neighbor_pairs(lattice):
+    rng = np.random.default_rng(2)
+    frac = rng.random((40, 3))
+    D = DistanceMatrix(frac, lattice.matrix)
+    i, j, d = neighbor_pairs(frac, lattice.matrix, 4.0)
+    assert np.all(i < j)
+    expected = {
+        (a, b) for a, b in zip(*np.triu_indices(40, k=1)) if D[a, b] <= 4.0
+    }
+    assert set(zip(i.tolist(), j.tolist())) == expected
+    np.testing.assert_allclose(d, D[i, j])
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from CASTING.distributed import SpoolEvaluator, Worker
+
+failed = set()  # values of x of the flaky structures that failed once
+
+
+class Evaluator(object):
+    """Scores a structure 2 x, fails on demand."""
+
+    def __init__(self, pars):
+        self.pars = pars
+
+    def evaluate(self, structData):
+        x = structData['x']
+        if structData.get('fail'):
+            raise RuntimeError(f"cannot evaluate {x}")
+        if structData.get('flaky') and x not in failed:
+            failed.add(x)
+            raise RuntimeError(f"lost {x}")
+        return structData, 2.0 * x
+
+
+def wait_for(condition, timeout=10):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def spool(tmp_path):
+    evaluator = SpoolEvaluator(
+        __name__, 'Evaluator', {}, spool=tmp_path, timeout=0.4, poll=0.01
+    )
+    workers = []
+
+    def start_worker(name):
+        worker = Worker(tmp_path, name=name)
+        thread = threading.Thread(target=worker.run, args=(0.01,))
+        thread.start()
+        workers.append((worker, thread))
+        return worker
+
+    yield evaluator, start_worker
+    evaluator.close()
+    for _, thread in workers:
+        thread.join(5)
+
+
+def test_results_in_order(spool):
+    evaluator, start_worker = spool
+    start_worker('w1')
+    start_worker('w2')
+    structures = [{'x': float(i)} for i in range(20)]
+    results = evaluator.evaluate_batch(structures)
+    assert [score for _, score in results] == [2.0 * i for i in range(20)]
+    stats = {s['name']: s for s in evaluator.utilization()}
+    assert sum(s['tasks'] for s in stats.values()) == 20
+
+
+def test_retry_failed_task(spool):
+    evaluator, start_worker = spool
+    worker = start_worker('w1')
+    flaky = evaluator.submit({'x': 1.0, 'flaky': True})
+    broken = evaluator.submit({'x': 2.0, 'fail': True})
+    assert flaky.result(timeout=10)[1] == 2.0
+    # tried once and max_retries more times, then scored 1e300
+    data, score = broken.result(timeout=10)
+    assert data['x'] == 2.0 and score == 1e300
+    # the worker counts a task after writing its result
+    assert wait_for(
+        lambda: worker.stats['tasks'] == 2 + 1 + evaluator.max_retries
+    )
+    assert worker.stats['failures'] == 1 + 1 + evaluator.max_retries
+    assert not evaluator.tasks
+
+
+def test_requeue_lost_task(spool, tmp_path):
+    evaluator, start_worker = spool
+    future = evaluator.submit({'x': 3.0})
+    # a worker without heartbeat claimed the task and died
+    (task,) = (tmp_path / 'tasks').glob('*.pkl')
+    claimed = tmp_path / 'claimed' / f'{task.stem}.ghost.pkl'
+    task.rename(claimed)
+    start_worker('w1')
+    assert future.result(timeout=10)[1] == 6.0
+    assert not claimed.exists()
+
+
+def test_give_up_lost_task(spool, tmp_path):
+    evaluator, _ = spool
+    evaluator.max_retries = 0
+    future = evaluator.submit({'x': 4.0})
+    (task,) = (tmp_path / 'tasks').glob('*.pkl')
+    task.rename(tmp_path / 'claimed' / f'{task.stem}.ghost.pkl')
+    assert future.result(timeout=10) == ({'x': 4.0}, 1e300)
+    assert not list((tmp_path / 'claimed').glob('*.pkl'))
@@ -0,0 +1,122 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pymatgen.core import Molecule
+
+from CASTING.eam import EAMPotential, NeighborList
+
+example = Path(__file__).resolve().parents[1] / 'example_AuCluster'
+
+
+def write_setfl(path, nrho=2000, drho=0.02, nr=2000, dr=0.003):
+    """Two element setfl file of smooth Morse-like functions."""
+    cutoff = nr * dr
+    r = dr * np.arange(nr)
+    rho = drho * np.arange(nrho)
+    smooth = (1.0 - np.minimum(r / cutoff, 1.0) ** 2) ** 3
+
+    def density(a):
+        return a * np.exp(-1.5 * (r - 2.5)) * smooth
+
+    def rphi(d, r0):
+        e = np.exp(-1.4 * (r - r0))
+        return r * d * (e * e - 2.0 * e) * smooth
+
+    def block(values):
+        rows = [values[k : k + 5] for k in range(0, len(values), 5)]
+        return '\n'.join(' '.join(f'{v:.16e}' for v in row) for row in rows)
+
+    sections = [
+        'two element test potential\n\n\n',
+        '2 Au Cu\n',
+        f'{nrho} {drho} {nr} {dr} {cutoff}\n',
+    ]
+    for Z, mass, a, embed in [(79, 196.97, 1.0, 1.0), (29, 63.55, 0.8, 0.7)]:
+        sections.append(f'{Z} {mass} 4.0 fcc\n')
+        sections.append(block(-embed * np.sqrt(rho + 0.1)) + '\n')
+        sections.append(block(density(a)) + '\n')
+    for d, r0 in [(0.4, 2.9), (0.35, 2.7), (0.3, 2.6)]:
+        sections.append(block(rphi(d, r0)) + '\n')
+    path.write_text(''.join(sections))
+    return path
+
+
+def cluster(noise=0.1, seed=0):
+    fpath = sorted((example / 'structures').glob('*.xyz'))[0]
+    mol = Molecule.from_file(fpath)
+    rng = np.random.default_rng(seed)
+    return mol.cart_coords + rng.normal(0.0, noise, mol.cart_coords.shape)
+
+
+def all_pairs(x, cutoff):
+    i, j = np.triu_indices(len(x), k=1)
+    keep = np.linalg.norm(x[i] - x[j], axis=1) < cutoff
+    return i[keep], j[keep]
+
+
+def finite_difference_forces(potential, x, types, h=1e-5):
+    forces = np.empty_like(x)
+    for a in range(len(x)):
+        for k in range(3):
+            energies = []
+            for step in (h, -h):
+                y = x.copy()
+                y[a, k] += step
+                energies.append(
+                    potential.energy_forces(
+                        y, types, all_pairs(y, potential.cutoff)
+                    )[0]
+                )
+            forces[a, k] = -(energies[0] - energies[1]) / (2 * h)
+    return forces
+
+
+@pytest.fixture(params=['eam', 'alloy'])
+def potential(request, tmp_path):
+    if request.param == 'eam':
+        return EAMPotential(example / 'Au.eam')
+    return EAMPotential(write_setfl(tmp_path / 'AuCu.eam.alloy'))
+
+
+@pytest.mark.parametrize("noise", [0.0, 0.3])
+def test_forces(potential, noise):
+    x = cluster(noise)
+    elements = potential.elements
+    species = [elements[k % len(elements)] for k in range(len(x))]
+    types = potential.types(species)
+    energy, forces = potential.energy_forces(
+        x, types, all_pairs(x, potential.cutoff)
+    )
+    assert np.isfinite(energy)
+    expected = finite_difference_forces(potential, x, types)
+    np.testing.assert_allclose(forces, expected, atol=1e-5, rtol=1e-5)
+    # no net force on an isolated cluster
+    np.testing.assert_allclose(forces.sum(axis=0), 0.0, atol=1e-10)
+
+
+def test_pair_order(potential):
+    x = cluster(0.2)
+    types = potential.types([potential.elements[-1]] * len(x))
+    i, j = all_pairs(x, potential.cutoff)
+    e1, f1 = potential.energy_forces(x, types, (i, j))
+    e2, f2 = potential.energy_forces(x, types, (j[::-1], i[::-1]))
+    assert e1 == pytest.approx(e2, rel=1e-12)
+    np.testing.assert_allclose(f1, f2, atol=1e-12)
+
+
+def test_unknown_element(potential):
+    with pytest.raises(ValueError):
+        potential.types(['Au', 'Pt'])
+
+
+def test_neighbor_list():
+    x = cluster(0.1)
+    neighbors = NeighborList(cutoff=5.0, skin=1.0)
+    rng = np.random.default_rng(1)
+    for _ in range(10):
+        i, j = neighbors.pairs(x)
+        assert set(zip(i.tolist(), j.tolist())) == set(
+            zip(*[k.tolist() for k in all_pairs(x, 5.0)])
+        )
+        x = x + rng.normal(0.0, 0.2, x.shape)
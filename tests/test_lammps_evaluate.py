@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("lammps")
+
+from pymatgen.core import Lattice, Molecule  # noqa: E402
+
+from CASTING.lammpsEvaluate import LammpsEvaluator  # noqa: E402
+
+example = Path(__file__).resolve().parents[1] / 'example_AuCluster'
+pars = {
+    "pair_style": "pair_style eam",
+    "pair_coeff": f"pair_coeff * * {example / 'Au.eam'}",
+}
+constraint = {
+    "composition": {"Au": 1.0},
+    "min_atom_pair_distance": 2,
+    "max_atom_pair_distance": 4,
+    "min_num_atoms": 1,
+    "max_num_atoms": 30,
+}
+
+
+def structures(box=30.0, noise=0.05):
+    rng = np.random.default_rng(0)
+    lattice = Lattice.cubic(box)
+    for fpath in sorted((example / 'structures').glob('*.xyz'))[:3]:
+        mol = Molecule.from_file(fpath)
+        pos = mol.cart_coords - mol.center_of_mass + 0.5 * box
+        pos += rng.normal(0.0, noise, pos.shape)
+        yield {
+            "lattice": lattice,
+            "parameters": (pos / box).flatten(),
+            "species": [site.specie.symbol for site in mol],
+            "constraint": constraint,
+        }
+
+
+def test_warm_evaluate_after_batch():
+    s, *others = structures()
+    cold = LammpsEvaluator(pars)
+    warm = LammpsEvaluator({**pars, 'setup': 'warm', 'batch': {}})
+
+    _, expected = cold.evaluate(s)
+    assert warm.evaluate(s)[1] == pytest.approx(expected, abs=1e-6)
+    warm.evaluate_batch(others)
+    # the batch replaced the box of the warm setup
+    assert warm.evaluate(s)[1] == pytest.approx(expected, abs=1e-6)
+    boxlo, boxhi = warm.lmp.extract_box()[:2]
+    assert boxlo == pytest.approx(cold.lmp.extract_box()[0])
+    assert boxhi == pytest.approx(cold.lmp.extract_box()[1])
+
+
+def test_warm_single_point():
+    cold = LammpsEvaluator(pars)
+    warm = LammpsEvaluator({**pars, 'setup': 'warm'})
+    for s in structures(noise=0.3):
+        expected = cold.single_point(s)
+        assert warm.single_point(s) == pytest.approx(expected, abs=1e-9)
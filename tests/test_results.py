@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from pymatgen.core import Lattice
+
+from CASTING.results import RecordingEvaluator, ResultsStore
+
+lattice = Lattice.cubic(10.0)
+
+
+def random_structures(n, natoms=4, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        yield {
+            "lattice": lattice,
+            "parameters": rng.uniform(0.3, 0.7, 3 * natoms),
+            "species": ["Au"] * natoms,
+            "constraint": {},
+        }
+
+
+def permuted(structData, seed=0):
+    """Same structure with its atoms in another order."""
+    coords = structData['parameters'].reshape(-1, 3)
+    order = np.random.default_rng(seed).permutation(len(coords))
+    return {**structData, "parameters": coords[order].flatten()}
+
+
+def test_lowest(tmp_path):
+    store = ResultsStore(tmp_path / 'results.db', buffer=7)
+    rng = np.random.default_rng(1)
+    energies = rng.normal(size=50)
+    IDs = [store.add(s, e) for s, e in zip(random_structures(50), energies)]
+    assert len(store) == 50
+
+    order = np.argsort(energies)
+    lowest = list(store.lowest(10))
+    assert [ID for ID, *_ in lowest] == [IDs[i] for i in order[:10]]
+    assert [e for _, _, e, _ in lowest] == list(energies[order[:10]])
+
+    emax = np.median(energies)
+    assert len(list(store.lowest(emax=emax))) == np.sum(energies <= emax)
+
+    # records hold the stored structure
+    ID, _, _, structData = lowest[0]
+    expected = list(random_structures(50))[order[0]]
+    np.testing.assert_array_equal(
+        structData['parameters'], expected['parameters']
+    )
+    assert structData['species'] == expected['species']
+    store.close()
+
+
+def test_append_after_reopen(tmp_path):
+    path = tmp_path / 'results.db'
+    store = ResultsStore(path, buffer=100)
+    for i, s in enumerate(random_structures(5)):
+        store.add(s, float(i))
+    # the buffered rows are written on close
+    store.close()
+
+    store = ResultsStore(path)
+    for i, s in enumerate(random_structures(5, seed=1)):
+        store.add(s, -float(i))
+    assert len(store) == 10
+    assert next(store.lowest(1))[2] == -4.0
+    store.close()
+
+
+def test_duplicates(tmp_path):
+    store = ResultsStore(tmp_path / 'results.db')
+    s, other = random_structures(2)
+    ID = store.add(s, -1.0)
+    copy = store.add(permuted(s), -1.001)
+    store.add(other, -2.0)
+    assert copy != ID
+    assert sorted(store.duplicates(s)) == sorted([(ID, -1.0), (copy, -1.001)])
+    store.close()
+
+
+class Evaluator(object):
+    def __init__(self, results):
+        self.results = results
+
+    def evaluate(self, structData):
+        return self.results.pop(0)
+
+
+def test_recording_evaluator(tmp_path):
+    s1, s2, s3 = random_structures(3)
+    results = [(s1, -1.0), (s2, 1e300), ({**s3, 'screened': True}, -0.5)]
+    store = ResultsStore(tmp_path / 'results.db')
+    recorder = RecordingEvaluator(Evaluator(list(results)), store)
+    assert recorder.evaluate_batch([s1, s2, s3]) == results
+    # failed and screened results are counted but not stored
+    assert recorder.nevaluations == 3
+    assert len(store) == 1
+    assert next(store.lowest())[2] == pytest.approx(-1.0)
+    recorder.close()
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from pymatgen.core import Lattice
+
+from CASTING import optimizers, stopping
+from CASTING.stopping import StopCriteria
+from CASTING.tree import MCTSTree
+
+root = {
+    "lattice": Lattice.cubic(10.0),
+    "parameters": np.array([0.4, 0.5, 0.5, 0.65, 0.5, 0.5]),
+    "species": ["Au", "Au"],
+    "constraint": {
+        "composition": {"Au": 1.0},
+        "min_atom_pair_distance": 2,
+        "max_atom_pair_distance": 4,
+        "min_num_atoms": 2,
+        "max_num_atoms": 2,
+    },
+}
+
+
+def tree_of(scores):
+    tree = MCTSTree()
+    node = tree.add_node(root, scores[0])
+    for score in scores[1:]:
+        tree.add_playout(node, root, score)
+    return tree
+
+
+class Minima(object):
+    def __init__(self, nduplicates):
+        self.nduplicates = nduplicates
+
+
+def test_unused():
+    stop = StopCriteria()
+    assert not stop(tree_of(np.zeros(1000)))
+    assert stop.reason is None
+
+
+def test_max_evaluations():
+    stop = StopCriteria(max_evaluations=10)
+    assert not stop(tree_of(np.arange(9.0)))
+    assert stop(tree_of(np.arange(10.0)))
+    assert stop.reason == "10 evaluations"
+    # merged duplicates are evaluations too
+    stop = StopCriteria(max_evaluations=10)
+    assert stop(tree_of(np.arange(5.0)), Minima(5))
+
+
+def test_walltime(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(stopping.time, 'perf_counter', lambda: now[0])
+    stop = StopCriteria(walltime=60)
+    tree = tree_of([0.0])
+    now[0] = 159.0
+    assert not stop(tree)
+    now[0] = 160.0
+    assert stop(tree)
+
+
+def test_stagnation():
+    stop = StopCriteria(stagnation=5)
+    scores = [0.0, -1.0, -0.5, -2.0]
+    assert not stop(tree_of(scores))
+    # the best score was found at 4 evaluations
+    scores += [0.0] * 4
+    assert not stop(tree_of(scores))
+    scores += [-1.5]
+    assert stop(tree_of(scores))
+    assert stop.reason == "5 evaluations without a better score"
+    # a better score starts the count again
+    stop = StopCriteria(stagnation=5)
+    assert not stop(tree_of(scores[:4]))
+    assert not stop(tree_of(scores[:8] + [-3.0]))
+
+
+def perturbate(structData, depth, a, maxdepth):
+    x = structData['parameters'] + np.random.normal(0.0, 0.005, 6)
+    return {**structData, "parameters": x}
+
+
+def evaluate(structData):
+    x = structData['parameters'] - root['parameters']
+    return structData, float(np.sum((x - 0.01) ** 2))
+
+
+@pytest.mark.parametrize("nexpand", [1, 3])
+def test_mcts_stops(nexpand):
+    np.random.seed(0)
+    tree = optimizers.MCTS(
+        root,
+        perturbate,
+        evaluate,
+        niterations=1000,
+        nexpand=nexpand,
+        nplayouts=4,
+        a=0,
+        stop=StopCriteria(max_evaluations=50),
+    )
+    # checked after each iteration of nexpand expansions of 5 evaluations
+    assert 50 <= len(tree) < 50 + 5 * nexpand
@@ -0,0 +1,100 @@
+import random
+from math import log, sqrt
+
+import numpy as np
+import pytest
+from pymatgen.core import Lattice
+
+from CASTING.tree import MCTSTree
+
+data = {
+    "lattice": Lattice.cubic(20.0),
+    "parameters": np.zeros(3),
+    "species": ["Au"],
+    "constraint": {},
+}
+
+
+def grow_tree(nnodes, nplayouts=5, maxdepth=6, seed=0):
+    """Random tree grown the way MCTS grows it."""
+    rng = random.Random(seed)
+    tree = MCTSTree(capacity=8)
+
+    def add_node(par):
+        node = tree.add_node(data, rng.random(), parent=par)
+        for _ in range(rng.randint(0, nplayouts)):
+            tree.add_playout(node, data, rng.random())
+        tree.backpropagate(node)
+        return node
+
+    nodes = [add_node(None)]
+    while len(nodes) < nnodes:
+        par = rng.choice(nodes)
+        if tree.depth[par] >= maxdepth:
+            continue
+        tree.visits[par] += 1
+        tree.pending[par] = rng.randint(0, 2)
+        nodes.append(add_node(par))
+    return tree
+
+
+def descendants(tree, node):
+    below = []
+    for child in tree.children(node):
+        below += [int(child)] + descendants(tree, child)
+    return below
+
+
+def rescan_best(tree, node):
+    """Best score of the playouts of node and of everything below it."""
+    entries = list(tree.playouts(node))
+    for n in descendants(tree, node):
+        entries += [n] + list(tree.playouts(n))
+    return min((tree.score[i] for i in entries), default=np.inf)
+
+
+def rescan_select(tree, maxdepth, exploreconstant, virtual_loss):
+    best, selected = -np.inf, None
+    for n in tree.get_nodes():
+        par = tree.parent[n]
+        if par < 0 or tree.depth[n] > maxdepth:
+            continue
+        visits = tree.visits + virtual_loss * tree.pending
+        ucb = -rescan_best(tree, n) + exploreconstant * sqrt(
+            log(visits[par]) / visits[n]
+        )
+        if ucb > best:
+            best, selected = ucb, int(n)
+    return selected
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_backpropagate(seed):
+    tree = grow_tree(60, seed=seed)
+    for n in tree.get_nodes():
+        assert tree.best[n] == rescan_best(tree, n)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("maxdepth", [2, 6])
+@pytest.mark.parametrize("exploreconstant", [0.1, 1, 60])
+@pytest.mark.parametrize("virtual_loss", [0, 1])
+def test_select(seed, maxdepth, exploreconstant, virtual_loss):
+    tree = grow_tree(60, seed=seed)
+    assert tree.select(
+        maxdepth, exploreconstant=exploreconstant, virtual_loss=virtual_loss
+    ) == rescan_select(tree, maxdepth, exploreconstant, virtual_loss)
+
+
+def test_arrays_round_trip():
+    tree = grow_tree(60)
+    copy = MCTSTree.from_arrays(tree.to_arrays())
+    assert len(copy) == len(tree)
+    np.testing.assert_array_equal(copy.get_nodes(), tree.get_nodes())
+    n = len(tree)
+    np.testing.assert_array_equal(copy.best[:n], tree.best[:n])
+    assert copy.select(6) == tree.select(6)
+    for node in tree.get_nodes():
+        np.testing.assert_array_equal(
+            copy.children(node), tree.children(node)
+        )
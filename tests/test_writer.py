@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from pymatgen.core import Lattice, Structure
+
+from CASTING.results import ResultsStore
+from CASTING.writer import StructureWriter
+
+lattice = Lattice.cubic(10.0)
+
+
+def random_structures(n, natoms=4, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        yield {
+            "lattice": lattice,
+            "parameters": rng.uniform(0.3, 0.7, 3 * natoms),
+            "species": ["Au"] * natoms,
+            "constraint": {},
+        }
+
+
+def permuted(structData):
+    coords = structData['parameters'].reshape(-1, 3)
+    return {**structData, "parameters": coords[::-1].flatten()}
+
+
+def write_stores(tmp_path, nstores=3, n=30):
+    """Stores of random energies, returns their paths and all entries."""
+    paths, entries = [], []
+    rng = np.random.default_rng(1)
+    for k in range(nstores):
+        path = tmp_path / f'results_{k}.db'
+        store = ResultsStore(path, buffer=4)
+        for s in random_structures(n, seed=k):
+            energy = rng.normal()
+            entries.append((store.add(s, energy), energy))
+        store.close()
+        paths.append(str(path))
+    return paths, entries
+
+
+def read_energies(path):
+    with open(path) as f:
+        return [line.split() for line in f]
+
+
+@pytest.mark.parametrize("num_to_write", [1, 10, 200])
+def test_top_k(tmp_path, num_to_write):
+    paths, entries = write_stores(tmp_path)
+    writer = StructureWriter(
+        paths,
+        outpath=tmp_path / 'structures',
+        objfile=tmp_path / 'energy.dat',
+        file_format='xyz',
+    )
+    selected = writer.write(num_to_write)
+
+    expected = sorted(entries, key=lambda e: e[1])[:num_to_write]
+    assert [(ID, energy) for ID, energy, _ in selected] == expected
+    rows = read_energies(tmp_path / 'energy.dat')
+    assert [(int(i), float(e), ID) for i, e, ID in rows] == [
+        (i, e, ID) for i, (ID, e) in enumerate(expected)
+    ]
+    files = sorted((tmp_path / 'structures').iterdir())
+    assert len(files) == len(expected)
+    assert all(f.suffix == '.xyz' for f in files)
+
+
+def test_window(tmp_path):
+    paths, entries = write_stores(tmp_path)
+    writer = StructureWriter(
+        paths,
+        outpath=tmp_path / 'structures',
+        objfile=tmp_path / 'energy.dat',
+    )
+    energies = sorted(e for _, e in entries)
+    selected = writer.write(len(entries), window=0.5)
+    assert [e for _, e, _ in selected] == [
+        e for e in energies if e <= energies[0] + 0.5
+    ]
+
+
+def test_unique(tmp_path):
+    s1, s2, s3 = random_structures(3)
+    path = tmp_path / 'results.db'
+    store = ResultsStore(path)
+    ID1 = store.add(s1, -3.0)
+    store.add(permuted(s1), -2.9)  # duplicate of s1
+    store.add(s2, -2.0)
+    ID2 = store.add(permuted(s2), -2.5)  # duplicate of s2, lower
+    ID3 = store.add(s3, -1.0)
+    store.close()
+
+    writer = StructureWriter(
+        [path, path],
+        outpath=tmp_path / 'structures',
+        objfile=tmp_path / 'energy.dat',
+        file_format='cif',
+    )
+    unique = writer.write(10, unique=True)
+    assert [(ID, e) for ID, e, _ in unique] == [
+        (ID1, -3.0),
+        (ID2, -2.5),
+        (ID3, -1.0),
+    ]
+    # the same store twice, every structure twice
+    assert len(writer.write(20)) == 10
+
+    # written structures are the stored ones
+    written = Structure.from_file(tmp_path / 'structures' / '0.cif')
+    np.testing.assert_allclose(
+        written.frac_coords, s1['parameters'].reshape(-1, 3), atol=1e-5
+    )
+
+
+def test_bad_arguments(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        StructureWriter(tmp_path / 'missing.db', outpath=tmp_path / 'out')
+    paths, _ = write_stores(tmp_path, nstores=1, n=1)
+    with pytest.raises(ValueError):
+        StructureWriter(
+            paths, outpath=tmp_path / 'out', file_format='lammps-data'
+        )